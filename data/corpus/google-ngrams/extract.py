@@ -3,6 +3,8 @@
 """
 once fetch.py has grabbed a set of ngrams, I parse out a subset and generate CSV.
 given our lists of 'x y z\tcnt', extract, parse and dump
+pass the orders fetched, e.g. ./extract.py 3 4 5; they must all be extracted in
+one run, as they share word ids
 """
 
 import os, re, sys
@@ -46,7 +48,7 @@ def tokid(key):
 	return Ids[key]
 
 # gunzip 'filename', translate string tokens into ids and gzip write to 'dst'
-def extractfile(nth, total, filename, dst, ids):
+def extractfile(nth, total, filename, dst, ids, order=3):
 	global Ids
 	start = time()
 	with os.popen('gunzip -dc ' + filename, 'r') as gunzip:
@@ -58,12 +60,11 @@ def extractfile(nth, total, filename, dst, ids):
 		# what we accept which means we can reasonably skip exception setup.
 		# turns out not setting up an exception for each of 200M lines shaves ~2/3x of our time(!)
 		# include periods and apostrophes
-		for m in re.finditer('\n([\w\']+) ([\w\']+) ([\w\']+)\t(\d+)',contents):
-			x,y,z,cnt = m.groups()
-			cnt = int(cnt)
+		for m in re.finditer('\n' + ' '.join(["([\w']+)"] * order) + '\t(\d+)',contents):
+			toks = m.groups()
+			cnt = int(toks[-1])
 			if cnt >= MinFreq:
-				gz.write('%u,%u,%u,%u\n' % \
-					(tokid(x), tokid(y), tokid(z), cnt))
+				gz.write(','.join(str(tokid(t)) for t in toks[:-1]) + ',%u\n' % cnt)
 	print '%3u/%3u %s (%.1f sec) ids:%u' % (nth, total, dst, time() - start, len(Ids))
 
 # pulls filenames out of the queue and hand parameters off
@@ -71,21 +72,23 @@ def extractfile(nth, total, filename, dst, ids):
 def worker(q, ids):
 	while True:
 		try:
-			nth,total,filename,dst = q.get(timeout=1)
-			extractfile(nth,total,filename,dst, ids)
+			nth,total,filename,dst,order = q.get(timeout=1)
+			extractfile(nth,total,filename,dst, ids, order)
 		except Queue.Empty:
 			break
 
 Q = mp.Queue()
 
 # build queue of files to process
-filenames = sorted(glob('*-2008.list.gz'))
+Orders = [int(a) for a in sys.argv[1:]] or [3]
+filenames = [(f, order) for order in Orders
+		for f in sorted(glob('*-%ugram-*-2008.list.gz' % order))]
 total = len(filenames)
-for nth,filename in enumerate(filenames):
+for nth,(filename,order) in enumerate(filenames):
 	dst = str.replace(filename,'list.gz','ids.gz')
 	if os.path.exists(dst):
 		continue
-	Q.put((nth+1,total,filename,dst))
+	Q.put((nth+1,total,filename,dst,order))
 
 if Q.qsize():
 	print 'Queued %u files.' % (Q.qsize(),)
@@ -1,8 +1,8 @@
 #!/usr/bin/env python
 
 """
-fetch Google Books' 3-ary ngrams.
-run me, then extract.py
+fetch Google Books' 3-ary ngrams, or of the orders given after --run.
+run me, then extract.py with the same orders
 enumerate, download, extract, filter and delete files
 """
 
@@ -71,9 +71,12 @@ def delete(filename):
 	except:
 		pass
 
-def urls():
-	for n in range(0, 200):
-		yield 'http://commondatastorage.googleapis.com/books/ngrams/books/googlebooks-eng-all-3gram-20090715-' + str(n) + '.csv.zip'
+# files in each order's set
+Files = {3: 200, 4: 400, 5: 800}
+
+def urls(order=3):
+	for n in range(0, Files[order]):
+		yield 'http://commondatastorage.googleapis.com/books/ngrams/books/googlebooks-eng-all-%ugram-20090715-%u.csv.zip' % (order, n)
 
 def url2filename(url):
 	return url[url.rfind('/')+1:]
@@ -84,7 +87,8 @@ def filename2gz(filename):
 if __name__ == '__main__':
 	import sys
 	if len(sys.argv) > 1 and sys.argv[1] == '--run':
-		for url in urls():
+		orders = [int(a) for a in sys.argv[2:]] or [3]
+		for url in (u for order in orders for u in urls(order)):
 			try:
 				dst = url2filename(url)
 				dstgz = filename2gz(dst)
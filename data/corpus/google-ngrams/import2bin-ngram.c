@@ -1,8 +1,9 @@
 // ex: set ts=8 noet:
 
 // Convert text-based CSV format "x,y,z,freq" to packed little-endian binary format
+// or, given n, lines of n ids and a freq, for ngram4.bin etc.
 //
-// Usage: gzip -dc *.ids.gz | ./import2bin-ngram > ngram3.bin.orig.c
+// Usage: gzip -dc *-3gram-*.ids.gz | ./import2bin-ngram [n] > ngram3.bin.orig.c
 //
 // Port from import2bin.py; it was just too slow. We're >10x faster.
 
@@ -15,6 +16,8 @@
 #include <inttypes.h>
 #include <assert.h>
 
+#define NGRAMN_MAX 5
+
 typedef struct {
 #pragma pack(push, 1)
 	uint32_t id[3],
@@ -30,17 +33,42 @@ int line2ng(const wchar_t *line, ngram3 *ng)
 		ng->id+0, ng->id+1, ng->id+2, &ng->freq) == 4;
 }
 
+// "id0,...,idn-1,freq" -> rec[n+1]
+int line2ngn(const wchar_t *line, uint32_t *rec, unsigned n)
+{
+	unsigned i;
+	for (i = 0; i <= n; i++)
+	{
+		wchar_t *end;
+		unsigned long v = wcstoul(line, &end, 10);
+		if (end == line || v > UINT32_MAX ||
+		    (i < n ? *end != L',' : *end && *end != L'\n'))
+			return 0;
+		rec[i] = v;
+		line = end + 1;
+	}
+	return 1;
+}
+
 // stdin -> [ngram3(...),...]
-int main(void)
+int main(int argc, char *argv[])
 {
 	// we're going to be writing out 100s of MB in a batch; use a large buffer
 #       define BUFLEN 32 * 1024 * 1024L
 	static wchar_t line[1024];
 	char *buf = malloc(BUFLEN);
+	unsigned n = argc > 1 ? strtoul(argv[1], NULL, 10) : 3;
+	uint32_t rec[NGRAMN_MAX + 1];
 	ngram3 ng;
 
 	assert(sizeof ng == 16 && "ensure packing");
 
+	if (n < 3 || n > NGRAMN_MAX)
+	{
+		fprintf(stderr, "Usage: %s [n], 3 <= n <= %u\n", argv[0], NGRAMN_MAX);
+		return 1;
+	}
+
 	if (!setlocale(LC_CTYPE, ""))
 	{
 		fprintf(stderr, "Can't set the specified locale! Check LANG, LC_CTYPE, LC_ALL.\n");
@@ -53,16 +81,22 @@ int main(void)
 	// parse lines from stdin, write packed binary ngram to stdout, errors to stderr
 	while (fgetws(line, sizeof line / sizeof line[0], stdin))
 	{
-		if (line2ng(line, &ng))
+		if (n == 3 && line2ng(line, &ng))
 		{
 			fwrite(&ng, sizeof ng, 1, stdout);
 		}
+		else if (n > 3 && line2ngn(line, rec, n))
+		{
+			fwrite(rec, sizeof *rec, n + 1, stdout);
+		}
 		else
 		{
 			fprintf(stderr, "invalid line '%ls'\n", line);
 		}
 	}
 
+	// buf is stdout's buffer; empty it before it goes
+	fflush(stdout);
 	free(buf);
 
 	return 0;
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+import os, re, sys, gzip
+
+"""
+compile the CMU pronouncing dictionary into word.bin.phon, so that Phon needn't
+parse all ~130,000 lines of it every time it starts; see PhonIndex in src/phon.py.
+
+each pronunciation is simplified here just as Phon.load() does it, e.g.
+	REVIEW  R IY2 V Y UW1  ->  review  r i v y u
+but every word is kept: Phon applies its frequency cutoff as it looks them up.
+
+after the sidecar header (see ngram3sidecar in ngram3bin.h; ngramsize is word.bin's,
+so a word.bin.phon left over from an older word.bin is ignored), all uint32_t:
+	[wordcnt][phoncnt][refcnt][strsize]
+	[stroff strlen id phonref phoncnt] * wordcnt	sorted bytewise by word; id is
+							word.bin's, or 0 if it isn't there
+	[stroff strlen wordref wordcnt] * phoncnt	sorted bytewise by sound
+	[phon] * refcnt		each word's sounds, in dictionary order, from phonref
+	[word] * refcnt		each sound's words, in dictionary order, from wordref
+	[utf-8 strings, padded to a multiple of 4 bytes]
+
+if ngram3.bin.totals is current it also writes word.bin.homophones, each word's
+sound-alikes as Chick.permphon() wants them: those Phon would find for it, i.e. that
+share one of its sounds and that Phon keeps (see Phon.wanted()), that are a single
+token other than the word itself, with their frequency and edit distance from it.
+after the sidecar header, likewise word.bin's, all uint32_t:
+	[wordcnt][entcnt]
+	[off] * (wordcnt + 1)		where each word id's entries start
+	[id freq dist] * entcnt		most frequent first, then by id
+
+Usage: import2bin-phon.py [cmudict.0.7a[.gz]]
+"""
+
+NGRAMWORD_MAGIC = 0x4e475744
+NGRAMPHON_MAGIC = 0x4e475048 # "NGPH"
+NGRAMPHON_VERSION = 1
+NGRAMHOMO_MAGIC = 0x4e47484f # "NGHO"
+NGRAMHOMO_VERSION = 1
+NGRAM3TOTALS_MAGIC = 0x4e473354
+# Phon.MinFreq
+PHON_MINFREQ = 500
+# gram.TokRgxNL
+TOKRGX = re.compile(r'\d+(?:[^\w\s]+\d+)*|\w+|\.|\n', re.UNICODE)
+
+from struct import pack,unpack_from,calcsize
+from array import array
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../../src'))
+from distance import damerau_levenshtein
+
+def word2id(path):
+	"""
+	{word: id} from word.bin's lookup section
+	"""
+	with open(path, 'rb') as f:
+		wb = f.read()
+	wordsize, cnt, magic, version = unpack_from('<QIII', wb, len(wb) - calcsize('<QIII'))
+	if magic != NGRAMWORD_MAGIC:
+		sys.exit('%s has no lookup section; rebuild it with import2bin-word.py' % path)
+	off = array('I', wb[wordsize:wordsize + cnt * 4])
+	ids, words = {}, []
+	for wid, o in enumerate(off):
+		wlen, = unpack_from('<I', wb, o)
+		words.append(wb[o + 4:o + 4 + wlen])
+		# the first of any words spelled the same, as ngram3bin-compact's word.bin.trie does
+		ids.setdefault(words[-1], wid)
+	return ids, words, len(wb)
+
+def totals(path, wordcnt):
+	"""
+	each word id's frequency from path, ngram3.bin.totals, or None if it's missing or
+	was built from some other ngram3.bin or word.bin
+	"""
+	if not os.path.exists(path):
+		return None
+	with open(path, 'rb') as f:
+		tb = f.read()
+	magic, version, ngramsize, cnt, _ = unpack_from('<IIQII', tb)
+	if magic != NGRAM3TOTALS_MAGIC or ngramsize != os.path.getsize('ngram3.bin') or cnt != wordcnt:
+		return None
+	start = calcsize('<IIQII')
+	return array('I', tb[start:start + cnt * 4])
+
+def homophones(words, phons, ids, wordids, freq):
+	"""
+	word.bin.homophones' entries for each word id
+	"""
+	def wanted(w):
+		return b"'" in w or (w in ids and freq[ids[w]] >= PHON_MINFREQ)
+	byword = {}
+	for w in set(wordids):
+		if w not in words or not wanted(w):
+			continue
+		word, hs = w.decode('utf8'), {}
+		for p in words[w]:
+			for h in phons[p]:
+				toks = TOKRGX.findall(h.decode('utf8').lower())
+				if len(toks) != 1 or toks[0] == word or not wanted(h):
+					continue
+				t = toks[0].encode('utf8')
+				if t in ids and t not in hs:
+					hs[t] = (ids[t], freq[ids[t]], damerau_levenshtein(word, toks[0]))
+		byword[w] = sorted(hs.values(), key=lambda e: (-e[1], e[0]))
+	return [byword.get(w, []) for w in wordids]
+
+def pronunciations(path):
+	"""
+	(word, simplified sound) for each line of the dictionary
+	"""
+	f = gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+	with f:
+		for line in f:
+			if line.startswith(b';;;'):
+				continue
+			line = line.decode('utf8').strip().lower()
+			word, phon = line.split('  ')
+			phon = re.sub('(\S)(\S+)', r'\1', phon)
+			# now merge leading vowels except 'o' and 'u'
+			if len(phon) > 1:
+				phon = re.sub('^[aei]', '*', phon)
+			yield word, phon
+
+if __name__ == '__main__':
+	dictpath = sys.argv[1] if len(sys.argv) > 1 else '../../cmudict/cmudict.0.7a.gz'
+	if not os.path.exists(dictpath) and os.path.exists(dictpath + '.gz'):
+		dictpath += '.gz'
+	ids, wordids, wordbinsize = word2id('word.bin')
+
+	words, phons = {}, {}	# each -> [the other's, ...] in dictionary order
+	for word, phon in pronunciations(dictpath):
+		words.setdefault(word.encode('utf8'), []).append(phon.encode('utf8'))
+		phons.setdefault(phon.encode('utf8'), []).append(word.encode('utf8'))
+	wordorder = sorted(words)
+	phonorder = sorted(phons)
+	wordidx = dict((w, i) for i, w in enumerate(wordorder))
+	phonidx = dict((p, i) for i, p in enumerate(phonorder))
+
+	strings = bytearray()
+	stroff = {}
+	def intern(s):
+		if s not in stroff:
+			stroff[s] = len(strings)
+			strings.extend(s)
+		return stroff[s]
+
+	wordtab, phontab = array('I'), array('I')
+	wordphon, phonword = array('I'), array('I')
+	for w in wordorder:
+		wordtab.extend((intern(w), len(w), ids.get(w, 0), len(wordphon), len(words[w])))
+		wordphon.extend(phonidx[p] for p in words[w])
+	for p in phonorder:
+		phontab.extend((intern(p), len(p), len(phonword), len(phons[p])))
+		phonword.extend(wordidx[w] for w in phons[p])
+	strings.extend(b'\0' * (-len(strings) % 4))
+
+	with open('word.bin.phon', 'wb') as bin:
+		bin.write(pack('<IIQ', NGRAMPHON_MAGIC, NGRAMPHON_VERSION, wordbinsize))
+		bin.write(pack('<IIII', len(wordorder), len(phonorder), len(wordphon), len(strings)))
+		for a in (wordtab, phontab, wordphon, phonword):
+			bin.write(a.tobytes())
+		bin.write(strings)
+	print('%u words, %u sounds, %u known to word.bin' % (
+		len(wordorder), len(phonorder), sum(1 for w in wordorder if ids.get(w))))
+
+	freq = totals('ngram3.bin.totals', len(wordids))
+	if freq is None:
+		print('no current ngram3.bin.totals, skipping word.bin.homophones; run ngram3bin-compact first')
+		sys.exit(0)
+	homo = homophones(words, phons, ids, wordids, freq)
+	off, ent = array('I', [0]), array('I')
+	for hs in homo:
+		for e in hs:
+			ent.extend(e)
+		off.append(len(ent) // 3)
+	with open('word.bin.homophones', 'wb') as bin:
+		bin.write(pack('<IIQ', NGRAMHOMO_MAGIC, NGRAMHOMO_VERSION, wordbinsize))
+		bin.write(pack('<II', len(wordids), len(ent) // 3))
+		bin.write(off.tobytes())
+		bin.write(ent.tobytes())
+	print('%u homophones for %u words' % (len(ent) // 3, sum(1 for hs in homo if hs)))
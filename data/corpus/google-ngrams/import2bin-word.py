@@ -9,16 +9,31 @@ extract.py generated:
 
 we take word.csv.gz, which is already in sorted order by id ascending,
 and compact the words into binary format and write to word.bin
+
+after the words we append a lookup section (see ngramwordtrailer in ngram3bin.h)
+so ngram3bin can resolve word -> id straight from the mmap'd file:
+	[uint32_t off] * cnt	offset of each id's entry
+	[uint32_t id] * cnt	ids sorted bytewise by word
+	[uint64_t wordsize][uint32_t cnt][uint32_t magic][uint32_t version]
 """
 
+NGRAMWORD_MAGIC = 0x4e475744
+NGRAMWORD_VERSION = 1
+
 from struct import pack,unpack
+from array import array
 with os.popen('gzip -dc word.csv.gz', 'r') as gz:
 	with open('word.bin', 'wb') as bin:
+		off = array('I')
+		words = []
+		wordsize = 0
 		for line in gz:
 			wid,word = line.rstrip().split(',', 1)
 			wid = int(wid)
 			bword = bytes(word, 'utf-8')
 			wlen = len(bword)
+			off.append(wordsize)
+			words.append(bword)
 			# pad bword with enough \0 to make next string start with alignment=4
 			bword += b'\0' * (1 + ((len(bword)+1) % 4))
 			"""
@@ -27,5 +42,12 @@ with os.popen('gzip -dc word.csv.gz', 'r') as gz:
 			which improves read performance
 			"""
 			bin.write(pack('<i', wlen) + bword)
-
-
+			wordsize += 4 + len(bword)
+		# lookup section
+		pad = -wordsize % 4
+		bin.write(b'\0' * pad)
+		wordsize += pad
+		sortedids = array('I', sorted(range(len(words)), key=words.__getitem__))
+		bin.write(off.tobytes())
+		bin.write(sortedids.tobytes())
+		bin.write(pack('<QIII', wordsize, len(words), NGRAMWORD_MAGIC, NGRAMWORD_VERSION))
@@ -0,0 +1,273 @@
+/* ex: set ts=8 noet: */
+/*
+ * Copyright 2011 Ryan Flynn <parseerror+github@gmail.com>
+ *
+ * time lookups against word.bin, ngram3.bin and its sidecars
+ *
+ * Usage: ./ngram3bin-bench [samples [ngram3.bin]]
+ *
+ * lookups are for ngram3s sampled from ngram3.bin itself, so every one is a hit;
+ * each is run with and without the help of the relevant sidecar, if it exists.
+ * run it on ngram3.blk and ngram3.q as well to compare the other formats.
+ * if ngram4.bin or ngram5.bin are here, their ngrams are looked up in them and
+ * the old way, as the sum of their overlapping ngram3s
+ */
+
+#include <stdlib.h>
+#include <stdio.h>
+#include <time.h>
+#include <unistd.h>
+#include "ngram3bin.h"
+
+static double now(void)
+{
+	struct timespec ts;
+	clock_gettime(CLOCK_MONOTONIC, &ts);
+	return ts.tv_sec + ts.tv_nsec / 1e9;
+}
+
+static void report(const char *what, unsigned long calls, double elapsed, unsigned long long results)
+{
+	printf("%-24s %8lu calls %10.2f usec/call %10.1f results/call\n",
+		what, calls, elapsed * 1e6 / (calls ? calls : 1),
+		(double)results / (calls ? calls : 1));
+}
+
+static void bench_like(const ngram3 *sample, unsigned long cnt, const struct ngram3map *m,
+		       ngram3bin_index *idx, const ngram3bin_perm *perm, const char *what)
+{
+	unsigned long long results = 0;
+	unsigned long i;
+	double start = now();
+	for (i = 0; i < cnt; i++)
+	{
+		ngram3 *res = ngram3bin_like_better(sample[i], m, idx, perm);
+		if (res)
+		{
+			const ngram3 *c = res;
+			while (c->freq)
+				c++;
+			results += c - res;
+			free(res);
+		}
+	}
+	report(what, cnt, now() - start, results);
+}
+
+/*
+ * lookups that mostly miss, as most of ours do, with and without the filter
+ */
+static void bench_freq_miss(const ngram3 *sample, unsigned long cnt, const struct ngram3map *m,
+			    const struct ngram3map *bloom, const char *what)
+{
+	ngram3bloom_stats stats = { 0, 0, 0 };
+	unsigned long long results = 0;
+	unsigned long i;
+	double start = now();
+	for (i = 0; i < cnt; i++)
+	{
+		ngram3 miss = sample[i];
+		miss.id[2] = sample[(i + 1) % cnt].id[2];
+		results += !!ngram3bin_freq_bloom(miss, m, bloom, &stats);
+	}
+	report(what, cnt, now() - start, results);
+	if (bloom)
+		printf("%-24s %8lu rejected %8lu passed %8lu false positives\n",
+			"", stats.rejected, stats.passed, stats.falsepos);
+}
+
+static void bench_freq2(const ngram3 *sample, unsigned long cnt, const struct ngram3map *m,
+			const struct ngram3map *bigram, const char *what)
+{
+	unsigned long long results = 0;
+	unsigned long i;
+	double start = now();
+	for (i = 0; i < cnt; i++)
+		results += !!(bigram ? ngram2bin_freq(sample[i], bigram) : ngram3bin_freq2(sample[i], m));
+	report(what, cnt, now() - start, results);
+}
+
+/*
+ * follows() and precedes() of each sample's x, by full scan or from the sidecar adj
+ */
+static void bench_adjacent(const ngram3 *sample, unsigned long cnt, const struct ngram3map *m,
+			   const struct ngram3map *adj, int dir, const char *what)
+{
+	unsigned long long results = 0;
+	unsigned long i;
+	double start = now();
+	for (i = 0; i < cnt; i++)
+	{
+		ngram3 *res = adj ? ngram3adj_get(sample + i, adj)
+			    : dir > 0 ? ngram3bin_follows(sample + i, m)
+				      : ngram3bin_precedes(sample + i, m);
+		if (res)
+		{
+			const ngram3 *c = res;
+			while (c->freq)
+				c++;
+			results += c - res;
+			free(res);
+		}
+	}
+	report(what, cnt, now() - start, results);
+}
+
+/*
+ * ngrams sampled from ngramN.bin, looked up there and then as the ngram3s they overlap
+ */
+static void bench_freqn(unsigned n, unsigned long cnt, const struct ngram3map *m3)
+{
+	char path[32], what[32];
+	struct ngram3map m;
+	unsigned long long results = 0, nmemb;
+	unsigned long i, j;
+	ngramn *sample;
+	double start;
+
+	snprintf(path, sizeof path, "ngram%u.bin", n);
+	if (access(path, R_OK))
+		return;
+	m = ngram3bin_init(path, 0);
+	nmemb = m.m ? ngramn_cnt(&m, n) : 0;
+	if (!nmemb || !(sample = malloc(cnt * sizeof *sample)))
+	{
+		ngram3bin_fini(m);
+		return;
+	}
+	for (i = 0; i < cnt; i++)
+	{
+		const uint32_t *rec = (const uint32_t *)((char *)m.m + ((unsigned long)rand() % nmemb) * ngramn_recsize(n));
+		for (j = 0; j < n; j++)
+			sample[i].id[j] = rec[j];
+		sample[i].n = n;
+	}
+	printf("%s: %llu ngram%us\n", path, nmemb, n);
+
+	start = now();
+	for (i = 0; i < cnt; i++)
+		results += !!ngramnbin_freq(sample + i, &m);
+	snprintf(what, sizeof what, "freq%u", n);
+	report(what, cnt, now() - start, results);
+
+	results = 0;
+	start = now();
+	for (i = 0; i < cnt; i++)
+	{
+		unsigned long sum = 0;
+		for (j = 0; j + 3 <= n; j++)
+		{
+			ngram3 find = { { sample[i].id[j], sample[i].id[j+1], sample[i].id[j+2] }, 0 };
+			sum += ngram3bin_freq(find, m3);
+		}
+		results += !!sum;
+	}
+	snprintf(what, sizeof what, "freq%u as ngram3s", n);
+	report(what, cnt, now() - start, results);
+
+	free(sample);
+	ngram3bin_fini(m);
+}
+
+static void bench_freq(const ngram3 *sample, unsigned long cnt, const struct ngram3map *m)
+{
+	unsigned long long results = 0;
+	unsigned long i, *freq = malloc(cnt * sizeof *freq);
+	double start = now();
+	for (i = 0; i < cnt; i++)
+		results += !!ngram3bin_freq(sample[i], m);
+	report("freq", cnt, now() - start, results);
+	results = 0;
+	start = now();
+	ngram3bin_freq_many(sample, freq, cnt, m, NULL, NULL, NULL);
+	for (i = 0; i < cnt; i++)
+		results += !!freq[i];
+	report("freq_many", cnt, now() - start, results);
+	free(freq);
+}
+
+int main(int argc, char *argv[])
+{
+	const char *ngrampath = argc > 2 ? argv[2] : "ngram3.bin";
+	unsigned long i, cnt = argc > 1 ? strtoul(argv[1], NULL, 10) : 1000;
+	struct ngram3map mw = ngram3bin_init("word.bin", 0);
+	struct ngram3map mb = ngram3bin_init(ngrampath, 0);
+	struct ngram3map bigram, bloom, follows, precedes;
+	struct ngramword w;
+	ngram3bin_index idx, tidx;
+	ngram3bin_perm perm;
+	ngram3cursor c;
+	double start;
+	unsigned long nmemb;
+	ngram3 *sample;
+
+	if (!mw.m || !mb.m)
+	{
+		fprintf(stderr, "can't map word.bin and %s\n", ngrampath);
+		return 1;
+	}
+	w = ngramword_load(mw);
+
+	// what every ngram3bin() open pays, with and without ngram3.bin.totals
+	start = now();
+	ngramword_totalfreqs(w, &mb);
+	ngram3bin_index_init(&idx, &mb, &w);
+	report("totalfreqs+index_init", 1, now() - start, 0);
+	start = now();
+	if (ngram3bin_totals_init(&tidx, w, ngrampath, &mb))
+	{
+		report("totals_init", 1, now() - start, 0);
+		ngram3bin_index_fini(&tidx);
+	}
+
+	ngram3bin_perm_init(&perm, ngrampath, &mb);
+	bigram = ngram3sidecar_init(ngrampath, NGRAM2BIN_SUFFIX, NGRAM2BIN_MAGIC, NGRAM2BIN_VERSION, &mb);
+	bloom = ngram3bloom_init(ngrampath, &mb);
+	follows = ngram3adj_init(ngrampath, NGRAM3FOLLOWS_SUFFIX, &mb);
+	precedes = ngram3adj_init(ngrampath, NGRAM3PRECEDES_SUFFIX, &mb);
+
+	nmemb = ngram3bin_cnt(&mb);
+	sample = malloc(cnt * sizeof *sample);
+	srand(1);
+	for (i = 0; i < cnt; i++)
+	{
+		ngram3cursor_seek(&c, &mb, (unsigned long)rand() % nmemb);
+		sample[i] = *c.rec;
+	}
+	printf("map %llu bytes (%lu ngram3s, %s), %lu samples\n", mb.size, nmemb,
+		ngram3blk_hdr(&mb) ? "block-encoded" : ngram3q_hdr(&mb) ? "quantized" : "raw", cnt);
+
+	bench_freq(sample, cnt, &mb);
+	bench_freq_miss(sample, cnt, &mb, NULL, "freq miss");
+	if (bloom.m)
+		bench_freq_miss(sample, cnt, &mb, &bloom, "freq miss+bloom");
+	bench_like(sample, cnt, &mb, &idx, NULL, "like_better");
+	if (perm.yzx.m || perm.xzy.m)
+		bench_like(sample, cnt, &mb, &idx, &perm, "like_better+perm");
+
+	// the full scan is far slower than everything else; keep it to a handful
+	bench_freq2(sample, cnt < 10 ? cnt : 10, &mb, NULL, "freq2");
+	if (bigram.m)
+		bench_freq2(sample, cnt, &mb, &bigram, "freq2+bigram");
+	for (i = 4; i <= NGRAMN_MAX; i++)
+		bench_freqn(i, cnt, &mb);
+
+	bench_adjacent(sample, cnt < 10 ? cnt : 10, &mb, NULL, 1, "follows");
+	if (follows.m)
+		bench_adjacent(sample, cnt, &mb, &follows, 1, "follows+sidecar");
+	bench_adjacent(sample, cnt < 10 ? cnt : 10, &mb, NULL, -1, "precedes");
+	if (precedes.m)
+		bench_adjacent(sample, cnt, &mb, &precedes, -1, "precedes+sidecar");
+
+	free(sample);
+	ngram3bin_fini(bigram);
+	ngram3bin_fini(bloom);
+	ngram3bin_fini(follows);
+	ngram3bin_fini(precedes);
+	ngram3bin_perm_fini(&perm);
+	ngram3bin_index_fini(&idx);
+	ngramword_fini(w);
+	ngram3bin_fini(mw);
+	ngram3bin_fini(mb);
+	return 0;
+}
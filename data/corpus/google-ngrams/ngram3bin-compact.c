@@ -5,6 +5,26 @@
  * google's data has duplicate ngrams(!)
  * sort our ngram.bin file's entries, then merge/sum
  *
+ * then pre-calculate sidecar tables from the result:
+ *   ngram3.bin.bigram	(x,y) -> freq of (x,y,_) + (_,x,y)
+ *   ngram3.bin.yzx	record offsets sorted by (y,z,x)
+ *   ngram3.bin.xzy	record offsets sorted by (x,z,y)
+ *   ngram3.bin.totals	per-word frequency totals and the (x,_,_) span index
+ *   ngram3.bin.bloom	bloom filter of every (x,y,z)
+ *   ngram3.bin.follows	each word's most frequent successors
+ *   ngram3.bin.precedes	...and predecessors
+ *   ngram3.bin.splits	each word's splits into two or three frequent words
+ *
+ * and from word.bin:
+ *   word.bin.deletes	deletion index of the vocabulary, for finding words a few edits away
+ *   word.bin.trie	trie of the vocabulary, for the same
+ *
+ * ngram4.bin and ngram5.bin, if present, are sorted and merged the same way into
+ * ngram4.bin.sort and ngram5.bin.sort
+ *
+ * Usage: ./ngram3bin-compact [bloom false-positive rate, default 0.01 [follows/precedes per word, default 64
+ *                             [characters of each word in the deletion index, default 7
+ *                             [least frequency of each part of a split, default 500]]]]
  */
 
 #include <stdlib.h>
@@ -16,51 +36,66 @@
 #include <string.h>
 #include <limits.h>
 #include <arpa/inet.h>
+#include <math.h>
 #include "ngram3bin.h"
 
-static void sortfile(const struct ngram3map *m)
+/*
+ * qsort() has no context parameter, so ngramn_cmp() finds the order here
+ */
+static unsigned SortN;
+
+static int ngramn_cmp(const void *a, const void *b)
+{
+	return ngramncmp(a, b, SortN);
+}
+
+static void sortfile(const struct ngram3map *m, unsigned n)
 {
-	size_t nmemb = m->size / sizeof(ngram3);
+	size_t nmemb = ngramn_cnt(m, n);
+	int (*cmp)(const void *, const void *) = n == 3 ? ngram3cmp : ngramn_cmp;
+	SortN = n;
 	printf("%s:%u qsort(%p, %zu, %zu, %p);\n",
-		__func__, __LINE__, (void*)m->m, nmemb, sizeof(ngram3), (void*)ngram3cmp);
-	qsort(m->m, nmemb, sizeof(ngram3), ngram3cmp);
+		__func__, __LINE__, (void*)m->m, nmemb, ngramn_recsize(n), (void*)cmp);
+	qsort(m->m, nmemb, ngramn_recsize(n), cmp);
 }
 
 /*
- * ngram3map.m is a big mmap array of ngram3
+ * ngram3map.m is a big mmap array of n-id records
  * it's been sorted, we want to merge consecutive identical ids into a single one, summing the freq field
  */
-static void mergefile(const struct ngram3map *m)
+static void mergefile(const struct ngram3map *m, unsigned n, const char *dst)
 {
+	const size_t recsize = ngramn_recsize(n);
 	char *buf = malloc(1024 * 1024);
-	ngram3 *rd = ngram3map_start(m);
-	const ngram3 *end = ngram3map_end(m);
+	const char *rd = m->m;
+	const char *end = rd + m->size;
 	unsigned long uniqcnt = 1;
-	FILE *f = fopen("ngram3.bin.sort", "w");
-	ngram3 wr = *rd;
+	FILE *f = fopen(dst, "w");
+	uint32_t wr[NGRAMN_MAX + 1];
 	perror("fopen");
-	rd++;
+	memcpy(wr, rd, recsize);
+	rd += recsize;
 	setvbuf(f, buf, _IOFBF, 1024 * 1024);
 	perror("setvbuf");
 	while (rd < end)
 	{
-		if (rd->id[0] == wr.id[0] &&
-		    rd->id[1] == wr.id[1] &&
-		    rd->id[2] == wr.id[2])
+		const uint32_t *r = (const uint32_t *)rd;
+		if (!ngramncmp(r, wr, n))
 		{
-			wr.freq += rd->freq;
+			wr[n] += r[n];
 		}
 		else
 		{
-			fwrite(&wr, sizeof wr, 1, f);
-			wr = *rd;
+			fwrite(wr, recsize, 1, f);
+			memcpy(wr, r, recsize);
 			uniqcnt++;
 		}
-		rd++;
+		rd += recsize;
 	}
+	fwrite(wr, recsize, 1, f);
 	printf("%s:%u\n", __func__, __LINE__);
 
-	printf("merged into %lu ngram3s...\n", uniqcnt);
+	printf("merged into %lu ngram%us...\n", uniqcnt, n);
 	printf("saving...\n");
 
 	fclose(f);
@@ -68,17 +103,932 @@ static void mergefile(const struct ngram3map *m)
 	free(buf);
 }
 
-int main(void)
+/*
+ * emit the next (x,y) of the bigram table, merging two sorted sources:
+ * the sums of (x,y,_), which we read straight off the sorted ngram3s, and
+ * the sums of (_,x,y), which we had to sort ourselves
+ */
+static void bigram_put(FILE *f, ngram2 *wr, int *pending, const ngram2 *rd, unsigned long *cnt)
+{
+	if (*pending && !ngram2cmp(wr, rd))
+	{
+		wr->freq += rd->freq;
+	}
+	else
+	{
+		if (*pending)
+		{
+			fwrite(wr, sizeof *wr, 1, f);
+			(*cnt)++;
+		}
+		*wr = *rd;
+		*pending = 1;
+	}
+}
+
+/*
+ * build ngram3.bin.bigram from the sorted, merged ngram3s in path
+ * the sum for (x,y) must match ngram3bin_freq2() exactly; note that it counts a
+ * single (x,x,x) only once, not as both (x,y,_) and (_,x,y)
+ */
+static void bigramfile(const char *path)
+{
+	const char *tmppath = "ngram3.bin" NGRAM2BIN_SUFFIX ".tmp";
+	struct ngram3map m = ngram3bin_init(path, 0);
+	const ngram3 *rd = ngram3map_start(&m);
+	const ngram3 *end = ngram3map_end(&m);
+	struct ngram3map yz;
+	const ngram2 *yzrd, *yzend;
+	ngram2 wr, xy;
+	int pending = 0;
+	unsigned long cnt = 0;
+	FILE *f;
+
+	if (!m.m)
+		return;
+
+	// collect every (_,y,z) as (y,z)...
+	f = fopen(tmppath, "w");
+	while (rd < end)
+	{
+		if (!(rd->id[0] == rd->id[1] && rd->id[1] == rd->id[2]))
+		{
+			ngram2 p = { { rd->id[1], rd->id[2] }, rd->freq };
+			fwrite(&p, sizeof p, 1, f);
+		}
+		rd++;
+	}
+	fclose(f);
+
+	// ...and sort them
+	yz = ngram3bin_init(tmppath, 1);
+	qsort(yz.m, yz.size / sizeof(ngram2), sizeof(ngram2), ngram2cmp);
+	yzrd = yz.m;
+	yzend = (ngram2 *)((char *)yz.m + yz.size);
+
+	f = fopen("ngram3.bin" NGRAM2BIN_SUFFIX, "w");
+	ngram3sidecar_write(f, NGRAM2BIN_MAGIC, NGRAM2BIN_VERSION, &m);
+	rd = ngram3map_start(&m);
+	while (rd < end || yzrd < yzend)
+	{
+		if (rd < end)
+		{
+			xy.id[0] = rd->id[0];
+			xy.id[1] = rd->id[1];
+			xy.freq = rd->freq;
+		}
+		if (rd < end && (yzrd == yzend || ngram2cmp(&xy, yzrd) <= 0))
+		{
+			bigram_put(f, &wr, &pending, &xy, &cnt);
+			rd++;
+		}
+		else
+		{
+			bigram_put(f, &wr, &pending, yzrd, &cnt);
+			yzrd++;
+		}
+	}
+	if (pending)
+	{
+		fwrite(&wr, sizeof wr, 1, f);
+		cnt++;
+	}
+	fclose(f);
+	printf("%lu bigrams...\n", cnt);
+
+	ngram3bin_fini(yz);
+	unlink(tmppath);
+	ngram3bin_fini(m);
+}
+
+/*
+ * qsort() has no context parameter, so the perm comparators find the records here
+ */
+static const ngram3 *PermBase;
+
+static int permcmp_yzx(const void *va, const void *vb)
+{
+	const ngram3 *a = PermBase + *(const uint32_t *)va,
+		     *b = PermBase + *(const uint32_t *)vb;
+	if (a->id[1] != b->id[1]) return (int)(a->id[1] - b->id[1]);
+	if (a->id[2] != b->id[2]) return (int)(a->id[2] - b->id[2]);
+	if (a->id[0] != b->id[0]) return (int)(a->id[0] - b->id[0]);
+	return 0;
+}
+
+static int permcmp_xzy(const void *va, const void *vb)
+{
+	const ngram3 *a = PermBase + *(const uint32_t *)va,
+		     *b = PermBase + *(const uint32_t *)vb;
+	if (a->id[0] != b->id[0]) return (int)(a->id[0] - b->id[0]);
+	if (a->id[2] != b->id[2]) return (int)(a->id[2] - b->id[2]);
+	if (a->id[1] != b->id[1]) return (int)(a->id[1] - b->id[1]);
+	return 0;
+}
+
+/*
+ * build ngram3.bin+suffix: the offsets of path's records, sorted by cmp
+ */
+static void permfile(const char *path, const char *suffix, int (*cmp)(const void *, const void *))
+{
+	struct ngram3map m = ngram3bin_init(path, 0);
+	size_t i, nmemb = m.size / sizeof(ngram3);
+	uint32_t *perm;
+	char dst[64];
+	FILE *f;
+
+	if (!m.m)
+		return;
+	if (!(perm = malloc(nmemb * sizeof *perm)))
+	{
+		perror("malloc");
+		ngram3bin_fini(m);
+		return;
+	}
+	for (i = 0; i < nmemb; i++)
+		perm[i] = i;
+	PermBase = m.m;
+	qsort(perm, nmemb, sizeof *perm, cmp);
+
+	snprintf(dst, sizeof dst, "ngram3.bin%s", suffix);
+	f = fopen(dst, "w");
+	ngram3sidecar_write(f, NGRAM3PERM_MAGIC, NGRAM3PERM_VERSION, &m);
+	fwrite(perm, sizeof *perm, nmemb, f);
+	fclose(f);
+
+	free(perm);
+	ngram3bin_fini(m);
+}
+
+/*
+ * build ngram3.bin.totals from path and word.bin
+ */
+static void totalsfile(const char *path)
+{
+	struct ngram3map m = ngram3bin_init(path, 0);
+	struct ngram3map mw = ngram3bin_init("word.bin", 0);
+	struct ngramword w;
+	ngram3bin_index idx;
+	FILE *f;
+
+	if (!m.m || !mw.m)
+	{
+		fprintf(stderr, "%s: need %s and word.bin\n", __func__, path);
+		ngram3bin_fini(m);
+		ngram3bin_fini(mw);
+		return;
+	}
+	w = ngramword_load(mw);
+	ngramword_totalfreqs(w, &m);
+	if (ngram3bin_index_init(&idx, &m, &w))
+	{
+		f = fopen("ngram3.bin" NGRAM3TOTALS_SUFFIX, "w");
+		if (!ngram3bin_totals_write(f, w, &idx, &m))
+			perror("fwrite");
+		fclose(f);
+		ngram3bin_index_fini(&idx);
+	}
+	ngramword_fini(w);
+	ngram3bin_fini(mw);
+	ngram3bin_fini(m);
+}
+
+/*
+ * build ngram3.bin.bloom from path, sized for false-positive rate fprate
+ */
+static void bloomfile(const char *path, double fprate)
+{
+	struct ngram3map m = ngram3bin_init(path, 0);
+	const ngram3 *rd = ngram3map_start(&m);
+	const ngram3 *end = ngram3map_end(&m);
+	const unsigned long long nmemb = m.size / sizeof(ngram3);
+	// the optimal bits per element and bits set per element for fprate;
+	// blocking costs a little accuracy, which we don't bother making up
+	const double bits = -log(fprate) / (M_LN2 * M_LN2);
+	ngram3bloom hdr;
+	uint64_t *filter;
+	FILE *f;
+
+	if (!m.m)
+		return;
+	memset(&hdr, 0, sizeof hdr);
+	hdr.blockcnt = (uint64_t)ceil(nmemb * bits / 512);
+	if (!hdr.blockcnt)
+		hdr.blockcnt = 1;
+	hdr.k = (uint32_t)(bits * M_LN2 + 0.5);
+	if (hdr.k < 1)
+		hdr.k = 1;
+	if (hdr.k > NGRAM3BLOOM_KMAX)
+		hdr.k = NGRAM3BLOOM_KMAX;
+	if (!(filter = calloc(hdr.blockcnt * 8, sizeof *filter)))
+	{
+		perror("calloc");
+		ngram3bin_fini(m);
+		return;
+	}
+	while (rd < end)
+		ngram3bloom_add(filter, hdr.blockcnt, hdr.k, rd++);
+	printf("%llu bytes, k=%u for p=%g...\n",
+		(unsigned long long)hdr.blockcnt * 64, hdr.k, fprate);
+
+	f = fopen("ngram3.bin" NGRAM3BLOOM_SUFFIX, "w");
+	if (!ngram3sidecar_write(f, NGRAM3BLOOM_MAGIC, NGRAM3BLOOM_VERSION, &m) ||
+	    fwrite(&hdr, sizeof hdr, 1, f) != 1 ||
+	    fwrite(filter, sizeof *filter, hdr.blockcnt * 8, f) != hdr.blockcnt * 8)
+		perror("fwrite");
+	fclose(f);
+
+	free(filter);
+	ngram3bin_fini(m);
+}
+
+/*
+ * emit the pair (a,b) for adjfile(), counting runs of the same pair as one
+ */
+static void adjpair_put(FILE *f, ngram2 *pending, uint32_t a, uint32_t b)
+{
+	if (pending->freq && pending->id[0] == a && pending->id[1] == b)
+	{
+		pending->freq++;
+	}
+	else
+	{
+		if (pending->freq)
+			fwrite(pending, sizeof *pending, 1, f);
+		pending->id[0] = a;
+		pending->id[1] = b;
+		pending->freq = 1;
+	}
+}
+
+/*
+ * write the sorted, merged entries for word w, the topn most frequent of them
+ */
+static uint64_t adjword_put(FILE *f, ngram3adjent *ent, unsigned long cnt, uint32_t topn)
+{
+	qsort(ent, cnt, sizeof *ent, ngram3adjent_cmp);
+	if (cnt > topn)
+		cnt = topn;
+	fwrite(ent, sizeof *ent, cnt, f);
+	return cnt;
+}
+
+/*
+ * build ngram3.bin+suffix from path: each word's topn neighbours in direction
+ * dir, counted exactly as ngram3bin_follows() (dir=1) or ngram3bin_precedes()
+ * (dir=-1) count them. the (w,a) pairs those count are collected, sorted and
+ * counted like the (_,y,z) of the bigram table
+ */
+static void adjfile(const char *path, const char *suffix, int dir, uint32_t topn)
+{
+	const char *tmppath = "ngram3.bin.adj.tmp";
+	const int first = dir > 0 ? 0 : 2;
+	struct ngram3map m = ngram3bin_init(path, 0);
+	const ngram3 *rd = ngram3map_start(&m);
+	const ngram3 *end = ngram3map_end(&m);
+	struct ngram3map pm;
+	const ngram2 *prd, *pend;
+	ngram2 outer = { { 0, 0 }, 0 },
+	       inner = { { 0, 0 }, 0 };
+	ngram3adj hdr = { 0, topn };
+	ngram3adjent *ent = NULL;
+	unsigned long entcnt = 0, entmax = 0;
+	uint64_t *off;
+	uint32_t w;
+	char dst[64];
+	FILE *f;
+
+	if (!m.m)
+		return;
+
+	// collect every (w,a) counted, with a next to w in direction dir...
+	f = fopen(tmppath, "w");
+	for (; rd < end; rd++)
+	{
+		uint32_t i;
+		for (i = 0; i < 3; i++)
+			if (rd->id[i] >= hdr.wordcnt)
+				hdr.wordcnt = rd->id[i] + 1;
+		adjpair_put(f, &outer, rd->id[first], rd->id[1]);
+		if (rd->id[first] != rd->id[1])
+			adjpair_put(f, &inner, rd->id[1], rd->id[1 + dir]);
+	}
+	if (outer.freq)
+		fwrite(&outer, sizeof outer, 1, f);
+	if (inner.freq)
+		fwrite(&inner, sizeof inner, 1, f);
+	fclose(f);
+
+	// ...and sort them
+	pm = ngram3bin_init(tmppath, 1);
+	if (pm.m)
+		qsort(pm.m, pm.size / sizeof(ngram2), sizeof(ngram2), ngram2cmp);
+	prd = pm.m;
+	pend = (ngram2 *)((char *)pm.m + pm.size);
+
+	if (!(off = calloc(hdr.wordcnt + 1, sizeof *off)))
+	{
+		perror("calloc");
+		ngram3bin_fini(pm);
+		unlink(tmppath);
+		ngram3bin_fini(m);
+		return;
+	}
+	snprintf(dst, sizeof dst, "ngram3.bin%s", suffix);
+	f = fopen(dst, "w");
+	// off is filled in as we go and written over its placeholder at the end
+	ngram3sidecar_write(f, NGRAM3ADJ_MAGIC, NGRAM3ADJ_VERSION, &m);
+	fwrite(&hdr, sizeof hdr, 1, f);
+	fwrite(off, sizeof *off, hdr.wordcnt + 1, f);
+	for (w = 0; w < hdr.wordcnt; w++)
+	{
+		// merge w's pairs into one entry per neighbour
+		entcnt = 0;
+		for (; prd < pend && prd->id[0] == w; prd++)
+		{
+			if (entcnt && ent[entcnt - 1].id == prd->id[1])
+			{
+				ent[entcnt - 1].freq += prd->freq;
+				continue;
+			}
+			if (entcnt == entmax)
+			{
+				unsigned long newmax = entmax ? entmax * 2 : 1024;
+				ngram3adjent *tmp = realloc(ent, newmax * sizeof *ent);
+				if (!tmp)
+				{
+					// w loses the rest of its neighbours, no one else does
+					perror("realloc");
+					continue;
+				}
+				ent = tmp;
+				entmax = newmax;
+			}
+			ent[entcnt].id = prd->id[1];
+			ent[entcnt].freq = prd->freq;
+			entcnt++;
+		}
+		off[w + 1] = off[w] + adjword_put(f, ent, entcnt, topn);
+	}
+	if (fseek(f, sizeof(ngram3sidecar) + sizeof hdr, SEEK_SET) ||
+	    fwrite(off, sizeof *off, hdr.wordcnt + 1, f) != hdr.wordcnt + 1)
+		perror(dst);
+	fclose(f);
+	printf("%llu entries for %lu words...\n",
+		(unsigned long long)off[hdr.wordcnt], (unsigned long)hdr.wordcnt);
+
+	free(ent);
+	free(off);
+	ngram3bin_fini(pm);
+	unlink(tmppath);
+	ngram3bin_fini(m);
+}
+
+/*
+ * word id of s[0:len] if it's at least minfreq frequent, otherwise UNKNOWN_ID
+ */
+static uint32_t splitpart(const char *s, unsigned len, const struct ngramword *w, uint32_t minfreq)
+{
+	unsigned long id = ngramword_word2id(s, len, *w);
+	return id != UNKNOWN_ID && w->word[id].freq >= minfreq ? id : UNKNOWN_ID;
+}
+
+/*
+ * add (x,y,z) to the find[*cnt] being collected, growing it as needed
+ */
+static int splitfind_put(ngram3 **find, unsigned long *cnt, unsigned long *max,
+			 uint32_t x, uint32_t y, uint32_t z)
+{
+	if (*cnt == *max)
+	{
+		unsigned long newmax = *max ? *max * 2 : 1024;
+		ngram3 *tmp = realloc(*find, newmax * sizeof *tmp);
+		if (!tmp)
+			return 0;
+		*find = tmp;
+		*max = newmax;
+	}
+	(*find)[*cnt].id[0] = x;
+	(*find)[*cnt].id[1] = y;
+	(*find)[*cnt].id[2] = z;
+	(*find)[*cnt].freq = 0;
+	(*cnt)++;
+	return 1;
+}
+
+/*
+ * build ngram3.bin.splits from path and word.bin: for every word, each way of
+ * cutting it at one or two character boundaries into words at least minfreq
+ * frequent, as (x,y) or (x,y,z), that path has a frequency for.
+ * word.bin needs its lookup section, as every cut is looked up
+ */
+static void splitfile(const char *path, uint32_t minfreq)
+{
+	struct ngram3map m = ngram3bin_init(path, 0);
+	struct ngram3map mw = ngram3bin_init("word.bin", 0);
+	struct ngram3map bigram, bloom;
+	struct ngramword w;
+	ngram3bin_index idx;
+	ngram3bloom_stats stats = { 0, 0, 0 };
+	ngram3split hdr;
+	ngram3 *find = NULL;
+	ngram3splitent *ent = NULL;
+	unsigned long *freq = NULL;
+	unsigned long findcnt, findmax = 0, entmax = 0;
+	uint64_t *off;
+	uint32_t id;
+	int tot, ok = 1;
+	FILE *f;
+
+	if (!m.m || !mw.m)
+	{
+		fprintf(stderr, "%s: need %s and word.bin\n", __func__, path);
+		ngram3bin_fini(m);
+		ngram3bin_fini(mw);
+		return;
+	}
+	w = ngramword_load(mw);
+	if (!w.sorted)
+	{
+		fprintf(stderr, "%s: word.bin has no lookup section; rebuild it with import2bin-word.py\n", __func__);
+		ngramword_fini(w);
+		ngram3bin_fini(m);
+		ngram3bin_fini(mw);
+		return;
+	}
+	// each word's frequency, from the totals totalsfile() just wrote if it did
+	if (!(tot = ngram3bin_totals_init(&idx, w, "ngram3.bin", &m)))
+		ngramword_totalfreqs(w, &m);
+	bigram = ngram3sidecar_init("ngram3.bin", NGRAM2BIN_SUFFIX, NGRAM2BIN_MAGIC, NGRAM2BIN_VERSION, &m);
+	bloom = ngram3bloom_init("ngram3.bin", &m);
+	hdr.wordcnt = w.cnt;
+	hdr.minfreq = minfreq;
+
+	if (!(off = calloc(hdr.wordcnt + 1, sizeof *off)))
+	{
+		perror("calloc");
+		ok = 0;
+	}
+	f = ok ? fopen("ngram3.bin" NGRAM3SPLIT_SUFFIX, "w") : NULL;
+	// off is filled in as we go and written over its placeholder at the end
+	ok = f &&
+	     ngram3sidecar_write(f, NGRAM3SPLIT_MAGIC, NGRAM3SPLIT_VERSION, &m) &&
+	     fwrite(&hdr, sizeof hdr, 1, f) == 1 &&
+	     fwrite(off, sizeof *off, hdr.wordcnt + 1, f) == hdr.wordcnt + 1;
+	for (id = 0; ok && id < hdr.wordcnt; id++)
+	{
+		const char *str = w.word[id].str;
+		const unsigned len = w.word[id].len;
+		unsigned long i, j, cnt = 0;
+		findcnt = 0;
+		// every (x,y) and (x,y,z) it cuts into, cutting only between characters...
+		for (i = 1; ok && id != UNKNOWN_ID && i < len; i++)
+		{
+			uint32_t x, y, z;
+			if (((unsigned char)str[i] & 0xc0) == 0x80 ||
+			    !(x = splitpart(str, i, &w, minfreq)))
+				continue;
+			if ((y = splitpart(str + i, len - i, &w, minfreq)))
+				ok = splitfind_put(&find, &findcnt, &findmax, x, y, IMPOSSIBLE_ID);
+			for (j = i + 1; ok && j < len; j++)
+			{
+				if (((unsigned char)str[j] & 0xc0) == 0x80 ||
+				    !(y = splitpart(str + i, j - i, &w, minfreq)) ||
+				    !(z = splitpart(str + j, len - j, &w, minfreq)))
+					continue;
+				ok = splitfind_put(&find, &findcnt, &findmax, x, y, z);
+			}
+		}
+		// ...and those that appear together, most frequent first
+		if (ok && findcnt > entmax)
+		{
+			ngram3splitent *tmp = realloc(ent, findmax * sizeof *ent);
+			unsigned long *tmpfreq = realloc(freq, findmax * sizeof *freq);
+			if (tmp)
+				ent = tmp;
+			if (tmpfreq)
+				freq = tmpfreq;
+			if ((ok = tmp && tmpfreq))
+				entmax = findmax;
+		}
+		if (ok && findcnt)
+			ok = ngram3bin_freq_many(find, freq, findcnt, &m, &bigram, &bloom, &stats);
+		for (i = 0; ok && i < findcnt; i++)
+		{
+			if (!freq[i])
+				continue;
+			ent[cnt].id[0] = find[i].id[0];
+			ent[cnt].id[1] = find[i].id[1];
+			ent[cnt].id[2] = find[i].id[2] == IMPOSSIBLE_ID ? UNKNOWN_ID : find[i].id[2];
+			ent[cnt].freq = freq[i] > UINT32_MAX ? UINT32_MAX : freq[i];
+			cnt++;
+		}
+		if (!ok)
+		{
+			perror("realloc");
+			break;
+		}
+		qsort(ent, cnt, sizeof *ent, ngram3splitent_cmp);
+		ok = fwrite(ent, sizeof *ent, cnt, f) == cnt;
+		off[id + 1] = off[id] + cnt;
+	}
+	if (ok && (fseek(f, sizeof(ngram3sidecar) + sizeof hdr, SEEK_SET) ||
+		   fwrite(off, sizeof *off, hdr.wordcnt + 1, f) != hdr.wordcnt + 1))
+		ok = 0;
+	if (!ok)
+		perror("ngram3.bin" NGRAM3SPLIT_SUFFIX);
+	else
+		printf("%llu splits of %lu words...\n",
+			(unsigned long long)off[hdr.wordcnt], (unsigned long)hdr.wordcnt);
+	if (f)
+		fclose(f);
+
+	free(find);
+	free(ent);
+	free(freq);
+	free(off);
+	ngram3bin_fini(bloom);
+	ngram3bin_fini(bigram);
+	if (tot)
+		ngram3bin_index_fini(&idx);
+	ngramword_fini(w);
+	ngram3bin_fini(mw);
+	ngram3bin_fini(m);
+}
+
+static int delent_cmp(const void *va, const void *vb)
+{
+	const ngramdelent *a = va,
+			  *b = vb;
+	if (a->hash != b->hash)
+		return a->hash < b->hash ? -1 : 1;
+	return a->id < b->id ? -1 : a->id > b->id;
+}
+
+/*
+ * build word.bin.deletes: the hash of every deletion of at most NGRAMDEL_MAXDIST of
+ * the first prefix characters of every word, sorted and indexed by their top bits
+ */
+static void deletesfile(uint32_t prefix)
+{
+	const char *path = "word.bin",
+		   *tmppath = "word.bin.deletes.tmp";
+	struct ngram3map mw = ngram3bin_init(path, 0);
+	struct ngram3map pm;
+	struct ngramword w;
+	ngramdel hdr;
+	ngramdelent e, *ent;
+	uint32_t hash[NGRAMDEL_VARMAX];
+	unsigned long long cnt = 0, i, j;
+	uint64_t *dir;
+	unsigned n;
+	FILE *f;
+
+	if (!mw.m)
+	{
+		fprintf(stderr, "%s: need %s\n", __func__, path);
+		return;
+	}
+	w = ngramword_load(mw);
+	hdr.prefix = prefix;
+	hdr.maxdist = NGRAMDEL_MAXDIST;
+	hdr.bits = 1;
+	hdr.wordcnt = w.cnt;
+
+	// every (hash, id)...
+	f = fopen(tmppath, "w");
+	for (e.id = UNKNOWN_ID + 1; e.id < w.cnt; e.id++)
+	{
+		if (!w.word[e.id].len)
+			continue;
+		n = ngramdel_hashes(w.word[e.id].str, w.word[e.id].len, prefix, hdr.maxdist, hash);
+		while (n--)
+		{
+			e.hash = hash[n];
+			fwrite(&e, sizeof e, 1, f);
+		}
+	}
+	fclose(f);
+
+	// ...sorted, without the repeats of words with repeated letters
+	pm = ngram3bin_init(tmppath, 1);
+	ent = pm.m;
+	if (ent)
+	{
+		cnt = pm.size / sizeof *ent;
+		qsort(ent, cnt, sizeof *ent, delent_cmp);
+		for (i = j = 1; i < cnt; i++)
+			if (ent[i].hash != ent[j - 1].hash || ent[i].id != ent[j - 1].id)
+				ent[j++] = ent[i];
+		cnt = cnt ? j : 0;
+	}
+	// a few entries per directory slot
+	while (hdr.bits < 30 && (1ULL << hdr.bits) < cnt / 4)
+		hdr.bits++;
+	if (!(dir = calloc((1UL << hdr.bits) + 1, sizeof *dir)))
+	{
+		perror("calloc");
+		ngram3bin_fini(pm);
+		unlink(tmppath);
+		ngramword_fini(w);
+		ngram3bin_fini(mw);
+		return;
+	}
+	for (i = 0; i < cnt; i++)
+		dir[((uint64_t)ent[i].hash >> (32 - hdr.bits)) + 1]++;
+	for (i = 0; i < 1UL << hdr.bits; i++)
+		dir[i + 1] += dir[i];
+
+	f = fopen("word.bin" NGRAMDEL_SUFFIX, "w");
+	if (!f ||
+	    !ngram3sidecar_write(f, NGRAMDEL_MAGIC, NGRAMDEL_VERSION, &mw) ||
+	    fwrite(&hdr, sizeof hdr, 1, f) != 1 ||
+	    fwrite(dir, sizeof *dir, (1UL << hdr.bits) + 1, f) != (1UL << hdr.bits) + 1 ||
+	    fwrite(ent, sizeof *ent, cnt, f) != cnt)
+		perror("word.bin" NGRAMDEL_SUFFIX);
+	if (f)
+		fclose(f);
+	printf("%llu deletions of %lu words...\n", cnt, (unsigned long)hdr.wordcnt);
+
+	free(dir);
+	ngram3bin_fini(pm);
+	unlink(tmppath);
+	ngramword_fini(w);
+	ngram3bin_fini(mw);
+}
+
+/*
+ * every word's characters, one after another, and where each word's start;
+ * for trie_cmp(), which sorts ids by them
+ */
+static const uint32_t *TrieCh;
+static const uint64_t *TrieOff;
+
+static int trie_cmp(const void *va, const void *vb)
+{
+	const uint32_t a = *(const uint32_t *)va,
+		       b = *(const uint32_t *)vb;
+	const uint32_t *ca = TrieCh + TrieOff[a], *ea = TrieCh + TrieOff[a + 1],
+		       *cb = TrieCh + TrieOff[b], *eb = TrieCh + TrieOff[b + 1];
+	for (; ca < ea && cb < eb; ca++, cb++)
+		if (*ca != *cb)
+			return *ca < *cb ? -1 : 1;
+	if (ca < ea || cb < eb)
+		return ca < ea ? 1 : -1;
+	return a < b ? -1 : a > b;
+}
+
+/*
+ * the edges of one node of the trie under construction
+ */
+struct trie_kids
+{
+	ngramtrieedge *edge;
+	size_t cnt,
+	       max;
+};
+
+static int trie_kid(struct trie_kids *k, uint32_t ch, uint32_t node)
+{
+	if (k->cnt == k->max)
+	{
+		size_t newmax = k->max ? k->max * 2 : 16;
+		ngramtrieedge *tmp = realloc(k->edge, newmax * sizeof *tmp);
+		if (!tmp)
+			return 0;
+		k->edge = tmp;
+		k->max = newmax;
+	}
+	k->edge[k->cnt].ch = ch;
+	k->edge[k->cnt].node = node;
+	k->cnt++;
+	return 1;
+}
+
+/*
+ * the trie of the cnt words in ids, in order: node and each node's nkids edges from
+ * start in edge. the words share each prefix with the word before, so each node is
+ * finished when a word no longer shares it, and its edges go in edge then
+ */
+static int triebuild(const uint32_t *ids, unsigned long long cnt, const uint32_t *ch, const uint64_t *off,
+		     ngramtrie *hdr, ngramtrienode *node, ngramtrieedge *edge, uint32_t *start, uint32_t *nkids)
+{
+	struct trie_kids kids[NGRAMTRIE_DEPTHMAX + 1];
+	uint32_t at[NGRAMTRIE_DEPTHMAX + 1];
+	unsigned long long i, edgecnt = 0;
+	unsigned prevlen = 0, d;
+	int ok = 1;
+	memset(kids, 0, sizeof kids);
+	hdr->depth = 0;
+	hdr->nodecnt = 0;
+	node[0].id = UNKNOWN_ID;
+	at[0] = hdr->nodecnt++;
+	for (i = 0; ok && i <= cnt; i++)
+	{
+		// past the last word, finish every node
+		const uint32_t *c = i < cnt ? ch + off[ids[i]] : NULL;
+		const unsigned len = c ? off[ids[i] + 1] - off[ids[i]] : 0;
+		unsigned common = 0, keep;
+		while (c && common < len && common < prevlen &&
+		       c[common] == ch[off[ids[i - 1]] + common])
+			common++;
+		// the nodes below what we share with the word before are done
+		keep = c ? common + 1 : 0;
+		for (d = prevlen + 1; d-- > keep; )
+		{
+			start[at[d]] = edgecnt;
+			nkids[at[d]] = kids[d].cnt;
+			memcpy(edge + edgecnt, kids[d].edge, kids[d].cnt * sizeof *edge);
+			edgecnt += kids[d].cnt;
+			kids[d].cnt = 0;
+		}
+		if (!c)
+			break;
+		for (d = common; ok && d < len; d++)
+		{
+			node[hdr->nodecnt].id = UNKNOWN_ID;
+			at[d + 1] = hdr->nodecnt++;
+			ok = trie_kid(&kids[d], c[d], at[d + 1]);
+		}
+		// the first of words spelled the same keeps the node
+		if (ok && node[at[len]].id == UNKNOWN_ID)
+			node[at[len]].id = ids[i];
+		prevlen = len;
+		if (len > hdr->depth)
+			hdr->depth = len;
+	}
+	hdr->edgecnt = edgecnt;
+	for (d = 0; d <= NGRAMTRIE_DEPTHMAX; d++)
+		free(kids[d].edge);
+	return ok;
+}
+
+/*
+ * build word.bin.trie, with each node's edges written out in node order
+ */
+static void triefile(void)
+{
+	const char *path = "word.bin";
+	struct ngram3map mw = ngram3bin_init(path, 0);
+	struct ngramword w;
+	ngramtrie hdr;
+	ngramtrienode *node;
+	ngramtrieedge *edge;
+	uint32_t *ch, *ids, *start, *nkids;
+	uint64_t *off;
+	unsigned long long chcnt = 0, cnt = 0, i, edgecnt = 0, skipped = 0;
+	uint32_t id;
+	int ok;
+	FILE *f;
+
+	if (!mw.m)
+	{
+		fprintf(stderr, "%s: need %s\n", __func__, path);
+		return;
+	}
+	w = ngramword_load(mw);
+	hdr.wordcnt = w.cnt;
+	// there are no more characters than bytes, nor more nodes than characters and the root
+	for (id = 0; id < w.cnt; id++)
+		chcnt += w.word[id].len;
+	off = malloc((w.cnt + 1) * sizeof *off);
+	ids = malloc((w.cnt + 1) * sizeof *ids);
+	ch = malloc((chcnt + 1) * sizeof *ch);
+	node = malloc((chcnt + 1) * sizeof *node);
+	edge = malloc((chcnt + 1) * sizeof *edge);
+	start = malloc((chcnt + 1) * sizeof *start);
+	nkids = calloc(chcnt + 1, sizeof *nkids);
+	if (!off || !ids || !ch || !node || !edge || !start || !nkids)
+	{
+		perror("malloc");
+		ok = 0;
+	}
+	else
+	{
+		// every word's characters, sorted
+		off[0] = 0;
+		for (id = 0; id < w.cnt; id++)
+			off[id + 1] = off[id] + ngramtrie_decode(w.word[id].str, w.word[id].len,
+								 ch + off[id], w.word[id].len);
+		for (id = UNKNOWN_ID + 1; id < w.cnt; id++)
+			if (off[id + 1] - off[id] > NGRAMTRIE_DEPTHMAX)
+				skipped++;
+			else if (off[id + 1] > off[id])
+				ids[cnt++] = id;
+		TrieCh = ch;
+		TrieOff = off;
+		qsort(ids, cnt, sizeof *ids, trie_cmp);
+		if (!(ok = triebuild(ids, cnt, ch, off, &hdr, node, edge, start, nkids)))
+			perror("realloc");
+	}
+	if (ok)
+	{
+		f = fopen("word.bin" NGRAMTRIE_SUFFIX, "w");
+		ok = f &&
+		     ngram3sidecar_write(f, NGRAMTRIE_MAGIC, NGRAMTRIE_VERSION, &mw) &&
+		     fwrite(&hdr, sizeof hdr, 1, f) == 1;
+		for (i = 0; ok && i <= hdr.nodecnt; i++)
+		{
+			ngramtrienode n = { edgecnt, i < hdr.nodecnt ? node[i].id : UNKNOWN_ID };
+			ok = fwrite(&n, sizeof n, 1, f) == 1;
+			if (i < hdr.nodecnt)
+				edgecnt += nkids[i];
+		}
+		for (i = 0; ok && i < hdr.nodecnt; i++)
+			ok = fwrite(edge + start[i], sizeof *edge, nkids[i], f) == nkids[i];
+		if (!ok)
+			perror("word.bin" NGRAMTRIE_SUFFIX);
+		if (f)
+			fclose(f);
+		printf("%lu nodes, %lu edges, longest word %u characters",
+			(unsigned long)hdr.nodecnt, (unsigned long)hdr.edgecnt, hdr.depth);
+		if (skipped)
+			printf(", %llu longer ones left out", skipped);
+		printf("...\n");
+	}
+
+	free(nkids);
+	free(start);
+	free(edge);
+	free(node);
+	free(ch);
+	free(ids);
+	free(off);
+	ngramword_fini(w);
+	ngram3bin_fini(mw);
+}
+
+/*
+ * sort and merge ngramN.bin into ngramN.bin.sort, if it exists
+ */
+static void compactn(unsigned n)
+{
+	char path[32], dst[32];
+	struct ngram3map m;
+	snprintf(path, sizeof path, "ngram%u.bin", n);
+	snprintf(dst, sizeof dst, "ngram%u.bin.sort", n);
+	if (access(path, R_OK))
+		return;
+	m = ngram3bin_init(path, 1);
+	if (m.m && m.size >= ngramn_recsize(n))
+	{
+		printf("%s: map %llu bytes (%llu ngram%us)\n", path, m.size, ngramn_cnt(&m, n), n);
+		sortfile(&m, n);
+		mergefile(&m, n, dst);
+	}
+	ngram3bin_fini(m);
+}
+
+int main(int argc, char *argv[])
 {
 	const char *path = "ngram3.bin";
+	double fprate = argc > 1 ? atof(argv[1]) : NGRAM3BLOOM_FPRATE;
+	uint32_t topn = argc > 2 ? strtoul(argv[2], NULL, 10) : NGRAM3ADJ_TOPN;
+	uint32_t prefix = argc > 3 ? strtoul(argv[3], NULL, 10) : NGRAMDEL_PREFIX;
+	uint32_t splitfreq = argc > 4 ? strtoul(argv[4], NULL, 10) : NGRAM3SPLIT_MINFREQ;
 	struct ngram3map m = ngram3bin_init(path, 1);
+	unsigned n;
 	printf("map %llu bytes (%llu ngram3s)\n", m.size, m.size / sizeof(ngram3));
 	printf("sorting...\n");
-	sortfile(&m);
+	sortfile(&m, 3);
 	printf("merging...\n");
-	mergefile(&m);
-	printf("done.\n");
+	mergefile(&m, 3, "ngram3.bin.sort");
 	ngram3bin_fini(m);
+	printf("bigrams...\n");
+	bigramfile("ngram3.bin.sort");
+	printf("permutations...\n");
+	permfile("ngram3.bin.sort", NGRAM3PERM_YZX_SUFFIX, permcmp_yzx);
+	permfile("ngram3.bin.sort", NGRAM3PERM_XZY_SUFFIX, permcmp_xzy);
+	printf("totals...\n");
+	totalsfile("ngram3.bin.sort");
+	printf("bloom filter...\n");
+	if (fprate > 0 && fprate < 1)
+		bloomfile("ngram3.bin.sort", fprate);
+	else
+		fprintf(stderr, "bloom false-positive rate must be between 0 and 1, skipping\n");
+	printf("follows/precedes...\n");
+	if (topn)
+	{
+		adjfile("ngram3.bin.sort", NGRAM3FOLLOWS_SUFFIX, 1, topn);
+		adjfile("ngram3.bin.sort", NGRAM3PRECEDES_SUFFIX, -1, topn);
+	}
+	else
+	{
+		fprintf(stderr, "follows/precedes per word must be at least 1, skipping\n");
+	}
+	printf("splits...\n");
+	splitfile("ngram3.bin.sort", splitfreq);
+	printf("deletion index...\n");
+	if (prefix && prefix <= NGRAMDEL_PREFIXMAX)
+		deletesfile(prefix);
+	else
+		fprintf(stderr, "deletion index prefix must be between 1 and %u, skipping\n", NGRAMDEL_PREFIXMAX);
+	printf("trie...\n");
+	triefile();
+	printf("longer ngrams...\n");
+	for (n = 4; n <= NGRAMN_MAX; n++)
+		compactn(n);
+	printf("done.\n");
 	return 0;
 }
 
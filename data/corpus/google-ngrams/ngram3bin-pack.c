@@ -0,0 +1,239 @@
+/* ex: set ts=8 noet: */
+/*
+ * Copyright 2011 Ryan Flynn <parseerror+github@gmail.com>
+ *
+ * re-encode a sorted, merged ngram3.bin (see ngram3bin-compact) in the block
+ * format described by ngram3blk, as ngram3.blk. ids and frequencies are kept
+ * exactly, so every lookup answers the same against either file.
+ *
+ * with -q, write ngram3.q instead: fixed 12-byte records with the frequencies
+ * quantized to codes of 8 or 16 bits, see ngram3q. frequencies come back only
+ * roughly, the rest exactly.
+ *
+ * the sidecars built by ngram3bin-compact describe records by position, which
+ * packing preserves, so they are copied alongside as ngram3.blk.bigram etc.
+ *
+ * Usage: ./ngram3bin-pack [blocksize]
+ *        ./ngram3bin-pack -q [bits, 8 or 16]
+ */
+
+#include <stdlib.h>
+#include <stdio.h>
+#include <string.h>
+#include <math.h>
+#include "ngram3bin.h"
+
+static const char *Sidecars[] = {
+	NGRAM2BIN_SUFFIX,
+	NGRAM3PERM_YZX_SUFFIX,
+	NGRAM3PERM_XZY_SUFFIX,
+	NGRAM3TOTALS_SUFFIX,
+	NGRAM3BLOOM_SUFFIX,
+	NGRAM3FOLLOWS_SUFFIX,
+	NGRAM3PRECEDES_SUFFIX,
+	NGRAM3SPLIT_SUFFIX,
+	NULL
+};
+
+/*
+ * write m, an array of ngram3, to f as blocks of blocksize records
+ */
+static int packfile(const struct ngram3map *m, FILE *f, uint32_t blocksize)
+{
+	const ngram3 *rd = ngram3map_start(m);
+	const unsigned long long cnt = ngram3bin_cnt(m);
+	unsigned char buf[NGRAM3BLK_RECMAX];
+	ngram3blk hdr;
+	ngram3blkent *index;
+	unsigned long long i, off;
+	int ok;
+
+	hdr.magic = NGRAM3BLK_MAGIC;
+	hdr.version = NGRAM3BLK_VERSION;
+	hdr.blocksize = blocksize;
+	hdr.blockcnt = (cnt + blocksize - 1) / blocksize;
+	hdr.cnt = cnt;
+	if (!(index = calloc(hdr.blockcnt ? hdr.blockcnt : 1, sizeof *index)))
+	{
+		perror("calloc");
+		return 0;
+	}
+	// the index is filled in as we go and written over its placeholder at the end
+	ok = fwrite(&hdr, sizeof hdr, 1, f) == 1 &&
+	     fwrite(index, sizeof *index, hdr.blockcnt, f) == hdr.blockcnt;
+	off = sizeof hdr + hdr.blockcnt * sizeof *index;
+	for (i = 0; ok && i < cnt; i++)
+	{
+		if (i % blocksize == 0)
+		{
+			index[i / blocksize].first = rd[i];
+			index[i / blocksize].off = off;
+		}
+		else
+		{
+			size_t len = ngram3blk_encode(buf, rd + i - 1, rd + i);
+			ok = fwrite(buf, 1, len, f) == len;
+			off += len;
+		}
+	}
+	ok = ok &&
+	     !fseek(f, sizeof hdr, SEEK_SET) &&
+	     fwrite(index, sizeof *index, hdr.blockcnt, f) == hdr.blockcnt;
+	free(index);
+	printf("%llu ngram3s in %lu blocks, %llu bytes (%.1f%%)\n",
+		cnt, (unsigned long)hdr.blockcnt, off, m->size ? 100. * off / m->size : 0.);
+	return ok;
+}
+
+/*
+ * the code for freq, between exact and the highest frequency top spread evenly
+ * on a log scale over the codes above exact
+ */
+static uint32_t quantize(uint32_t freq, uint32_t exact, uint32_t top, uint32_t levels)
+{
+	if (freq < exact)
+		return freq;
+	return exact + (uint32_t)(log((double)freq / exact) / log((double)top / exact) *
+				  (levels - 1 - exact) + 0.5);
+}
+
+/*
+ * write m, an array of ngram3, to f as ngram3qrec with codes of bits bits
+ */
+static int quantfile(const struct ngram3map *m, FILE *f, uint32_t bits)
+{
+	const ngram3 *rd = ngram3map_start(m);
+	const unsigned long long cnt = ngram3bin_cnt(m);
+	const uint32_t levels = 1UL << bits;
+	unsigned long long i, *n;
+	double *sum;
+	uint32_t *freq, top = 1, idmax = 0, c;
+	ngram3q hdr;
+	ngram3qrec r;
+	int ok;
+
+	for (i = 0; i < cnt; i++)
+	{
+		if (rd[i].freq > top) top = rd[i].freq;
+		if (rd[i].id[0] > idmax) idmax = rd[i].id[0];
+		if (rd[i].id[1] > idmax) idmax = rd[i].id[1];
+		if (rd[i].id[2] > idmax) idmax = rd[i].id[2];
+	}
+	if (idmax > NGRAM3Q_IDMAX)
+	{
+		fprintf(stderr, "id %lu won't fit in 24 bits\n", (unsigned long)idmax);
+		return 0;
+	}
+	hdr.magic = NGRAM3Q_MAGIC;
+	hdr.version = NGRAM3Q_VERSION;
+	hdr.bits = bits;
+	// if every frequency has a code of its own, keep them all
+	hdr.exact = top < levels ? levels : levels / 8;
+	hdr.cnt = cnt;
+	freq = calloc(levels, sizeof *freq);
+	n = calloc(levels, sizeof *n);
+	sum = calloc(levels, sizeof *sum);
+	if (!freq || !n || !sum)
+	{
+		perror("calloc");
+		free(freq); free(n); free(sum);
+		return 0;
+	}
+	// the table is filled in as we go and written over its placeholder at the end
+	ok = fwrite(&hdr, sizeof hdr, 1, f) == 1 &&
+	     fwrite(freq, sizeof *freq, levels, f) == levels;
+	for (i = 0; ok && i < cnt; i++)
+	{
+		c = quantize(rd[i].freq, hdr.exact, top, levels);
+		n[c]++;
+		sum[c] += rd[i].freq;
+		ngram3q_encode(&r, rd + i, c);
+		ok = fwrite(&r, sizeof r, 1, f) == 1;
+	}
+	// each code stands for the mean of the frequencies given it, which keeps
+	// the table increasing; codes nobody got stand for the middle of their range
+	for (c = 0; c < levels; c++)
+	{
+		if (c < hdr.exact)
+			freq[c] = c;
+		else if (n[c])
+			freq[c] = (uint32_t)(sum[c] / n[c] + 0.5);
+		else
+			freq[c] = (uint32_t)(hdr.exact * pow((double)top / hdr.exact,
+							     (double)(c - hdr.exact) / (levels - 1 - hdr.exact)) + 0.5);
+	}
+	ok = ok &&
+	     !fseek(f, sizeof hdr, SEEK_SET) &&
+	     fwrite(freq, sizeof *freq, levels, f) == levels;
+	printf("%llu ngram3s with %lu-bit frequencies (exact below %lu, top %lu), %llu bytes (%.1f%%)\n",
+		cnt, (unsigned long)bits, (unsigned long)hdr.exact, (unsigned long)top,
+		(unsigned long long)(sizeof hdr + levels * sizeof *freq + cnt * sizeof r),
+		m->size ? 100. * (sizeof hdr + levels * sizeof *freq + cnt * sizeof r) / m->size : 0.);
+	free(freq);
+	free(n);
+	free(sum);
+	return ok;
+}
+
+/*
+ * copy path+suffix to dst+suffix, retagged as built from blk
+ */
+static void copysidecar(const char *path, const char *dst, const char *suffix,
+			const struct ngram3map *m, const struct ngram3map *blk)
+{
+	char src[64], out[64];
+	struct ngram3map s;
+	const ngram3sidecar *hdr;
+	FILE *f;
+
+	snprintf(src, sizeof src, "%s%s", path, suffix);
+	snprintf(out, sizeof out, "%s%s", dst, suffix);
+	s = ngram3bin_init(src, 0);
+	hdr = s.m;
+	if (!hdr || s.size < sizeof *hdr || hdr->ngramsize != m->size)
+	{
+		fprintf(stderr, "%s: missing or stale, skipping\n", src);
+		ngram3bin_fini(s);
+		return;
+	}
+	if (!(f = fopen(out, "w")) ||
+	    !ngram3sidecar_write(f, hdr->magic, hdr->version, blk) ||
+	    fwrite(ngram3sidecar_start(&s), 1, ngram3sidecar_size(&s), f) != ngram3sidecar_size(&s))
+		perror(out);
+	if (f)
+		fclose(f);
+	ngram3bin_fini(s);
+}
+
+int main(int argc, char *argv[])
+{
+	const int quant = argc > 1 && !strcmp(argv[1], "-q");
+	const char *path = "ngram3.bin",
+		   *dst = quant ? "ngram3.q" : "ngram3.blk";
+	uint32_t arg = argc > 1 + quant ? strtoul(argv[1 + quant], NULL, 10)
+					: quant ? NGRAM3Q_BITS : NGRAM3BLK_BLOCKSIZE;
+	struct ngram3map m = ngram3bin_init(path, 0);
+	struct ngram3map blk;
+	FILE *f;
+	int i;
+
+	if (!m.m || ngram3blk_hdr(&m) || ngram3q_hdr(&m) ||
+	    (quant ? arg != 8 && arg != 16 : !arg))
+	{
+		fprintf(stderr, "Usage: %s [blocksize] | -q [bits] (with %s unpacked)\n", argv[0], path);
+		return 1;
+	}
+	printf("map %llu bytes (%llu ngram3s)\n", m.size, ngram3bin_cnt(&m));
+	if (!(f = fopen(dst, "w")) || !(quant ? quantfile(&m, f, arg) : packfile(&m, f, arg)))
+	{
+		perror(dst);
+		return 1;
+	}
+	fclose(f);
+	blk = ngram3bin_init(dst, 0);
+	for (i = 0; Sidecars[i]; i++)
+		copysidecar(path, dst, Sidecars[i], &m, &blk);
+	ngram3bin_fini(blk);
+	ngram3bin_fini(m);
+	return 0;
+}
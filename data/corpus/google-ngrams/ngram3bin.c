@@ -12,6 +12,7 @@
 #include <fcntl.h>
 #include <unistd.h>
 #include <string.h>
+#include <limits.h>
 #include <arpa/inet.h>
 #include "ngram3bin.h"
 
@@ -63,17 +64,52 @@ ngram3 * ngram3_find_spacefor1more(ngram3 *ng, unsigned long cnt)
 	return ng;
 }
 
+/*
+ * return m's lookup section trailer, if it has a valid one
+ */
+static const ngramwordtrailer * ngramword_trailer(const struct ngram3map m)
+{
+	const ngramwordtrailer *t;
+	if (!m.m || m.size < sizeof *t)
+		return NULL;
+	t = (const ngramwordtrailer *)((char *)m.m + m.size - sizeof *t);
+	if (t->magic != NGRAMWORD_MAGIC ||
+	    t->version != NGRAMWORD_VERSION ||
+	    t->wordsize + (uint64_t)t->cnt * 2 * sizeof(uint32_t) + sizeof *t != m.size)
+		return NULL;
+	return t;
+}
+
 /*
  * map contains the mmap'ed contents of a dictionary file
  * the dictionary file is a list of variable-length entries in the form
  * [uint32_t id][uint32_t len][utf-8 encoded string of bytes length 'len']
+ * optionally followed by a lookup section, see ngramwordtrailer
  */
 struct ngramword ngramword_load(const struct ngram3map m)
 {
+	const ngramwordtrailer *t = ngramword_trailer(m);
 	ngramwordcursor *cursor = m.m;
 	ngramwordcursor *end = (void *)((char *)m.m + m.size);
 	unsigned long maxpossible = m.size / 6 + 1;
 	struct ngramword w;
+	w.base = m.m;
+	w.off = NULL;
+	w.sorted = NULL;
+	if (t)
+	{
+		// the section tells us exactly where every word is
+		w.off = (const uint32_t *)((char *)m.m + t->wordsize);
+		w.sorted = w.off + t->cnt;
+		w.word = calloc(t->cnt, sizeof *w.word);
+		for (w.cnt = 0; w.word && w.cnt < t->cnt; w.cnt++)
+		{
+			cursor = (void *)(w.base + w.off[w.cnt]);
+			w.word[w.cnt].len = cursor->len;
+			w.word[w.cnt].str = ngramwordcursor_str(cursor);
+		}
+		return w;
+	}
 	w.word = calloc(maxpossible, sizeof *w.word);
 	w.cnt = 0;
 	while (cursor < end)
@@ -89,17 +125,42 @@ struct ngramword ngramword_load(const struct ngram3map m)
 }
 
 /*
- * FIXME: O(n)
- * note: this is mitigated by the python module by using a dict
- * if i added a stage at the beginning of this whole process and sorted words then we could
- * reduce this to O(log n)
+ * compare word a to b bytewise, shorter first; the order of word.bin's sorted ids
+ */
+static int ngramword_cmp(const char *a, unsigned alen, const char *b, unsigned blen)
+{
+	int c = memcmp(a, b, alen < blen ? alen : blen);
+	if (c)
+		return c;
+	return alen < blen ? -1 : alen > blen;
+}
+
+/*
+ * O(log n) if word.bin has a lookup section, which import2bin-word.py now writes;
+ * otherwise O(n), which the python module mitigates with a dict
  * we can also reduce the impact of this by converting all tokens in a document to their ids
  * once for the duration of the process; currently we're being lazy and repeatedly translating
  */
 const unsigned long ngramword_word2id(const char *word, unsigned len, const struct ngramword w)
 {
 	unsigned long id = 0;
-	printf("ngramword_word2id(word=\"%s\", w={%lu,%p})\n", word, w.cnt, w.word);
+	if (w.sorted)
+	{
+		unsigned long lo = 0, hi = w.cnt;
+		while (lo < hi)
+		{
+			unsigned long mid = lo + (hi - lo) / 2;
+			const ngramwordcursor *cur = (const void *)(w.base + w.off[w.sorted[mid]]);
+			int c = ngramword_cmp(word, len, ngramwordcursor_str(cur), cur->len);
+			if (!c)
+				return w.sorted[mid];
+			if (c < 0)
+				hi = mid;
+			else
+				lo = mid + 1;
+		}
+		return 0;
+	}
 	while (id < w.cnt)
 	{
 		if (w.word[id].len == len && 0 == memcmp(word, w.word[id].str, len))
@@ -137,15 +198,359 @@ int ngram3cmp(const void *va, const void *vb)
 	return 0;
 }
 
+/*
+ * ngram2 comparison callback
+ * ascending order
+ */
+int ngram2cmp(const void *va, const void *vb)
+{
+	const ngram2 *a = va,
+	             *b = vb;
+	if (a->id[0] != b->id[0]) return (int)(a->id[0] - b->id[0]);
+	if (a->id[1] != b->id[1]) return (int)(a->id[1] - b->id[1]);
+	return 0;
+}
+
+/*
+ * return m's block header if it is block-encoded, see ngram3blk
+ */
+const ngram3blk * ngram3blk_hdr(const struct ngram3map *m)
+{
+	const ngram3blk *hdr = m->m;
+	if (hdr && m->size >= sizeof *hdr &&
+	    hdr->magic == NGRAM3BLK_MAGIC &&
+	    hdr->version == NGRAM3BLK_VERSION &&
+	    hdr->blocksize && hdr->blocksize <= NGRAM3BLK_BLOCKMAX)
+		return hdr;
+	return NULL;
+}
+
+/*
+ * return m's header if it is quantized, see ngram3q
+ */
+const ngram3q * ngram3q_hdr(const struct ngram3map *m)
+{
+	const ngram3q *hdr = m->m;
+	if (hdr && m->size >= sizeof *hdr &&
+	    hdr->magic == NGRAM3Q_MAGIC &&
+	    hdr->version == NGRAM3Q_VERSION &&
+	    (hdr->bits == 8 || hdr->bits == 16) &&
+	    m->size >= (char *)(ngram3q_rec(hdr) + hdr->cnt) - (char *)hdr)
+		return hdr;
+	return NULL;
+}
+
+/*
+ * the number of records in m, in any format
+ */
+unsigned long long ngram3bin_cnt(const struct ngram3map *m)
+{
+	const ngram3blk *hdr = ngram3blk_hdr(m);
+	const ngram3q *q;
+	if (hdr)
+		return hdr->cnt;
+	if ((q = ngram3q_hdr(m)))
+		return q->cnt;
+	return m->size / sizeof(ngram3);
+}
+
+static void ngram3q_put(uint8_t *f, uint32_t v)
+{
+	f[0] = v;
+	f[1] = v >> 8;
+	f[2] = v >> 16;
+}
+
+/*
+ * encode ng into r with the frequency code code; ids must be <= NGRAM3Q_IDMAX
+ */
+void ngram3q_encode(ngram3qrec *r, const ngram3 *ng, uint32_t code)
+{
+	ngram3q_put(r->f[0], ng->id[0]);
+	ngram3q_put(r->f[1], ng->id[1]);
+	ngram3q_put(r->f[2], ng->id[2]);
+	ngram3q_put(r->f[3], code);
+}
+
+static unsigned char * varint_put(unsigned char *p, uint32_t v)
+{
+	while (v >= 0x80)
+	{
+		*p++ = (v & 0x7f) | 0x80;
+		v >>= 7;
+	}
+	*p++ = v;
+	return p;
+}
+
+static const unsigned char * varint_get(const unsigned char *p, uint32_t *v)
+{
+	uint32_t x = 0;
+	int shift = 0;
+	do
+	{
+		x |= (uint32_t)(*p & 0x7f) << shift;
+		shift += 7;
+	} while (*p++ & 0x80);
+	*v = x;
+	return p;
+}
+
+/*
+ * encode cur relative to prev, its predecessor in sorted order, into buf,
+ * which must have room for NGRAM3BLK_RECMAX bytes; return the bytes used
+ */
+size_t ngram3blk_encode(unsigned char *buf, const ngram3 *prev, const ngram3 *cur)
+{
+	unsigned char *p = buf;
+	if (cur->id[0] != prev->id[0])
+	{
+		p = varint_put(p, cur->id[0] - prev->id[0]);
+		p = varint_put(p, cur->id[1]);
+		p = varint_put(p, cur->id[2]);
+	}
+	else
+	{
+		*p++ = 0;
+		if (cur->id[1] != prev->id[1])
+		{
+			p = varint_put(p, cur->id[1] - prev->id[1]);
+			p = varint_put(p, cur->id[2]);
+		}
+		else
+		{
+			*p++ = 0;
+			p = varint_put(p, cur->id[2] - prev->id[2]);
+		}
+	}
+	p = varint_put(p, cur->freq);
+	return p - buf;
+}
+
+/*
+ * replace c->cur with the record encoded after it, in a block-encoded map
+ */
+static void ngram3blk_decode(ngram3cursor *c)
+{
+	const unsigned char *p = c->p;
+	uint32_t d;
+	p = varint_get(p, &d);
+	if (d)
+	{
+		c->cur.id[0] += d;
+		p = varint_get(p, &c->cur.id[1]);
+		p = varint_get(p, &c->cur.id[2]);
+	}
+	else
+	{
+		p = varint_get(p, &d);
+		if (d)
+		{
+			c->cur.id[1] += d;
+			p = varint_get(p, &c->cur.id[2]);
+		}
+		else
+		{
+			p = varint_get(p, &d);
+			c->cur.id[2] += d;
+		}
+	}
+	c->p = varint_get(p, &c->cur.freq);
+}
+
+/*
+ * position c at record pos of m, in c->rec
+ * return 0 if there is no such record
+ */
+int ngram3cursor_seek(ngram3cursor *c, const struct ngram3map *m, unsigned long long pos)
+{
+	c->m = m;
+	c->blk = ngram3blk_hdr(m);
+	c->q = c->blk ? NULL : ngram3q_hdr(m);
+	c->cnt = ngram3bin_cnt(m);
+	c->pos = pos;
+	if (pos >= c->cnt)
+		return 0;
+	if (c->q)
+	{
+		ngram3q_decode(ngram3q_freq(c->q), ngram3q_rec(c->q) + pos, &c->cur);
+		c->rec = &c->cur;
+	}
+	else if (!c->blk)
+	{
+		c->rec = ngram3map_start(m) + pos;
+		c->end = ngram3map_start(m) + c->cnt;
+	}
+	else
+	{
+		const ngram3blkent *e = ngram3blk_index(c->blk) + pos / c->blk->blocksize;
+		unsigned long skip = pos % c->blk->blocksize;
+		c->cur = e->first;
+		c->rec = &c->cur;
+		c->p = (const unsigned char *)m->m + e->off;
+		while (skip--)
+			ngram3blk_decode(c);
+	}
+	return 1;
+}
+
+/*
+ * ngram3cursor_next() for block-encoded maps
+ */
+int ngram3blk_next(ngram3cursor *c)
+{
+	if (++c->pos >= c->cnt)
+		return 0;
+	if (c->pos % c->blk->blocksize == 0)
+	{
+		const ngram3blkent *e = ngram3blk_index(c->blk) + c->pos / c->blk->blocksize;
+		c->cur = e->first;
+		c->p = (const unsigned char *)c->m->m + e->off;
+	}
+	else
+	{
+		ngram3blk_decode(c);
+	}
+	return 1;
+}
+
+/*
+ * position c at the first record of m not less than find according to cmp,
+ * with which m must be sorted. return 0 if there is none
+ */
+int ngram3cursor_lower(ngram3cursor *c, const struct ngram3map *m, const ngram3 *find,
+		       int (*cmp)(const void *, const void *))
+{
+	const ngram3blk *hdr = ngram3blk_hdr(m);
+	const ngram3q *q = hdr ? NULL : ngram3q_hdr(m);
+	unsigned long long lo = 0, hi, mid;
+	if (q)
+	{
+		ngram3 tmp;
+		hi = q->cnt;
+		while (lo < hi)
+		{
+			mid = lo + (hi - lo) / 2;
+			ngram3q_decode(ngram3q_freq(q), ngram3q_rec(q) + mid, &tmp);
+			if (cmp(&tmp, find) < 0)
+				lo = mid + 1;
+			else
+				hi = mid;
+		}
+		return ngram3cursor_seek(c, m, lo);
+	}
+	else if (!hdr)
+	{
+		const ngram3 *base = ngram3map_start(m);
+		hi = m->size / sizeof *base;
+		while (lo < hi)
+		{
+			mid = lo + (hi - lo) / 2;
+			if (cmp(base + mid, find) < 0)
+				lo = mid + 1;
+			else
+				hi = mid;
+		}
+		return ngram3cursor_seek(c, m, lo);
+	}
+	else
+	{
+		// find the first block starting at or after find; the first match
+		// may be at the end of the block before it
+		const ngram3blkent *e = ngram3blk_index(hdr);
+		hi = hdr->blockcnt;
+		while (lo < hi)
+		{
+			mid = lo + (hi - lo) / 2;
+			if (cmp(&e[mid].first, find) < 0)
+				lo = mid + 1;
+			else
+				hi = mid;
+		}
+		if (!ngram3cursor_seek(c, m, (lo ? lo - 1 : 0) * (unsigned long long)hdr->blocksize))
+			return 0;
+		while (cmp(c->rec, find) < 0)
+			if (!ngram3cursor_next(c))
+				return 0;
+		return 1;
+	}
+}
+
+/*
+ * the next run of records in s's map, from the return value up to *end,
+ * or NULL once they are exhausted
+ */
+const ngram3 * ngram3scan_next(ngram3scan *s, const ngram3 **end)
+{
+	const ngram3blk *hdr = ngram3blk_hdr(s->m);
+	const ngram3q *q = hdr ? NULL : ngram3q_hdr(s->m);
+	ngram3cursor c;
+	unsigned long n = 0;
+	int ok;
+	if (q)
+	{
+		// decode a buf's worth at a time
+		unsigned long long pos = s->block * (unsigned long long)NGRAM3BLK_BLOCKMAX;
+		const ngram3qrec *r = ngram3q_rec(q) + pos;
+		const uint32_t *freq = ngram3q_freq(q);
+		unsigned long i;
+		if (pos >= q->cnt)
+			return NULL;
+		n = q->cnt - pos < NGRAM3BLK_BLOCKMAX ? q->cnt - pos : NGRAM3BLK_BLOCKMAX;
+		for (i = 0; i < n; i++)
+			ngram3q_decode(freq, r + i, s->buf + i);
+		s->block++;
+		*end = s->buf + n;
+		return s->buf;
+	}
+	if (!hdr)
+	{
+		if (s->block++ || !s->m->m)
+			return NULL;
+		*end = ngram3map_start(s->m) + ngram3bin_cnt(s->m);
+		return ngram3map_start(s->m);
+	}
+	if (s->block >= hdr->blockcnt)
+		return NULL;
+	for (ok = ngram3cursor_seek(&c, s->m, s->block * (unsigned long long)hdr->blocksize);
+	     ok && n < hdr->blocksize;
+	     ok = ngram3cursor_next(&c))
+		s->buf[n++] = *c.rec;
+	s->block++;
+	*end = s->buf + n;
+	return s->buf;
+}
+
+/*
+ * whether m is a plain array of ngram3, which we can search and scan in place
+ */
+static int ngram3bin_raw(const struct ngram3map *m)
+{
+	return !ngram3blk_hdr(m) && !ngram3q_hdr(m);
+}
+
+/*
+ * record pos of m; decoded into *tmp if m is block-encoded or quantized
+ */
+static const ngram3 * ngram3bin_rec(const struct ngram3map *m, unsigned long long pos, ngram3 *tmp)
+{
+	ngram3cursor c;
+	if (ngram3bin_raw(m))
+		return ngram3map_start(m) + pos;
+	ngram3cursor_seek(&c, m, pos);
+	*tmp = *c.rec;
+	return tmp;
+}
+
 /*
  * 
  */
 unsigned long ngram3bin_freq(ngram3 find, const struct ngram3map *m)
 {
-	ngram3 *base = m->m;
-	size_t nmemb = m->size / sizeof *base;
-	const ngram3 *res = bsearch(&find, base, nmemb, sizeof *base, ngram3cmp);
-	return res ? res->freq : 0;
+	ngram3cursor c;
+	if (ngram3cursor_lower(&c, m, &find, ngram3cmp) && !ngram3cmp(c.rec, &find))
+		return c.rec->freq;
+	return 0;
 }
 
 /*
@@ -154,26 +559,190 @@ unsigned long ngram3bin_freq(ngram3 find, const struct ngram3map *m)
 unsigned long ngram3bin_freq2(ngram3 find, const struct ngram3map *m)
 {
 	unsigned long freq = 0;
-	ngram3 *cur = m->m;
-	const ngram3 *end = (ngram3 *)((char *)cur + m->size);
-	while (cur < end)
+	ngram3scan s;
+	const ngram3 *cur, *end;
+	ngram3scan_init(&s, m);
+	while ((cur = ngram3scan_next(&s, &end)))
 	{
-		if (cur->id[0] == find.id[0] &&
-		    cur->id[1] == find.id[1])
+		while (cur < end)
 		{
-			freq += cur->freq;
+			if (cur->id[0] == find.id[0] &&
+			    cur->id[1] == find.id[1])
+			{
+				freq += cur->freq;
+			}
+			else
+			if (cur->id[1] == find.id[0] &&
+			    cur->id[2] == find.id[1])
+			{
+				freq += cur->freq;
+			}
+			cur++;
 		}
-		else
-		if (cur->id[1] == find.id[0] &&
-		    cur->id[2] == find.id[1])
+	}
+	return freq;
+}
+
+/*
+ * given find (x,y) look up the pre-calculated ngram3bin_freq2() in the bigram table
+ */
+unsigned long ngram2bin_freq(ngram3 find, const struct ngram3map *m)
+{
+	const ngram2 *base = ngram3sidecar_start(m);
+	size_t nmemb = ngram3sidecar_size(m) / sizeof *base;
+	const ngram2 key = { { find.id[0], find.id[1] }, 0 };
+	const ngram2 *res = bsearch(&key, base, nmemb, sizeof *base, ngram2cmp);
+	return res ? res->freq : 0;
+}
+
+static uint64_t ngram3bloom_mix(uint64_t z)
+{
+	z ^= z >> 30;
+	z *= 0xbf58476d1ce4e5b9ULL;
+	z ^= z >> 27;
+	z *= 0x94d049bb133111ebULL;
+	return z ^ (z >> 31);
+}
+
+/*
+ * test, or if set is non-zero set, find's k bits in its block of bits
+ * return non-zero if they were all set already
+ */
+static int ngram3bloom_bits(uint64_t *bits, uint64_t blockcnt, uint32_t k, const ngram3 *find, int set)
+{
+	uint64_t seed = ngram3bloom_mix(((uint64_t)find->id[0] << 32) | find->id[1]),
+		 h;
+	uint64_t *block;
+	uint32_t i;
+	int all = 1;
+	seed = ngram3bloom_mix(seed ^ find->id[2]);
+	block = bits + (seed % blockcnt) * 8;
+	h = seed = ngram3bloom_mix(seed);
+	for (i = 0; i < k; i++)
+	{
+		// 9 bits address 512; a 64-bit hash is good for 7 of them
+		unsigned b;
+		if (i && i % 7 == 0)
+			h = seed = ngram3bloom_mix(seed + i);
+		b = h & 511;
+		h >>= 9;
+		if (!(block[b / 64] & (1ULL << (b % 64))))
 		{
-			freq += cur->freq;
+			if (!set)
+				return 0;
+			all = 0;
+			block[b / 64] |= 1ULL << (b % 64);
 		}
-		cur++;
 	}
+	return all;
+}
+
+void ngram3bloom_add(uint64_t *bits, uint64_t blockcnt, uint32_t k, const ngram3 *ng)
+{
+	(void)ngram3bloom_bits(bits, blockcnt, k, ng, 1);
+}
+
+/*
+ * map ngrampath's bloom filter sidecar, if it has an up-to-date one
+ */
+struct ngram3map ngram3bloom_init(const char *ngrampath, const struct ngram3map *m)
+{
+	struct ngram3map b = ngram3sidecar_init(ngrampath, NGRAM3BLOOM_SUFFIX,
+					NGRAM3BLOOM_MAGIC, NGRAM3BLOOM_VERSION, m);
+	const ngram3bloom *hdr;
+	if (!b.m)
+		return b;
+	hdr = ngram3sidecar_start(&b);
+	if (ngram3sidecar_size(&b) < sizeof *hdr ||
+	    !hdr->blockcnt || !hdr->k || hdr->k > NGRAM3BLOOM_KMAX ||
+	    ngram3sidecar_size(&b) != sizeof *hdr + hdr->blockcnt * 64)
+	{
+		fprintf(stderr, "%s%s: stale, ignoring\n", ngrampath, NGRAM3BLOOM_SUFFIX);
+		ngram3bin_fini(b);
+		b.m = NULL;
+		b.fd = -1;
+		b.size = 0;
+	}
+	return b;
+}
+
+/*
+ * return 0 if find is certainly not in the ngram3.bin bloom was built from
+ * with no filter, everything may be
+ */
+int ngram3bloom_maybe(const struct ngram3map *bloom, const ngram3 *find)
+{
+	const ngram3bloom *hdr;
+	if (!bloom || !bloom->m)
+		return 1;
+	hdr = ngram3sidecar_start(bloom);
+	return ngram3bloom_bits((uint64_t *)(hdr + 1), hdr->blockcnt, hdr->k, find, 0);
+}
+
+/*
+ * ngram3bin_freq(), skipping the search if bloom rules find out, tallied in stats
+ */
+unsigned long ngram3bin_freq_bloom(ngram3 find, const struct ngram3map *m, const struct ngram3map *bloom,
+				   ngram3bloom_stats *stats)
+{
+	unsigned long freq;
+	if (!bloom || !bloom->m)
+		return ngram3bin_freq(find, m);
+	if (!ngram3bloom_maybe(bloom, &find))
+	{
+		stats->rejected++;
+		return 0;
+	}
+	stats->passed++;
+	if (!(freq = ngram3bin_freq(find, m)))
+		stats->falsepos++;
 	return freq;
 }
 
+/*
+ * a lookup in ngram3bin_freq_many(); find must remain first, see ngram3cmp
+ */
+typedef struct
+{
+	ngram3 find;
+	size_t pos;
+} ngram3probe;
+
+/*
+ * look up the frequencies of cnt ngrams at once, each either (x,y,z) or, if z
+ * is IMPOSSIBLE_ID, (x,y) as ngram3bin_freq2() does, via bigram if it is mapped.
+ * the lookups are made in sorted order so consecutive searches share most of their
+ * path through m instead of jumping around it; the results are in find's order
+ * bigram and bloom may be NULL or empty
+ */
+int ngram3bin_freq_many(const ngram3 *find, unsigned long *freq, size_t cnt,
+			const struct ngram3map *m, const struct ngram3map *bigram,
+			const struct ngram3map *bloom, ngram3bloom_stats *stats)
+{
+	ngram3probe *p = malloc(cnt * sizeof *p);
+	size_t i;
+	if (!p && cnt)
+		return 0;
+	for (i = 0; i < cnt; i++)
+	{
+		p[i].find = find[i];
+		p[i].pos = i;
+	}
+	qsort(p, cnt, sizeof *p, ngram3cmp);
+	for (i = 0; i < cnt; i++)
+	{
+		unsigned long f;
+		if (p[i].find.id[2] != IMPOSSIBLE_ID)
+			f = ngram3bin_freq_bloom(p[i].find, m, bloom, stats);
+		else if (bigram && bigram->m)
+			f = ngram2bin_freq(p[i].find, bigram);
+		else
+			f = ngram3bin_freq2(p[i].find, m);
+		freq[p[i].pos] = f;
+	}
+	free(p);
+	return 1;
+}
 
 /*
  * given an id 3-gram (x,y,z) and a list of ngram frequencies
@@ -182,22 +751,27 @@ unsigned long ngram3bin_freq2(ngram3 find, const struct ngram3map *m)
 ngram3 * ngram3bin_like(ngram3 find, const struct ngram3map *m)
 {
 	unsigned long ngcnt = 0;
-	ngram3 *cur = m->m;
-	const ngram3 *end = (ngram3*)((char*)cur + m->size);
+	ngram3scan s;
+	const ngram3 *cur, *end;
 	ngram3 *res = NULL;
-	while (cur < end)
+	ngram3scan_init(&s, m);
+	// stop if an allocation failed
+	while ((res || !ngcnt) && (cur = ngram3scan_next(&s, &end)))
 	{
-		if (((cur->id[0] == find.id[0]) +
-		     (cur->id[1] == find.id[1]) +
-		     (cur->id[2] == find.id[2])) == 2)
+		while (cur < end)
 		{
-			res = ngram3_find_spacefor1more(res, ngcnt);
-			if (!res)
-				break;
-			res[ngcnt] = *cur; /* copy result */
-			ngcnt++;
+			if (((cur->id[0] == find.id[0]) +
+			     (cur->id[1] == find.id[1]) +
+			     (cur->id[2] == find.id[2])) == 2)
+			{
+				res = ngram3_find_spacefor1more(res, ngcnt);
+				if (!res)
+					break;
+				res[ngcnt] = *cur; /* copy result */
+				ngcnt++;
+			}
+			cur++;
 		}
-		cur++;
 	}
 	if (res)
 	{
@@ -211,6 +785,8 @@ static unsigned long ngram3bin_like_xy_(ngram3 find, const struct ngram3map *m,
 static unsigned long ngram3bin_like_x_z(ngram3 find, const struct ngram3map *m, ngram3 **res, unsigned long rescnt);
 static unsigned long ngram3bin_like__yz(ngram3 find, const struct ngram3map *m, ngram3 **res, unsigned long rescnt,
 					ngram3bin_index *idx);
+static unsigned long ngram3bin_like_perm(ngram3 find, const struct ngram3map *m, ngram3 **res, unsigned long rescnt,
+					 const struct ngram3map *perm, int a, int b);
 
 /*
  * given an id 3-gram (x,y,z) and a list of ngram frequencies
@@ -226,14 +802,25 @@ static unsigned long ngram3bin_like__yz(ngram3 find, const struct ngram3map *m,
  * so, we broke up the 3 types of matches performed into separate functions which incorporate binary
  * searches, which should reduce CPU-memory traffic considerably.
  * update: preliminary profiling suggests this is ~40x faster.
+ *
+ * update: (x,_,z) still scanned all of (x,_,_) and (_,y,z) probed every span in idx.
+ * if we have perm, the rotated sort orders built by ngram3bin-compact, each of those
+ * is a contiguous range as well. perm may be NULL.
  */
-ngram3 * ngram3bin_like_better(ngram3 find, const struct ngram3map *m, ngram3bin_index *idx)
+ngram3 * ngram3bin_like_better(ngram3 find, const struct ngram3map *m, ngram3bin_index *idx,
+			       const ngram3bin_perm *perm)
 {
 	ngram3 *res = NULL;
 	unsigned long rescnt = 0;
 	rescnt = ngram3bin_like_xy_(find, m, &res, rescnt);
-	rescnt = ngram3bin_like_x_z(find, m, &res, rescnt);
-	rescnt = ngram3bin_like__yz(find, m, &res, rescnt, idx);
+	if (perm && perm->xzy.m)
+		rescnt = ngram3bin_like_perm(find, m, &res, rescnt, &perm->xzy, 0, 2);
+	else
+		rescnt = ngram3bin_like_x_z(find, m, &res, rescnt);
+	if (perm && perm->yzx.m)
+		rescnt = ngram3bin_like_perm(find, m, &res, rescnt, &perm->yzx, 1, 2);
+	else
+		rescnt = ngram3bin_like__yz(find, m, &res, rescnt, idx);
 	if (res)
 	{
 		if ((res = ngram3_find_spacefor1more(res, rescnt)))
@@ -253,31 +840,24 @@ static int ngram3cmp_xy_(const void *va, const void *vb)
 
 /*
  * find entries in m matching (x,y,_) from find
- * because m's contents are sorted we can use bsearch
+ * because m's contents are sorted we can binary search for the first of them
+ * update: a lower bound search lands at the start of the range; bsearch() could land
+ * anywhere in it, and we had to rewind, which we can't do in a block-encoded m
  */
 static unsigned long ngram3bin_like_xy_(ngram3 find, const struct ngram3map *m, ngram3 **res, unsigned long rescnt)
 {
-	const ngram3 *base = m->m;
-	const size_t nmemb = m->size / sizeof *base;
-	const ngram3 *bs = bsearch(&find, base, nmemb, sizeof *base, ngram3cmp_xy_);
-	if (bs)
+	ngram3cursor c;
+	int ok;
+	// seek forward from the first match, capturing all (contiguous) matches
+	for (ok = ngram3cursor_lower(&c, m, &find, ngram3cmp_xy_);
+	     ok && c.rec->id[0] == find.id[0] && c.rec->id[1] == find.id[1];
+	     ok = ngram3cursor_next(&c))
 	{
-		const ngram3 *end = (ngram3*)((char*)m->m + m->size);
-		// at least one x,y_ exists, but many may exist and we can't be certain
-		// where in that range we have landed
-		// rewind to the beginning of the range...
-		while (bs > base && (bs-1)->id[0] == find.id[0] && (bs-1)->id[1] == find.id[1])
-			bs--;
-		// ...and then seek forward, capturing all (contiguous) matches
-		while (bs < end && bs->id[0] == find.id[0] && bs->id[1] == find.id[1])
-		{
-			*res = ngram3_find_spacefor1more(*res, rescnt);
-			if (!*res)
-				break;
-			(*res)[rescnt] = *bs;
-			rescnt++;
-			bs++;
-		}
+		*res = ngram3_find_spacefor1more(*res, rescnt);
+		if (!*res)
+			break;
+		(*res)[rescnt] = *c.rec;
+		rescnt++;
 	}
 	return rescnt;
 }
@@ -292,32 +872,60 @@ static int ngram3cmp_x__(const void *va, const void *vb)
 
 /*
  * find entries in m matching (x,_,z) from find
- * because m's contents are sorted we can use bsearch
+ * because m's contents are sorted we can binary search for the start of (x,_,_)
  */
 static unsigned long ngram3bin_like_x_z(ngram3 find, const struct ngram3map *m, ngram3 **res, unsigned long rescnt)
 {
-	const ngram3 *base = m->m;
-	const size_t nmemb = m->size / sizeof *base;
-	const ngram3 *bs = bsearch(&find, base, nmemb, sizeof *base, ngram3cmp_x__);
-	if (bs)
+	ngram3cursor c;
+	int ok;
+	// seek forward through all (x,_,_),
+	// recording any (x,_,z) matches
+	for (ok = ngram3cursor_lower(&c, m, &find, ngram3cmp_x__);
+	     ok && c.rec->id[0] == find.id[0];
+	     ok = ngram3cursor_next(&c))
 	{
-		const ngram3 *end = (ngram3*)((char*)m->m + m->size);
-		// rewind to the beginning of (x,_,_) range...
-		while (bs > base && (bs-1)->id[0] == find.id[0])
-			bs--;
-		// and then seek forward through all (x,_,_),
-		// recording any (x,_,z) matches
-		while (bs < end && bs->id[0] == find.id[0])
+		if (c.rec->id[2] == find.id[2])
 		{
-			if (bs->id[2] == find.id[2])
-			{
-				*res = ngram3_find_spacefor1more(*res, rescnt);
-				if (!*res)
-					break;
-				(*res)[rescnt] = *bs;
-				rescnt++;
-			}
-			bs++;
+			*res = ngram3_find_spacefor1more(*res, rescnt);
+			if (!*res)
+				break;
+			(*res)[rescnt] = *c.rec;
+			rescnt++;
+		}
+	}
+	return rescnt;
+}
+
+/*
+ * ngram3bin_like__yz() for quantized maps: the records aren't ngram3s, but they are
+ * the same size as each other, so binary search each span
+ */
+static unsigned long ngram3q_like__yz(ngram3 find, const ngram3q *q,
+				      ngram3 **res, unsigned long rescnt, const uint32_t *span)
+{
+	const ngram3qrec *r = ngram3q_rec(q);
+	const uint32_t *freq = ngram3q_freq(q);
+	ngram3 cur;
+	for (; *span; r += *span, span++)
+	{
+		unsigned long lo = 0, hi = *span, mid;
+		ngram3q_decode(freq, r, &cur);
+		find.id[0] = cur.id[0]; // first id must match(!)
+		while (lo < hi)
+		{
+			mid = lo + (hi - lo) / 2;
+			ngram3q_decode(freq, r + mid, &cur);
+			if (ngram3cmp(&cur, &find) < 0)
+				lo = mid + 1;
+			else
+				hi = mid;
+		}
+		if (lo < *span)
+		{
+			ngram3q_decode(freq, r + lo, &cur);
+			if (!ngram3cmp(&cur, &find) &&
+			    (*res = ngram3_find_spacefor1more(*res, rescnt)))
+				(*res)[rescnt++] = cur;
 		}
 	}
 	return rescnt;
@@ -337,20 +945,43 @@ static unsigned long ngram3bin_like__yz(ngram3 find, const struct ngram3map *m,
 #	define SPAN_LARGE 16 // arbitrary, somewhat-reasonable number
 	uint32_t *span = idx->span;
 	const ngram3 *mcur = m->m;
-	while (*span)
+	const ngram3q *q = ngram3q_hdr(m);
+	if (q)
+		return ngram3q_like__yz(find, q, res, rescnt, span);
+	if (!ngram3bin_raw(m))
 	{
-		if (*span < SPAN_LARGE)
+		// spans are no use without random access to ngram3s; decode the lot
+		ngram3scan s;
+		const ngram3 *end;
+		ngram3scan_init(&s, m);
+		while ((mcur = ngram3scan_next(&s, &end)))
 		{
-			// small span, search sequentially
-			const ngram3 *mend = mcur + *span;
-			while (mcur < mend)
+			for (; mcur < end; mcur++)
 			{
 				if (mcur->id[1] == find.id[1] &&
 				    mcur->id[2] == find.id[2])
 				{
 					if ((*res = ngram3_find_spacefor1more(*res, rescnt)))
 						(*res)[rescnt++] = *mcur;
-					mcur = mend;
+				}
+			}
+		}
+		return rescnt;
+	}
+	while (*span)
+	{
+		if (*span < SPAN_LARGE)
+		{
+			// small span, search sequentially
+			const ngram3 *mend = mcur + *span;
+			while (mcur < mend)
+			{
+				if (mcur->id[1] == find.id[1] &&
+				    mcur->id[2] == find.id[2])
+				{
+					if ((*res = ngram3_find_spacefor1more(*res, rescnt)))
+						(*res)[rescnt++] = *mcur;
+					mcur = mend;
 					break;
 				}
 				mcur++;
@@ -374,19 +1005,90 @@ static unsigned long ngram3bin_like__yz(ngram3 find, const struct ngram3map *m,
 	return rescnt;
 }
 
+/*
+ * compare ids a and b of ngram3 x against key (ka,kb)
+ */
+static int ngram3cmp_ab(const ngram3 *x, int a, int b, uint32_t ka, uint32_t kb)
+{
+	if (x->id[a] != ka) return x->id[a] < ka ? -1 : 1;
+	if (x->id[b] != kb) return x->id[b] < kb ? -1 : 1;
+	return 0;
+}
+
+/*
+ * given perm, an array of offsets of the records in base sorted by (id[a],id[b],...),
+ * find the range of entries whose ids a and b match (ka,kb) with two binary searches:
+ * one for the first entry >= key and one for the first entry > key.
+ * return the number of matching entries and the first in *lo.
+ */
+static size_t ngram3perm_range(const struct ngram3map *base, const uint32_t *perm, size_t n,
+			       int a, int b, uint32_t ka, uint32_t kb, size_t *lo)
+{
+	size_t l = 0, h = n, m, hi;
+	ngram3 tmp;
+	while (l < h)
+	{
+		m = l + (h - l) / 2;
+		if (ngram3cmp_ab(ngram3bin_rec(base, perm[m], &tmp), a, b, ka, kb) < 0)
+			l = m + 1;
+		else
+			h = m;
+	}
+	*lo = l;
+	h = n;
+	while (l < h)
+	{
+		m = l + (h - l) / 2;
+		if (ngram3cmp_ab(ngram3bin_rec(base, perm[m], &tmp), a, b, ka, kb) <= 0)
+			l = m + 1;
+		else
+			h = m;
+	}
+	hi = l;
+	return hi - *lo;
+}
+
+/*
+ * find entries in m matching ids a and b of find, via perm; see ngram3bin_perm
+ */
+static unsigned long ngram3bin_like_perm(ngram3 find, const struct ngram3map *m,
+					 ngram3 **res, unsigned long rescnt,
+					 const struct ngram3map *perm, int a, int b)
+{
+	const uint32_t *p = ngram3sidecar_start(perm);
+	const size_t nmemb = ngram3sidecar_size(perm) / sizeof *p;
+	size_t lo, cnt = ngram3perm_range(m, p, nmemb, a, b, find.id[a], find.id[b], &lo);
+	ngram3 tmp;
+	p += lo;
+	while (cnt--)
+	{
+		*res = ngram3_find_spacefor1more(*res, rescnt);
+		if (!*res)
+			break;
+		(*res)[rescnt] = *ngram3bin_rec(m, *p, &tmp);
+		rescnt++;
+		p++;
+	}
+	return rescnt;
+}
+
 /*
  * sum ngram3 word frequencies in w.word[n].freq
  */
 void ngramword_totalfreqs(struct ngramword w, const struct ngram3map *m)
 {
-	ngram3 *cur = m->m;
-	const ngram3 *end = (ngram3*)((char*)cur + m->size);
-	while (cur < end)
+	ngram3scan s;
+	const ngram3 *cur, *end;
+	ngram3scan_init(&s, m);
+	while ((cur = ngram3scan_next(&s, &end)))
 	{
-		if (cur->id[0] < w.cnt) w.word[cur->id[0]].freq += cur->freq;
-		if (cur->id[1] < w.cnt) w.word[cur->id[1]].freq += cur->freq;
-		if (cur->id[2] < w.cnt) w.word[cur->id[2]].freq += cur->freq;
-		cur++;
+		while (cur < end)
+		{
+			if (cur->id[0] < w.cnt) w.word[cur->id[0]].freq += cur->freq;
+			if (cur->id[1] < w.cnt) w.word[cur->id[1]].freq += cur->freq;
+			if (cur->id[2] < w.cnt) w.word[cur->id[2]].freq += cur->freq;
+			cur++;
+		}
 	}
 	{
 		unsigned long i, cnt = w.cnt;
@@ -412,24 +1114,28 @@ int ngram3bin_index_init(ngram3bin_index *idx, const struct ngram3map *m, const
 	if (idx->span)
 	{
 		unsigned long spanidx = 0,
-                              spancnt = 1;
-		const ngram3 *cur = m->m;
-		const ngram3 *end = (ngram3*)((char*)cur + m->size);
-		const ngram3 *nxt = cur+1;
-		while (nxt < end)
+                              spancnt = 0;
+		ngram3scan s;
+		const ngram3 *cur, *end;
+		uint32_t prev = 0;
+		ngram3scan_init(&s, m);
+		while ((cur = ngram3scan_next(&s, &end)))
 		{
-			if (cur->id[0] == nxt->id[0])
-			{
-				spancnt++;
-			}
-			else
+			while (cur < end)
 			{
-				idx->span[spanidx] = spancnt;
-				spanidx++;
-				spancnt = 1;
+				if (!spancnt || cur->id[0] == prev)
+				{
+					spancnt++;
+				}
+				else
+				{
+					idx->span[spanidx] = spancnt;
+					spanidx++;
+					spancnt = 1;
+				}
+				prev = cur->id[0];
+				cur++;
 			}
-			cur = nxt;
-			nxt++;
 		}
 		idx->span[spanidx] = spancnt;
 		idx->span[spanidx+1] = 0; // sentinel
@@ -439,76 +1145,242 @@ int ngram3bin_index_init(ngram3bin_index *idx, const struct ngram3map *m, const
 
 void ngram3bin_index_fini(ngram3bin_index *idx)
 {
-	free(idx->span);
+	if (idx->totals.m)
+		ngram3bin_fini(idx->totals);
+	else
+		free(idx->span);
+}
+
+/*
+ * in place of ngramword_totalfreqs() and ngram3bin_index_init(), load their results
+ * from the totals sidecar, if there is an up-to-date one.
+ * return non-zero on success; on failure neither w nor idx are touched
+ */
+int ngram3bin_totals_init(ngram3bin_index *idx, struct ngramword w, const char *ngrampath,
+			  const struct ngram3map *m)
+{
+	struct ngram3map t = ngram3sidecar_init(ngrampath, NGRAM3TOTALS_SUFFIX,
+					NGRAM3TOTALS_MAGIC, NGRAM3TOTALS_VERSION, m);
+	const ngram3totals *hdr;
+	const uint32_t *freq;
+	unsigned long i;
+	if (!t.m)
+		return 0;
+	hdr = ngram3sidecar_start(&t);
+	freq = (const uint32_t *)(hdr + 1);
+	if (ngram3sidecar_size(&t) < sizeof *hdr ||
+	    hdr->wordcnt != w.cnt ||
+	    ngram3sidecar_size(&t) != sizeof *hdr + (hdr->wordcnt + hdr->spancnt + 1) * sizeof *freq)
+	{
+		fprintf(stderr, "%s%s: stale, ignoring\n", ngrampath, NGRAM3TOTALS_SUFFIX);
+		ngram3bin_fini(t);
+		return 0;
+	}
+	for (i = 0; i < w.cnt; i++)
+		w.word[i].freq = freq[i];
+	idx->span = (uint32_t *)(freq + hdr->wordcnt);
+	idx->totals = t;
+	return 1;
+}
+
+/*
+ * save the results of ngramword_totalfreqs() and ngram3bin_index_init() on m
+ */
+int ngram3bin_totals_write(FILE *f, struct ngramword w, const ngram3bin_index *idx,
+			   const struct ngram3map *m)
+{
+	ngram3totals hdr;
+	unsigned long i;
+	int ok = ngram3sidecar_write(f, NGRAM3TOTALS_MAGIC, NGRAM3TOTALS_VERSION, m);
+	hdr.wordcnt = w.cnt;
+	for (hdr.spancnt = 0; idx->span[hdr.spancnt]; hdr.spancnt++)
+		;
+	ok = ok && fwrite(&hdr, sizeof hdr, 1, f) == 1;
+	for (i = 0; ok && i < w.cnt; i++)
+	{
+		uint32_t freq = w.word[i].freq;
+		ok = fwrite(&freq, sizeof freq, 1, f) == 1;
+	}
+	return ok && fwrite(idx->span, sizeof *idx->span, hdr.spancnt + 1, f) == hdr.spancnt + 1;
+}
+
+void ngram3bin_perm_init(ngram3bin_perm *perm, const char *ngrampath, const struct ngram3map *m)
+{
+	perm->yzx = ngram3sidecar_init(ngrampath, NGRAM3PERM_YZX_SUFFIX,
+				       NGRAM3PERM_MAGIC, NGRAM3PERM_VERSION, m);
+	perm->xzy = ngram3sidecar_init(ngrampath, NGRAM3PERM_XZY_SUFFIX,
+				       NGRAM3PERM_MAGIC, NGRAM3PERM_VERSION, m);
+}
+
+void ngram3bin_perm_fini(ngram3bin_perm *perm)
+{
+	ngram3bin_fini(perm->yzx);
+	ngram3bin_fini(perm->xzy);
 }
 
 void ngram3bin_fini(struct ngram3map m)
 {
-	munmap(m.m, m.size);
-	close(m.fd);
+	if (m.m)
+		munmap(m.m, m.size);
+	if (m.fd != -1)
+		close(m.fd);
+}
+
+/*
+ * map the sidecar file ngrampath+suffix, if it exists and was built from ngram
+ * otherwise return an empty map
+ */
+struct ngram3map ngram3sidecar_init(const char *ngrampath, const char *suffix, uint32_t magic, uint32_t version,
+				    const struct ngram3map *ngram)
+{
+	struct ngram3map m = { NULL, -1, 0 };
+	char path[PATH_MAX];
+	if ((size_t)snprintf(path, sizeof path, "%s%s", ngrampath, suffix) < sizeof path &&
+	    !access(path, R_OK))
+	{
+		m = ngram3bin_init(path, 0);
+		if (m.m)
+		{
+			const ngram3sidecar *hdr = m.m;
+			if (m.size < sizeof *hdr ||
+			    hdr->magic != magic ||
+			    hdr->version != version ||
+			    hdr->ngramsize != ngram->size)
+			{
+				fprintf(stderr, "%s: stale, ignoring\n", path);
+				ngram3bin_fini(m);
+				m.m = NULL;
+				m.fd = -1;
+				m.size = 0;
+			}
+		}
+		else if (m.fd != -1)
+		{
+			close(m.fd);
+			m.fd = -1;
+		}
+	}
+	return m;
+}
+
+/*
+ * write a sidecar header tagging what follows as built from ngram
+ */
+int ngram3sidecar_write(FILE *f, uint32_t magic, uint32_t version, const struct ngram3map *ngram)
+{
+	ngram3sidecar hdr;
+	hdr.magic = magic;
+	hdr.version = version;
+	hdr.ngramsize = ngram->size;
+	return fwrite(&hdr, sizeof hdr, 1, f) == 1;
+}
+
+/*
+ * compare the first n ids of two ngramN records, in ngram3cmp()'s order
+ */
+int ngramncmp(const uint32_t *a, const uint32_t *b, unsigned n)
+{
+	unsigned i;
+	for (i = 0; i < n; i++)
+		if (a[i] != b[i])
+			return (int)(a[i] - b[i]);
+	return 0;
+}
+
+/*
+ * find the frequency of find->n ids in m, an ngramN.bin with N == find->n
+ */
+unsigned long ngramnbin_freq(const ngramn *find, const struct ngram3map *m)
+{
+	const size_t recsize = ngramn_recsize(find->n);
+	const char *base = m->m;
+	unsigned long long lo = 0, hi = m->m ? ngramn_cnt(m, find->n) : 0;
+	while (lo < hi)
+	{
+		const unsigned long long mid = lo + (hi - lo) / 2;
+		const uint32_t *rec = (const uint32_t *)(base + mid * recsize);
+		int cmp = ngramncmp(rec, find->id, find->n);
+		if (!cmp)
+			return rec[find->n];
+		if (cmp < 0)
+			lo = mid + 1;
+		else
+			hi = mid;
+	}
+	return 0;
 }
 
 /*
- * sort descending by frequency
+ * sort descending by frequency, then ascending by id
  */
 static int follows_cmp(const void *va, const void *vb)
 {
 	const ngram3 *a = va,
 	             *b = vb;
-	return (int)(b->freq - a->freq);
+	if (a->freq != b->freq)
+		return a->freq < b->freq ? 1 : -1;
+	return a->id[0] < b->id[0] ? -1 : a->id[0] > b->id[0];
 }
 
 /*
- * given a single word, return a list of words follow and their frequency
+ * the words next to fid, in the direction dir: with dir=1 the word after each
+ * (fid,a,_), or failing that (_,fid,a); with dir=-1 the word before each
+ * (_,a,fid), or failing that (a,fid,_)
  */
-ngram3 * ngram3bin_follows(const ngram3 *find, const struct ngram3map *m)
+static ngram3 * ngram3bin_adjacent(uint32_t fid, const struct ngram3map *m, int dir)
 {
-	uint32_t fid = find->id[0];
+	const int first = dir > 0 ? 0 : 2;
 	unsigned long ngcnt = 0;
-	ngram3 *cur = m->m;
-	const ngram3 *end = (ngram3*)((char*)cur + m->size);
+	ngram3scan s;
+	const ngram3 *cur, *end;
 	ngram3 *res = NULL;
-	while (cur < end)
+	ngram3scan_init(&s, m);
+	// stop if an allocation failed
+	while ((res || !ngcnt) && (cur = ngram3scan_next(&s, &end)))
 	{
-		int foundindex;
-		if (cur->id[0] == fid)
-			foundindex = 1;
-		else if (cur->id[1] == fid)
-			foundindex = 2;
-		else
-			foundindex = 0;
-
-		if (foundindex)
+		for (; cur < end; cur++)
 		{
-			int i;
-			// linear scan for already found...
-			for (i = 0; i < ngcnt; i++)
+			int foundindex;
+			if (cur->id[first] == fid)
+				foundindex = 1;
+			else if (cur->id[1] == fid)
+				foundindex = 1 + dir;
+			else
+				foundindex = -1;
+
+			if (foundindex >= 0)
 			{
-				if (res[i].id[0] == cur->id[foundindex])
+				int i;
+				// linear scan for already found...
+				for (i = 0; i < ngcnt; i++)
 				{
-					res[i].freq++;
-					if (i > 0 && res[i].freq > res[i-1].freq * 2)
+					if (res[i].id[0] == cur->id[foundindex])
 					{
-						// bring most common entries to front of list
-						ngram3 tmp = res[i];
-						res[i] = res[i-1];
-						res[i-1] = tmp;
+						res[i].freq++;
+						if (i > 0 && res[i].freq > res[i-1].freq * 2)
+						{
+							// bring most common entries to front of list
+							ngram3 tmp = res[i];
+							res[i] = res[i-1];
+							res[i-1] = tmp;
+						}
+						break;
 					}
-					break;
 				}
-			}
-			// didn't find, add another entry to list
-			if (i == ngcnt)
-			{
-				res = ngram3_find_spacefor1more(res, ngcnt);
-				if (!res)
-					break;
-				res[ngcnt].id[0] = cur->id[foundindex];
-				res[ngcnt].freq = 1;
-				ngcnt++;
+				// didn't find, add another entry to list
+				if (i == ngcnt)
+				{
+					res = ngram3_find_spacefor1more(res, ngcnt);
+					if (!res)
+						break;
+					res[ngcnt].id[0] = cur->id[foundindex];
+					res[ngcnt].id[1] = 0;
+					res[ngcnt].id[2] = 0;
+					res[ngcnt].freq = 1;
+					ngcnt++;
+				}
 			}
 		}
-		cur++;
 	}
 	if (res)
 	{
@@ -523,6 +1395,587 @@ ngram3 * ngram3bin_follows(const ngram3 *find, const struct ngram3map *m)
 	return res;
 }
 
+/*
+ * given a single word, return a list of words follow and their frequency
+ */
+ngram3 * ngram3bin_follows(const ngram3 *find, const struct ngram3map *m)
+{
+	return ngram3bin_adjacent(find->id[0], m, 1);
+}
+
+/*
+ * given a single word, return a list of words that precede it and their frequency
+ */
+ngram3 * ngram3bin_precedes(const ngram3 *find, const struct ngram3map *m)
+{
+	return ngram3bin_adjacent(find->id[0], m, -1);
+}
+
+/*
+ * map ngrampath's .follows or .precedes sidecar, if it has an up-to-date one
+ */
+struct ngram3map ngram3adj_init(const char *ngrampath, const char *suffix, const struct ngram3map *m)
+{
+	struct ngram3map a = ngram3sidecar_init(ngrampath, suffix, NGRAM3ADJ_MAGIC, NGRAM3ADJ_VERSION, m);
+	const ngram3adj *hdr;
+	const uint64_t *off;
+	unsigned long long size;
+	if (!a.m)
+		return a;
+	hdr = ngram3sidecar_start(&a);
+	off = (const uint64_t *)(hdr + 1);
+	size = ngram3sidecar_size(&a);
+	if (size < sizeof *hdr ||
+	    size < sizeof *hdr + (hdr->wordcnt + 1ULL) * sizeof *off ||
+	    size != sizeof *hdr + (hdr->wordcnt + 1ULL) * sizeof *off + off[hdr->wordcnt] * sizeof(ngram3adjent))
+	{
+		fprintf(stderr, "%s%s: stale, ignoring\n", ngrampath, suffix);
+		ngram3bin_fini(a);
+		a.m = NULL;
+		a.fd = -1;
+		a.size = 0;
+	}
+	return a;
+}
+
+/*
+ * ngram3bin_follows() or ngram3bin_precedes() of find, whichever adj was built for,
+ * though no more than its topn of them
+ */
+ngram3 * ngram3adj_get(const ngram3 *find, const struct ngram3map *adj)
+{
+	const ngram3adj *hdr = ngram3sidecar_start(adj);
+	const uint64_t *off = (const uint64_t *)(hdr + 1);
+	const ngram3adjent *ent = (const ngram3adjent *)(off + hdr->wordcnt + 1);
+	const uint32_t id = find->id[0];
+	unsigned long i, cnt = id < hdr->wordcnt ? off[id + 1] - off[id] : 0;
+	ngram3 *res = malloc((cnt + 1) * sizeof *res);
+	if (!res)
+		return NULL;
+	for (i = 0; i < cnt; i++)
+	{
+		res[i].id[0] = ent[off[id] + i].id;
+		res[i].id[1] = 0;
+		res[i].id[2] = 0;
+		res[i].freq = ent[off[id] + i].freq;
+	}
+	res[cnt].freq = 0; // sentinel
+	return res;
+}
+
+/*
+ * the order of each word's list in the .follows and .precedes sidecars,
+ * the same as ngram3bin_follows() results
+ */
+int ngram3adjent_cmp(const void *va, const void *vb)
+{
+	const ngram3adjent *a = va,
+			   *b = vb;
+	if (a->freq != b->freq)
+		return a->freq < b->freq ? 1 : -1;
+	return a->id < b->id ? -1 : a->id > b->id;
+}
+
+/*
+ * the .splits sidecar next to ngrampath, if it was built from m and word.bin
+ * has wordcnt words
+ */
+struct ngram3map ngram3split_init(const char *ngrampath, const struct ngram3map *m, unsigned long wordcnt)
+{
+	struct ngram3map s = ngram3sidecar_init(ngrampath, NGRAM3SPLIT_SUFFIX,
+						NGRAM3SPLIT_MAGIC, NGRAM3SPLIT_VERSION, m);
+	const ngram3split *hdr;
+	unsigned long long size;
+	if (!s.m)
+		return s;
+	hdr = ngram3sidecar_start(&s);
+	size = ngram3sidecar_size(&s);
+	if (size < sizeof *hdr ||
+	    hdr->wordcnt != wordcnt ||
+	    size < sizeof *hdr + (hdr->wordcnt + 1ULL) * sizeof(uint64_t) ||
+	    size != sizeof *hdr + (hdr->wordcnt + 1ULL) * sizeof(uint64_t) +
+		    ngram3split_off(hdr)[hdr->wordcnt] * sizeof(ngram3splitent))
+	{
+		fprintf(stderr, "%s%s: stale, ignoring\n", ngrampath, NGRAM3SPLIT_SUFFIX);
+		ngram3bin_fini(s);
+		s.m = NULL;
+		s.fd = -1;
+		s.size = 0;
+	}
+	return s;
+}
+
+/*
+ * word id's splits, *cnt of them, most frequent first
+ */
+const ngram3splitent * ngram3split_get(uint32_t id, const struct ngram3map *split, size_t *cnt)
+{
+	const ngram3split *hdr = ngram3sidecar_start(split);
+	const uint64_t *off = ngram3split_off(hdr);
+	*cnt = id < hdr->wordcnt ? off[id + 1] - off[id] : 0;
+	return *cnt ? ngram3split_ent(hdr) + off[id] : NULL;
+}
+
+/*
+ * the order of each word's list in the .splits sidecar
+ */
+int ngram3splitent_cmp(const void *va, const void *vb)
+{
+	const ngram3splitent *a = va,
+			     *b = vb;
+	unsigned i;
+	if (a->freq != b->freq)
+		return a->freq < b->freq ? 1 : -1;
+	for (i = 0; i < 3; i++)
+		if (a->id[i] != b->id[i])
+			return a->id[i] < b->id[i] ? -1 : 1;
+	return 0;
+}
+
+/*
+ * FNV-1a of the characters of s starting at off[0..chars), except skip1 and skip2
+ */
+static uint32_t ngramdel_hash(const char *s, const unsigned *off, unsigned chars,
+			      unsigned skip1, unsigned skip2)
+{
+	uint32_t h = 2166136261U;
+	unsigned c, i;
+	for (c = 0; c < chars; c++)
+		if (c != skip1 && c != skip2)
+			for (i = off[c]; i < off[c + 1]; i++)
+				h = (h ^ (unsigned char)s[i]) * 16777619U;
+	return h;
+}
+
+/*
+ * the hash of every deletion of at most maxdist characters from the first prefix
+ * characters of word, in hash; return how many. some may be the same
+ */
+unsigned ngramdel_hashes(const char *word, unsigned len, unsigned prefix, unsigned maxdist,
+			 uint32_t hash[NGRAMDEL_VARMAX])
+{
+	unsigned off[NGRAMDEL_PREFIXMAX + 1];
+	unsigned chars = 0, i = 0, j, n = 0;
+	if (prefix > NGRAMDEL_PREFIXMAX)
+		prefix = NGRAMDEL_PREFIXMAX;
+	// where each character starts, and where the last one ends
+	while (i < len && chars < prefix)
+	{
+		off[chars++] = i;
+		do
+			i++;
+		while (i < len && ((unsigned char)word[i] & 0xc0) == 0x80);
+	}
+	off[chars] = i;
+	hash[n++] = ngramdel_hash(word, off, chars, chars, chars);
+	for (i = 0; maxdist >= 1 && i < chars; i++)
+	{
+		hash[n++] = ngramdel_hash(word, off, chars, i, chars);
+		for (j = i + 1; maxdist >= 2 && j < chars; j++)
+			hash[n++] = ngramdel_hash(word, off, chars, i, j);
+	}
+	return n;
+}
+
+/*
+ * map wordpath's deletion index, if it has a current one
+ */
+struct ngram3map ngramdel_init(const char *wordpath, const struct ngram3map *wordmap)
+{
+	struct ngram3map d = ngram3sidecar_init(wordpath, NGRAMDEL_SUFFIX, NGRAMDEL_MAGIC, NGRAMDEL_VERSION, wordmap);
+	const ngramdel *hdr;
+	unsigned long long size;
+	if (!d.m)
+		return d;
+	hdr = ngram3sidecar_start(&d);
+	size = ngram3sidecar_size(&d);
+	if (size < sizeof *hdr ||
+	    hdr->prefix > NGRAMDEL_PREFIXMAX ||
+	    hdr->maxdist > NGRAMDEL_MAXDIST ||
+	    hdr->bits > 30 ||
+	    size < sizeof *hdr + ((1ULL << hdr->bits) + 1) * sizeof(uint64_t) ||
+	    size != sizeof *hdr + ((1ULL << hdr->bits) + 1) * sizeof(uint64_t) +
+		    ngramdel_dir(hdr)[1UL << hdr->bits] * sizeof(ngramdelent))
+	{
+		fprintf(stderr, "%s%s: stale, ignoring\n", wordpath, NGRAMDEL_SUFFIX);
+		ngram3bin_fini(d);
+		d.m = NULL;
+		d.fd = -1;
+		d.size = 0;
+	}
+	return d;
+}
+
+static int uint32_cmp(const void *va, const void *vb)
+{
+	const uint32_t a = *(const uint32_t *)va,
+		       b = *(const uint32_t *)vb;
+	return a < b ? -1 : a > b;
+}
+
+static unsigned utf8_chars(const char *s, unsigned len)
+{
+	unsigned n = 0;
+	while (len--)
+		n += ((unsigned char)*s++ & 0xc0) != 0x80;
+	return n;
+}
+
+/*
+ * the ids of the words in del, the deletion index of w, that might be within maxdist
+ * edits of word: sorted, without duplicates, and none more than maxdist characters
+ * longer or shorter. maxdist must be no more than del's. malloc'd, *cnt of them,
+ * or NULL if there are none or we ran out of memory
+ */
+uint32_t * ngramdel_lookup(const char *word, unsigned len, unsigned maxdist,
+			   const struct ngram3map *del, const struct ngramword *w, size_t *cnt)
+{
+	const ngramdel *hdr = ngram3sidecar_start(del);
+	const uint64_t *dir = ngramdel_dir(hdr);
+	const ngramdelent *ent = ngramdel_ent(hdr);
+	const unsigned wlen = utf8_chars(word, len);
+	uint32_t hash[NGRAMDEL_VARMAX], *res = NULL;
+	size_t rescnt = 0, resmax = 0, i, j;
+	unsigned n = ngramdel_hashes(word, len, hdr->prefix, maxdist, hash);
+	for (i = 0; i < n; i++)
+	{
+		const uint64_t b = (uint64_t)hash[i] >> (32 - hdr->bits);
+		uint64_t lo = dir[b], hi = dir[b + 1];
+		// lower bound of hash[i] in its bucket
+		while (lo < hi)
+		{
+			const uint64_t mid = lo + (hi - lo) / 2;
+			if (ent[mid].hash < hash[i])
+				lo = mid + 1;
+			else
+				hi = mid;
+		}
+		for (; lo < dir[b + 1] && ent[lo].hash == hash[i]; lo++)
+		{
+			const uint32_t id = ent[lo].id;
+			unsigned idlen;
+			if (id >= w->cnt)
+				continue;
+			idlen = utf8_chars(w->word[id].str, w->word[id].len);
+			if (idlen + maxdist < wlen || wlen + maxdist < idlen)
+				continue;
+			if (rescnt == resmax)
+			{
+				size_t newmax = resmax ? resmax * 2 : 64;
+				uint32_t *tmp = realloc(res, newmax * sizeof *res);
+				if (!tmp)
+				{
+					free(res);
+					*cnt = 0;
+					return NULL;
+				}
+				res = tmp;
+				resmax = newmax;
+			}
+			res[rescnt++] = id;
+		}
+	}
+	if (rescnt)
+	{
+		qsort(res, rescnt, sizeof *res, uint32_cmp);
+		for (i = j = 1; i < rescnt; i++)
+			if (res[i] != res[j - 1])
+				res[j++] = res[i];
+		rescnt = j;
+	}
+	*cnt = rescnt;
+	return res;
+}
+
+/*
+ * map wordpath's trie, if it has a current one
+ */
+struct ngram3map ngramtrie_init(const char *wordpath, const struct ngram3map *wordmap)
+{
+	struct ngram3map t = ngram3sidecar_init(wordpath, NGRAMTRIE_SUFFIX, NGRAMTRIE_MAGIC, NGRAMTRIE_VERSION, wordmap);
+	const ngramtrie *hdr;
+	unsigned long long size;
+	if (!t.m)
+		return t;
+	hdr = ngram3sidecar_start(&t);
+	size = ngram3sidecar_size(&t);
+	if (size < sizeof *hdr ||
+	    !hdr->nodecnt ||
+	    hdr->depth > NGRAMTRIE_DEPTHMAX ||
+	    size != sizeof *hdr + (hdr->nodecnt + 1ULL) * sizeof(ngramtrienode) +
+		    (unsigned long long)hdr->edgecnt * sizeof(ngramtrieedge) ||
+	    ngramtrie_node(hdr)[hdr->nodecnt].edge != hdr->edgecnt)
+	{
+		fprintf(stderr, "%s%s: stale, ignoring\n", wordpath, NGRAMTRIE_SUFFIX);
+		ngram3bin_fini(t);
+		t.m = NULL;
+		t.fd = -1;
+		t.size = 0;
+	}
+	return t;
+}
+
+/*
+ * the code points of utf-8 word in ch, at most chmax of them; return how many there
+ * are in all. a byte that doesn't start a well-formed character is one by itself
+ */
+unsigned ngramtrie_decode(const char *word, unsigned len, uint32_t *ch, unsigned chmax)
+{
+	const unsigned char *s = (const unsigned char *)word;
+	unsigned i = 0, n = 0;
+	while (i < len)
+	{
+		uint32_t c = s[i];
+		unsigned more = c >= 0xf0 && c < 0xf8 ? 3 : c >= 0xe0 && c < 0xf0 ? 2 : c >= 0xc0 && c < 0xe0 ? 1 : 0,
+			 j;
+		for (j = 1; j <= more; j++)
+			if (i + j >= len || (s[i + j] & 0xc0) != 0x80)
+				break;
+		if (j > more && more)
+		{
+			c &= 0x3f >> more;
+			for (j = 1; j <= more; j++)
+				c = (c << 6) | (s[i + j] & 0x3f);
+			i += more;
+		}
+		i++;
+		if (n < chmax)
+			ch[n] = c;
+		n++;
+	}
+	return n;
+}
+
+/*
+ * the state of one ngramtrie_within(). row i of d is the distance from each prefix
+ * of the query to the i characters of the path down to the current node, and row i
+ * of last is, for each character of the query, the deepest row <= i whose path
+ * character is the same, which the transpositions need
+ */
+struct ngramtrie_walk
+{
+	const ngramtrie *hdr;
+	const struct ngramword *w;
+	const uint32_t *q;
+	unsigned qlen,
+		 maxdist,
+		 *d,
+		 *last;
+	ngramtriehit *hit;
+	size_t hitcnt,
+	       hitmax;
+	int nomem;
+};
+
+static void ngramtrie_hit(struct ngramtrie_walk *t, uint32_t id, unsigned dist)
+{
+	if (id == UNKNOWN_ID || id >= t->w->cnt || t->nomem)
+		return;
+	if (t->hitcnt == t->hitmax)
+	{
+		size_t newmax = t->hitmax ? t->hitmax * 2 : 64;
+		ngramtriehit *tmp = realloc(t->hit, newmax * sizeof *tmp);
+		if (!tmp)
+		{
+			t->nomem = 1;
+			return;
+		}
+		t->hit = tmp;
+		t->hitmax = newmax;
+	}
+	t->hit[t->hitcnt].id = id;
+	t->hit[t->hitcnt].dist = dist;
+	t->hit[t->hitcnt].freq = t->w->word[id].freq;
+	t->hitcnt++;
+}
+
+/*
+ * fill in row i + 1 for each child of node and visit those it can't rule out.
+ * bound is no more than any distance below node: the least of row i and, since a
+ * transposition from row r costs at least i - r more by the time it gets here,
+ * of each earlier row's least plus how far above it is. the distance is
+ * unrestricted damerau-levenshtein, per lowrance and wagner
+ */
+static void ngramtrie_visit(struct ngramtrie_walk *t, uint32_t node, unsigned i, unsigned bound)
+{
+	const ngramtrienode *nodes = ngramtrie_node(t->hdr);
+	const ngramtrieedge *e = ngramtrie_edge(t->hdr) + nodes[node].edge,
+			    *end = ngramtrie_edge(t->hdr) + nodes[node + 1].edge;
+	const unsigned W = t->qlen + 1;
+	const unsigned *prev = t->d + i * W,
+		       *lprev = t->last + i * W;
+	unsigned *cur = t->d + (i + 1) * W,
+		 *lcur = t->last + (i + 1) * W;
+	if (i >= t->hdr->depth)
+		return;
+	for (; e < end; e++)
+	{
+		unsigned j, db = 0, rowmin = i + 1;
+		if (e->node >= t->hdr->nodecnt)
+			continue;
+		cur[0] = i + 1;
+		for (j = 1; j < W; j++)
+		{
+			const unsigned k = lprev[j],
+				       l = db;
+			unsigned v = cur[j - 1] + 1;
+			if (t->q[j - 1] == e->ch)
+			{
+				lcur[j] = i + 1;
+				db = j;
+				if (prev[j - 1] < v)
+					v = prev[j - 1];
+			}
+			else
+			{
+				lcur[j] = k;
+				if (prev[j - 1] + 1 < v)
+					v = prev[j - 1] + 1;
+			}
+			if (prev[j] + 1 < v)
+				v = prev[j] + 1;
+			if (k && l)
+			{
+				// swap q[l-1] with path[k], with whatever's between them inserted or deleted
+				const unsigned tr = t->d[(k - 1) * W + l - 1] + (i - k) + 1 + (j - l - 1);
+				if (tr < v)
+					v = tr;
+			}
+			cur[j] = v;
+			if (v < rowmin)
+				rowmin = v;
+		}
+		if (cur[t->qlen] <= t->maxdist)
+			ngramtrie_hit(t, nodes[e->node].id, cur[t->qlen]);
+		if (rowmin > bound + 1)
+			rowmin = bound + 1;
+		if (rowmin <= t->maxdist)
+			ngramtrie_visit(t, e->node, i + 1, rowmin);
+	}
+}
+
+static int ngramtriehit_cmp(const void *va, const void *vb)
+{
+	const ngramtriehit *a = va,
+			   *b = vb;
+	if (a->freq != b->freq)
+		return a->freq > b->freq ? -1 : 1;
+	if (a->dist != b->dist)
+		return a->dist < b->dist ? -1 : 1;
+	return a->id < b->id ? -1 : a->id > b->id;
+}
+
+/*
+ * every word of w within maxdist edits of word, walking its trie: insertions,
+ * deletions, substitutions and transpositions of adjacent characters, which may be
+ * edited again. ordered most frequent first, then nearest, then by id. malloc'd,
+ * *cnt of them, or NULL if there are none or we ran out of memory
+ */
+ngramtriehit * ngramtrie_within(const char *word, unsigned len, unsigned maxdist,
+				const struct ngram3map *trie, const struct ngramword *w, size_t *cnt)
+{
+	struct ngramtrie_walk t;
+	const ngramtrienode *nodes;
+	uint32_t *q;
+	unsigned j;
+	*cnt = 0;
+	t.hdr = ngram3sidecar_start(trie);
+	t.w = w;
+	t.maxdist = maxdist;
+	t.hit = NULL;
+	t.hitcnt = t.hitmax = 0;
+	t.nomem = 0;
+	nodes = ngramtrie_node(t.hdr);
+	if (!(q = malloc((len + 1) * sizeof *q)))
+		return NULL;
+	t.q = q;
+	t.qlen = ngramtrie_decode(word, len, q, len);
+	t.d = malloc((t.hdr->depth + 1ULL) * (t.qlen + 1) * sizeof *t.d);
+	t.last = malloc((t.hdr->depth + 1ULL) * (t.qlen + 1) * sizeof *t.last);
+	if (t.d && t.last)
+	{
+		for (j = 0; j <= t.qlen; j++)
+		{
+			t.d[j] = j;
+			t.last[j] = 0;
+		}
+		if (t.qlen <= maxdist)
+			ngramtrie_hit(&t, nodes[0].id, t.qlen);
+		ngramtrie_visit(&t, 0, 0, 0);
+	}
+	else
+	{
+		t.nomem = 1;
+	}
+	free(t.last);
+	free(t.d);
+	free(q);
+	if (t.nomem)
+	{
+		free(t.hit);
+		return NULL;
+	}
+	if (t.hitcnt)
+		qsort(t.hit, t.hitcnt, sizeof *t.hit, ngramtriehit_cmp);
+	*cnt = t.hitcnt;
+	return t.hit;
+}
+
+/*
+ * the optimal string alignment distance between a and b: insertions, deletions,
+ * substitutions and transpositions of adjacent characters, none of them edited
+ * again. maxdist + 1 as soon as it must be more than maxdist.
+ * row has room for 3 * (blen + 1)
+ */
+unsigned ngram_damlev(const uint32_t *a, unsigned alen, const uint32_t *b, unsigned blen,
+		      unsigned maxdist, unsigned *row)
+{
+	unsigned *twoago = row,
+		 *oneago = row + blen + 1,
+		 *cur = row + 2 * (blen + 1),
+		 *tmp;
+	unsigned i, j, prevmin = 0;
+	// what they share at either end costs nothing
+	while (alen && blen && *a == *b)
+		a++, b++, alen--, blen--;
+	while (alen && blen && a[alen - 1] == b[blen - 1])
+		alen--, blen--;
+	if ((alen > blen ? alen - blen : blen - alen) > maxdist)
+		return maxdist + 1;
+	if (!alen || !blen)
+		return alen + blen;
+	for (j = 0; j <= blen; j++)
+		oneago[j] = j;
+	for (i = 1; i <= alen; i++)
+	{
+		unsigned rowmin = cur[0] = i;
+		for (j = 1; j <= blen; j++)
+		{
+			const unsigned cost = a[i - 1] != b[j - 1];
+			unsigned v = oneago[j - 1] + cost;
+			if (oneago[j] + 1 < v)
+				v = oneago[j] + 1;
+			if (cur[j - 1] + 1 < v)
+				v = cur[j - 1] + 1;
+			if (cost && i > 1 && j > 1 && a[i - 1] == b[j - 2] && a[i - 2] == b[j - 1] &&
+			    twoago[j - 2] + 1 < v)
+				v = twoago[j - 2] + 1;
+			cur[j] = v;
+			if (v < rowmin)
+				rowmin = v;
+		}
+		// no later row can do better than this one, or the one before it plus a transposition
+		if (rowmin > maxdist && prevmin + 1 > maxdist)
+			return maxdist + 1;
+		prevmin = rowmin;
+		tmp = twoago;
+		twoago = oneago;
+		oneago = cur;
+		cur = tmp;
+	}
+	return oneago[blen] > maxdist ? maxdist + 1 : oneago[blen];
+}
+
 #ifdef TEST
 
 /*
@@ -8,6 +8,7 @@
 
 #include <stdio.h>
 #include <stdint.h>
+#include <string.h>
 
 #define UNKNOWN_ID (0)
 #define IMPOSSIBLE_ID (~0)
@@ -30,6 +31,9 @@ struct ngramword
 		unsigned freq;
 		const char *str;
 	} *word;
+	const char *base;	/* start of word.bin */
+	const uint32_t *off;	/* lookup section, if word.bin has one; see ngramwordtrailer */
+	const uint32_t *sorted;
 };
 
 #pragma pack(push, 1)
@@ -42,6 +46,28 @@ typedef struct ngramwordcursor ngramwordcursor;
 #define ngramwordcursor_str(cur)  ((char *)(cur) + sizeof *(cur))
 #define ngramwordcursor_next(cur) (void *)((char *)(ngramwordcursor_str(cur) + ((cur)->len + (1 + ((cur)->len+1) % 4))))
 
+/*
+ * word.bin may end with a lookup section, written by import2bin-word.py:
+ *	[word entries, padded to a multiple of 4 bytes]
+ *	uint32_t off[cnt];	byte offset of each id's entry
+ *	uint32_t sorted[cnt];	ids, sorted bytewise by word
+ *	ngramwordtrailer
+ * which lets us resolve word -> id with a binary search over the shared, read-only
+ * mapping instead of building a dictionary of the vocabulary in every process
+ */
+#pragma pack(push, 1)
+typedef struct
+{
+	uint64_t wordsize;	/* bytes of word entries, including padding */
+	uint32_t cnt,
+		 magic,
+		 version;
+} ngramwordtrailer;
+#pragma pack(pop)
+
+#define NGRAMWORD_MAGIC		0x4e475744 /* "NGWD" */
+#define NGRAMWORD_VERSION	1
+
 #pragma pack(push, 1)
 typedef struct
 {
@@ -57,12 +83,441 @@ typedef struct
  *
  * note: we don't need to track which id each span represents, we
  * can retrieve it when necessary; we just need the number of records
+ *
+ * if span was loaded from the totals sidecar it points into totals, otherwise
+ * it was allocated by ngram3bin_index_init() and totals is empty
  */
 typedef struct
 {
 	uint32_t *span;
+	struct ngram3map totals;
 } ngram3bin_index;
 
+/*
+ * sidecar files are derived from ngram3.bin by ngram3bin-compact and live next to it,
+ * named ngram3.bin + suffix. each begins with this header; the size of the ngram3.bin
+ * it was built from lets us detect a sidecar left over from a previous build, in which
+ * case we ignore it and fall back to working from ngram3.bin alone
+ */
+#pragma pack(push, 1)
+typedef struct
+{
+	uint32_t magic,
+		 version;
+	uint64_t ngramsize;
+} ngram3sidecar;
+#pragma pack(pop)
+
+#define ngram3sidecar_start(map) ((void *)((char *)((map)->m) + sizeof(ngram3sidecar)))
+#define ngram3sidecar_size(map) ((map)->size - sizeof(ngram3sidecar))
+
+/*
+ * bigram table: every (x,y) and the summed frequency of (x,y,_) and (_,x,y),
+ * i.e. exactly what ngram3bin_freq2() calculates, sorted by (x,y)
+ */
+#pragma pack(push, 1)
+typedef struct
+{
+	uint32_t id[2];
+	uint64_t freq;
+} ngram2;
+#pragma pack(pop)
+
+#define NGRAM2BIN_SUFFIX	".bigram"
+#define NGRAM2BIN_MAGIC		0x4e473242 /* "NG2B" */
+#define NGRAM2BIN_VERSION	1
+
+/*
+ * ngram3.bin rotated into other sort orders, stored as arrays of uint32_t record
+ * offsets into ngram3.bin. sorted by (y,z,x) all (_,y,z) are contiguous, and
+ * sorted by (x,z,y) so are all (x,_,z), which lets ngram3bin_like_better() find
+ * each with two binary searches instead of scanning.
+ * either may be missing, in which case we fall back to ngram3bin_index
+ */
+typedef struct
+{
+	struct ngram3map yzx,
+			 xzy;
+} ngram3bin_perm;
+
+#define NGRAM3PERM_YZX_SUFFIX	".yzx"
+#define NGRAM3PERM_XZY_SUFFIX	".xzy"
+#define NGRAM3PERM_MAGIC	0x4e473350 /* "NG3P" */
+#define NGRAM3PERM_VERSION	1
+
+/*
+ * the results of ngramword_totalfreqs() and ngram3bin_index_init(), which each
+ * take a full pass over ngram3.bin, saved by ngram3bin-compact so that opening
+ * ngram3.bin needn't touch every page of it. following the sidecar header:
+ *	uint32_t wordcnt, spancnt;
+ *	uint32_t freq[wordcnt];
+ *	uint32_t span[spancnt + 1]; // including the 0 sentinel
+ * wordcnt must match word.bin or the sidecar is considered stale
+ */
+#pragma pack(push, 1)
+typedef struct
+{
+	uint32_t wordcnt,
+		 spancnt;
+} ngram3totals;
+#pragma pack(pop)
+
+#define NGRAM3TOTALS_SUFFIX	".totals"
+#define NGRAM3TOTALS_MAGIC	0x4e473354 /* "NG3T" */
+#define NGRAM3TOTALS_VERSION	1
+
+/*
+ * blocked bloom filter over every (x,y,z) in ngram3.bin. most of the ngram3s we look
+ * up aren't there, and the filter answers those from one cache line of itself
+ * instead of a binary search through ngram3.bin. following the sidecar header:
+ *	ngram3bloom
+ *	uint64_t bits[blockcnt * 8];	512-bit blocks; each ngram3 sets k bits of one
+ * ngram3bin-compact sizes it for a given false-positive rate
+ */
+#pragma pack(push, 1)
+typedef struct
+{
+	uint64_t blockcnt;
+	uint32_t k,
+		 pad[9];	/* to 64 bytes with the sidecar header, aligning bits */
+} ngram3bloom;
+#pragma pack(pop)
+
+#define NGRAM3BLOOM_SUFFIX	".bloom"
+#define NGRAM3BLOOM_MAGIC	0x4e473346 /* "NG3F" */
+#define NGRAM3BLOOM_VERSION	1
+#define NGRAM3BLOOM_FPRATE	0.01
+#define NGRAM3BLOOM_KMAX	16
+
+/*
+ * tallies of ngram3bin_freq_bloom() lookups
+ */
+typedef struct
+{
+	unsigned long rejected,	/* answered by the filter alone */
+		      passed,	/* the filter let through to a search */
+		      falsepos;	/* ...which then found nothing */
+} ngram3bloom_stats;
+
+/*
+ * for each word, the topn words that most often follow it, counted as
+ * ngram3bin_follows() counts them: one for each record (w,a,_), and for each (_,w,a)
+ * whose first two ids differ. the .precedes sidecar is the same for the words before
+ * it, i.e. what follows it in the text reversed. each word's list is ordered most
+ * frequent first, then by id. following the sidecar header:
+ *	ngram3adj
+ *	uint64_t off[wordcnt + 1];	where each word's list starts in ent
+ *	ngram3adjent ent[off[wordcnt]];
+ * which turns a scan of all of ngram3.bin into a couple of loads
+ */
+#pragma pack(push, 1)
+typedef struct
+{
+	uint32_t wordcnt,	/* highest id in ngram3.bin + 1 */
+		 topn;		/* most entries kept per word */
+} ngram3adj;
+
+typedef struct
+{
+	uint32_t id,
+		 freq;
+} ngram3adjent;
+#pragma pack(pop)
+
+#define NGRAM3FOLLOWS_SUFFIX	".follows"
+#define NGRAM3PRECEDES_SUFFIX	".precedes"
+#define NGRAM3ADJ_MAGIC		0x4e473341 /* "NG3A" */
+#define NGRAM3ADJ_VERSION	1
+#define NGRAM3ADJ_TOPN		64
+
+/*
+ * for each word, the ways it splits into two or three words, each at least minfreq
+ * frequent, that appear together: (x,y) or (x,y,z) with a frequency, looked up as
+ * ngram3bin_freq_many() does. they are what a word run together ("alot", "inspite")
+ * was probably meant as, and in reverse, which tokens joined make a word.
+ * each word's list is ordered most frequent first, then by ids. following the
+ * sidecar header:
+ *	ngram3split
+ *	uint64_t off[wordcnt + 1];	where each word's list starts in ent
+ *	ngram3splitent ent[off[wordcnt]];
+ */
+#pragma pack(push, 1)
+typedef struct
+{
+	uint32_t wordcnt,	/* word.bin's */
+		 minfreq;	/* least frequent part allowed */
+} ngram3split;
+
+typedef struct
+{
+	uint32_t id[3],		/* id[2] is UNKNOWN_ID for two parts */
+		 freq;
+} ngram3splitent;
+#pragma pack(pop)
+
+#define ngram3split_off(hdr) ((const uint64_t *)((hdr) + 1))
+#define ngram3split_ent(hdr) ((const ngram3splitent *)(ngram3split_off(hdr) + (hdr)->wordcnt + 1))
+
+#define NGRAM3SPLIT_SUFFIX	".splits"
+#define NGRAM3SPLIT_MAGIC	0x4e473353 /* "NG3S" */
+#define NGRAM3SPLIT_VERSION	1
+#define NGRAM3SPLIT_MINFREQ	500
+
+/*
+ * symmetric deletion index over word.bin, so that finding every word within a couple of
+ * edits of a misspelling needn't generate and look up every edit of it. two words are
+ * within d edits of each other only if deleting at most d characters from the first
+ * prefix characters of each can make them the same, so for every word
+ * ngram3bin-compact stores a hash of each such deletion of its prefix, and a lookup
+ * hashes those of the misspelling and collects the words stored under any of them.
+ * that is a superset of the words within d edits; callers check the distance.
+ * the sidecar header's ngramsize is word.bin's. following it:
+ *	ngramdel
+ *	uint64_t dir[(1 << bits) + 1];	where the entries whose hash starts with each
+ *					value of its top bits start
+ *	ngramdelent ent[dir[1 << bits]];	sorted by hash, then id
+ * characters are utf-8 encoded, and are deleted whole
+ */
+#pragma pack(push, 1)
+typedef struct
+{
+	uint32_t prefix,	/* characters of each word considered */
+		 maxdist,	/* most deletions stored */
+		 bits,		/* of the hash indexed by dir */
+		 wordcnt;	/* word.bin's */
+} ngramdel;
+
+typedef struct
+{
+	uint32_t hash,
+		 id;
+} ngramdelent;
+#pragma pack(pop)
+
+#define ngramdel_dir(hdr) ((const uint64_t *)((hdr) + 1))
+#define ngramdel_ent(hdr) ((const ngramdelent *)(ngramdel_dir(hdr) + (1UL << (hdr)->bits) + 1))
+
+#define NGRAMDEL_SUFFIX		".deletes"
+#define NGRAMDEL_MAGIC		0x4e474453 /* "NGDS" */
+#define NGRAMDEL_VERSION	1
+#define NGRAMDEL_PREFIX		7
+#define NGRAMDEL_PREFIXMAX	16
+#define NGRAMDEL_MAXDIST	2
+/* deletions of at most 2 of NGRAMDEL_PREFIXMAX characters */
+#define NGRAMDEL_VARMAX		(1 + NGRAMDEL_PREFIXMAX + NGRAMDEL_PREFIXMAX * (NGRAMDEL_PREFIXMAX - 1) / 2)
+
+/*
+ * trie of word.bin, so that every word within k edits of a misspelling can be found by
+ * walking it with one row of the edit distance table per character, abandoning any
+ * branch as soon as nothing below it can come within k. words sharing a prefix share
+ * its rows, and the deletion index's limit on k and its superset go away.
+ * the sidecar header's ngramsize is word.bin's. following it:
+ *	ngramtrie
+ *	ngramtrienode node[nodecnt + 1];	root first, each before its children; the
+ *						last marks where the edges end
+ *	ngramtrieedge edge[edgecnt];		node i's are edge[node[i].edge] up to
+ *						edge[node[i + 1].edge], by character
+ * characters are unicode code points, decoded from word.bin's utf-8
+ */
+#pragma pack(push, 1)
+typedef struct
+{
+	uint32_t nodecnt,
+		 edgecnt,
+		 depth,		/* characters in the longest word */
+		 wordcnt;	/* word.bin's */
+} ngramtrie;
+
+typedef struct
+{
+	uint32_t edge,		/* first of this node's edges */
+		 id;		/* of the word ending here, or UNKNOWN_ID */
+} ngramtrienode;
+
+typedef struct
+{
+	uint32_t ch,
+		 node;
+} ngramtrieedge;
+#pragma pack(pop)
+
+typedef struct
+{
+	uint32_t id,
+		 dist;
+	unsigned freq;
+} ngramtriehit;
+
+#define ngramtrie_node(hdr) ((const ngramtrienode *)((hdr) + 1))
+#define ngramtrie_edge(hdr) ((const ngramtrieedge *)(ngramtrie_node(hdr) + (hdr)->nodecnt + 1))
+
+#define NGRAMTRIE_SUFFIX	".trie"
+#define NGRAMTRIE_MAGIC		0x4e475452 /* "NGTR" */
+#define NGRAMTRIE_VERSION	1
+/* longest word and most edits a lookup will consider */
+#define NGRAMTRIE_DEPTHMAX	256
+#define NGRAMTRIE_MAXDIST	8
+
+/*
+ * block-encoded alternative to ngram3.bin, written by ngram3bin-pack: roughly a third
+ * of the size, at the cost of decoding part of a block on every lookup.
+ * ngram3bin_init() maps any of the formats and the ngram3bin_* functions read them all,
+ * telling them apart by this header or ngram3q's.
+ *	ngram3blk hdr;
+ *	ngram3blkent index[blockcnt];	each block's first record and where the rest are
+ *	the other blocksize-1 records of each block, each relative to the one before it:
+ *		varint x-x', varint y, varint z		if x changed
+ *		0, varint y-y', varint z		if y changed
+ *		0, 0, varint z-z'			otherwise
+ *		varint freq
+ * a lookup binary searches the index then decodes at most one block
+ */
+#pragma pack(push, 1)
+typedef struct
+{
+	uint32_t magic,
+		 version,
+		 blocksize,	/* records per block */
+		 blockcnt;
+	uint64_t cnt;		/* records */
+} ngram3blk;
+
+typedef struct
+{
+	ngram3 first;
+	uint64_t off;		/* of the block's remaining records, from the start of the file */
+} ngram3blkent;
+#pragma pack(pop)
+
+#define ngram3blk_index(hdr) ((const ngram3blkent *)((hdr) + 1))
+
+#define NGRAM3BLK_MAGIC		0x4e47334b /* "NG3K" */
+#define NGRAM3BLK_VERSION	1
+#define NGRAM3BLK_BLOCKSIZE	64
+#define NGRAM3BLK_BLOCKMAX	1024
+#define NGRAM3BLK_RECMAX	20 /* 4 varints of up to 5 bytes */
+
+/*
+ * fixed-width alternative to ngram3.bin, written by ngram3bin-pack -q: 12-byte records,
+ * so still sorted and searched in place like ngram3.bin, but with ids cut to 24 bits
+ * and the frequency replaced by a code into a table of approximate counts.
+ * nothing we score with needs more than the rough size of a frequency, and full scans
+ * read three quarters of the memory.
+ *	ngram3q hdr;
+ *	uint32_t freq[1 << bits];	the count each code stands for, increasing
+ *	ngram3qrec rec[cnt];
+ * codes below exact stand for themselves; above that they are spaced evenly
+ * on a log scale up to the highest frequency
+ */
+#pragma pack(push, 1)
+typedef struct
+{
+	uint32_t magic,
+		 version,
+		 bits,		/* of each code, 8 or 16 */
+		 exact;		/* frequencies below this are kept as they are */
+	uint64_t cnt;		/* records */
+} ngram3q;
+
+typedef struct
+{
+	uint8_t f[4][3];	/* x, y, z and the frequency code, each 24 bits little-endian */
+} ngram3qrec;
+#pragma pack(pop)
+
+#define ngram3q_freq(hdr) ((const uint32_t *)((hdr) + 1))
+#define ngram3q_rec(hdr) ((const ngram3qrec *)(ngram3q_freq(hdr) + (1UL << (hdr)->bits)))
+
+#define NGRAM3Q_MAGIC		0x4e473351 /* "NG3Q" */
+#define NGRAM3Q_VERSION		1
+#define NGRAM3Q_BITS		8
+#define NGRAM3Q_IDMAX		0xffffff
+
+/*
+ * ngram4.bin and ngram5.bin are ngram3.bin for longer ngrams: sorted, merged arrays of
+ * records of n ids and a frequency, imported and compacted the same way, so that the
+ * frequency of an ngram of up to NGRAMN_MAX words is one lookup and not the sum of
+ * its overlapping ngram3s. they have none of ngram3.bin's sidecars or block encoding.
+ * on disk each record is n+1 uint32_t; ngramn holds a record or a lookup of any n
+ */
+#define NGRAMN_MAX		5
+
+typedef struct
+{
+	uint32_t id[NGRAMN_MAX],
+		 n;
+} ngramn;
+
+#define ngramn_recsize(n)	(((n) + 1) * sizeof(uint32_t))
+#define ngramn_cnt(map, n)	((map)->size / ngramn_recsize(n))
+
+/*
+ * a position in an ngram3.bin of either format, for reading records in order
+ * without caring which. see ngram3cursor_seek()
+ */
+typedef struct
+{
+	const struct ngram3map *m;
+	const ngram3blk *blk;	/* NULL if m is an array of ngram3 */
+	const ngram3q *q;	/* ...or if it isn't an array of ngram3qrec */
+	unsigned long long pos,	/* in blk or q */
+			   cnt;
+	const ngram3 *rec,	/* the current record */
+		     *end;	/* of m, if it is an array of ngram3 */
+	ngram3 cur;		/* rec decoded, in blk or q */
+	const unsigned char *p;	/* the record after cur, in blk */
+} ngram3cursor;
+
+/*
+ * reads all of m a run of records at a time, for full scans: an array of ngram3
+ * in one go, a block-encoded map one decoded block at a time. usage:
+ *	ngram3scan_init(&s, m);
+ *	while ((cur = ngram3scan_next(&s, &end)))
+ *		while (cur < end) ...
+ */
+typedef struct
+{
+	const struct ngram3map *m;
+	unsigned long block;
+	ngram3 buf[NGRAM3BLK_BLOCKMAX];
+} ngram3scan;
+
+#define ngram3scan_init(s, map) ((s)->m = (map), (s)->block = 0)
+
+int ngram3blk_next(ngram3cursor *);
+
+/*
+ * decode r, with frequency table freq, into *ng; r is read as three (unaligned) words,
+ * not twelve bytes, which the compiler makes four loads of. like ngram3.bin, little-endian
+ */
+static inline void ngram3q_decode(const uint32_t *freq, const ngram3qrec *r, ngram3 *ng)
+{
+	uint32_t w[3];
+	memcpy(w, r, sizeof w);
+	ng->id[0] = w[0] & 0xffffff;
+	ng->id[1] = w[0] >> 24 | (w[1] & 0xffff) << 8;
+	ng->id[2] = w[1] >> 16 | (w[2] & 0xff) << 16;
+	ng->freq = freq[w[2] >> 8];
+}
+
+/*
+ * advance c to the next record; return 0 at the end of m
+ * inline, as full scans call it for every record
+ */
+static inline int ngram3cursor_next(ngram3cursor *c)
+{
+	if (c->q)
+	{
+		if (++c->pos >= c->cnt)
+			return 0;
+		ngram3q_decode(ngram3q_freq(c->q), ngram3q_rec(c->q) + c->pos, &c->cur);
+		return 1;
+	}
+	if (!c->blk)
+		return ++c->rec < c->end;
+	return ngram3blk_next(c);
+}
+
 struct ngramword    ngramword_load(const struct ngram3map);
 const unsigned long ngramword_word2id(const char *word, unsigned len, const struct ngramword);
 const char *	    ngramword_id2word(unsigned long id, const struct ngramword);
@@ -73,15 +528,75 @@ struct ngram3map    ngram3bin_init(const char *path, int write);
 unsigned long	    ngram3bin_freq(ngram3 find, const struct ngram3map *);
 unsigned long	    ngram3bin_freq2(ngram3 find, const struct ngram3map *);
 ngram3 *	    ngram3bin_like(ngram3 find, const struct ngram3map *);
-ngram3 *	    ngram3bin_like_better(ngram3 find, const struct ngram3map *, ngram3bin_index *);
+ngram3 *	    ngram3bin_like_better(ngram3 find, const struct ngram3map *, ngram3bin_index *,
+					  const ngram3bin_perm *);
 void		    ngram3bin_str (const struct ngram3map, FILE *);
 void		    ngram3bin_fini(struct ngram3map);
 ngram3 *	    ngram3bin_follows(const ngram3 *, const struct ngram3map *);
+ngram3 *	    ngram3bin_precedes(const ngram3 *, const struct ngram3map *);
 
 int		    ngram3bin_index_init(ngram3bin_index *, const struct ngram3map *, const struct ngramword *);
 void		    ngram3bin_index_fini(ngram3bin_index *);
 
+int		    ngram3bin_totals_init(ngram3bin_index *, struct ngramword, const char *ngrampath,
+					  const struct ngram3map *);
+int		    ngram3bin_totals_write(FILE *, struct ngramword, const ngram3bin_index *,
+					   const struct ngram3map *);
+
+void		    ngram3bin_perm_init(ngram3bin_perm *, const char *ngrampath, const struct ngram3map *);
+void		    ngram3bin_perm_fini(ngram3bin_perm *);
+
+struct ngram3map    ngram3sidecar_init(const char *ngrampath, const char *suffix, uint32_t magic, uint32_t version,
+				       const struct ngram3map *);
+int		    ngram3sidecar_write(FILE *, uint32_t magic, uint32_t version, const struct ngram3map *);
+
+unsigned long	    ngram2bin_freq(ngram3 find, const struct ngram3map *);
+int		    ngram3bin_freq_many(const ngram3 *find, unsigned long *freq, size_t cnt,
+					const struct ngram3map *, const struct ngram3map *bigram,
+					const struct ngram3map *bloom, ngram3bloom_stats *);
+
+struct ngram3map    ngram3bloom_init(const char *ngrampath, const struct ngram3map *);
+int		    ngram3bloom_maybe(const struct ngram3map *bloom, const ngram3 *find);
+void		    ngram3bloom_add(uint64_t *bits, uint64_t blockcnt, uint32_t k, const ngram3 *);
+unsigned long	    ngram3bin_freq_bloom(ngram3 find, const struct ngram3map *, const struct ngram3map *bloom,
+					 ngram3bloom_stats *);
+
+struct ngram3map    ngram3adj_init(const char *ngrampath, const char *suffix, const struct ngram3map *);
+ngram3 *	    ngram3adj_get(const ngram3 *, const struct ngram3map *adj);
+int		    ngram3adjent_cmp(const void *, const void *);
+
+struct ngram3map    ngram3split_init(const char *ngrampath, const struct ngram3map *, unsigned long wordcnt);
+const ngram3splitent * ngram3split_get(uint32_t id, const struct ngram3map *split, size_t *cnt);
+int		    ngram3splitent_cmp(const void *, const void *);
+
+struct ngram3map    ngramdel_init(const char *wordpath, const struct ngram3map *wordmap);
+unsigned	    ngramdel_hashes(const char *word, unsigned len, unsigned prefix, unsigned maxdist,
+				    uint32_t hash[NGRAMDEL_VARMAX]);
+uint32_t *	    ngramdel_lookup(const char *word, unsigned len, unsigned maxdist,
+				    const struct ngram3map *del, const struct ngramword *, size_t *cnt);
+
+struct ngram3map    ngramtrie_init(const char *wordpath, const struct ngram3map *wordmap);
+unsigned	    ngramtrie_decode(const char *word, unsigned len, uint32_t *ch, unsigned chmax);
+ngramtriehit *	    ngramtrie_within(const char *word, unsigned len, unsigned maxdist,
+				     const struct ngram3map *trie, const struct ngramword *, size_t *cnt);
+unsigned	    ngram_damlev(const uint32_t *a, unsigned alen, const uint32_t *b, unsigned blen,
+				 unsigned maxdist, unsigned *row);
+
+unsigned long	    ngramnbin_freq(const ngramn *find, const struct ngram3map *);
+int		    ngramncmp(const uint32_t *a, const uint32_t *b, unsigned n);
+
+const ngram3blk *   ngram3blk_hdr(const struct ngram3map *);
+const ngram3q *	    ngram3q_hdr(const struct ngram3map *);
+unsigned long long  ngram3bin_cnt(const struct ngram3map *);
+int		    ngram3cursor_seek(ngram3cursor *, const struct ngram3map *, unsigned long long pos);
+int		    ngram3cursor_lower(ngram3cursor *, const struct ngram3map *, const ngram3 *find,
+				       int (*cmp)(const void *, const void *));
+const ngram3 *	    ngram3scan_next(ngram3scan *, const ngram3 **end);
+size_t		    ngram3blk_encode(unsigned char *buf, const ngram3 *prev, const ngram3 *cur);
+void		    ngram3q_encode(ngram3qrec *, const ngram3 *, uint32_t code);
+
 int ngram3cmp(const void *, const void *);
+int ngram2cmp(const void *, const void *);
 
 #endif /* NGRAM3BIN_H */
 
@@ -11,6 +11,7 @@
 
 #include <Python.h>
 #include <stdlib.h>
+#include <limits.h>
 #include "ngram3bin.h"
 
 #if PY_MAJOR_VERSION >= 3
@@ -24,8 +25,18 @@ typedef struct {
 	PyObject_HEAD
 	struct ngram3map wordmap;
 	struct ngram3map ngramap;
+	struct ngram3map bigramap;
+	struct ngram3map bloomap;
+	struct ngram3map followmap;
+	struct ngram3map precedemap;
+	struct ngram3map splitmap;			/* ngram3.bin.splits */
+	struct ngram3map ngramnmap[NGRAMN_MAX + 1];	/* ngram4.bin etc., by order */
+	struct ngram3map delmap;			/* word.bin.deletes */
+	struct ngram3map triemap;			/* word.bin.trie */
+	ngram3bloom_stats bloomstats;
 	struct ngramword word;
 	ngram3bin_index ngramap_index;
+	ngram3bin_perm ngramap_perm;
 	PyObject *worddict;
 } ngram3bin;
 
@@ -43,6 +54,19 @@ static PyObject *ngram3binpy_wordfreq(PyObject *self, PyObject *args);
 static PyObject *ngram3binpy_freq   (PyObject *self, PyObject *args);
 static PyObject *ngram3binpy_like   (PyObject *self, PyObject *args);
 static PyObject *ngram3binpy_follows(PyObject *self, PyObject *args);
+static PyObject *ngram3binpy_precedes(PyObject *self, PyObject *args);
+static PyObject *ngram3binpy_word2id_many(PyObject *self, PyObject *args);
+static PyObject *ngram3binpy_wordfreq_many(PyObject *self, PyObject *args);
+static PyObject *ngram3binpy_freq_many(PyObject *self, PyObject *args);
+static PyObject *ngram3binpy_stats  (PyObject *self, PyObject *args);
+static PyObject *ngram3binpy_order  (PyObject *self, PyObject *args);
+static PyObject *ngram3binpy_like_buf(PyObject *self, PyObject *args);
+static PyObject *ngram3binpy_follows_buf(PyObject *self, PyObject *args);
+static PyObject *ngram3binpy_wordlens(PyObject *self, PyObject *args);
+static PyObject *ngram3binpy_deletes(PyObject *self, PyObject *args);
+static PyObject *ngram3binpy_within(PyObject *self, PyObject *args);
+static PyObject *ngram3binpy_damlev_many(PyObject *self, PyObject *args);
+static PyObject *ngram3binpy_splits (PyObject *self, PyObject *args);
 
 static struct PyMethodDef ngram3bin_Methods[] = {
 	{ "word2id",	(PyCFunction) ngram3binpy_word2id,	METH_VARARGS,	NULL },
@@ -53,6 +77,19 @@ static struct PyMethodDef ngram3bin_Methods[] = {
 	{ "like",	(PyCFunction) ngram3binpy_like,		METH_VARARGS,	NULL },
 	{ "ngram3bin",	(PyCFunction) ngram3bin_new,		METH_VARARGS,	NULL },
 	{ "follows",	(PyCFunction) ngram3binpy_follows,	METH_VARARGS,	NULL },
+	{ "precedes",	(PyCFunction) ngram3binpy_precedes,	METH_VARARGS,	NULL },
+	{ "word2id_many",  (PyCFunction) ngram3binpy_word2id_many,  METH_VARARGS, NULL },
+	{ "wordfreq_many", (PyCFunction) ngram3binpy_wordfreq_many, METH_VARARGS, NULL },
+	{ "freq_many",	(PyCFunction) ngram3binpy_freq_many,	METH_VARARGS,	NULL },
+	{ "stats",	(PyCFunction) ngram3binpy_stats,	METH_VARARGS,	NULL },
+	{ "order",	(PyCFunction) ngram3binpy_order,	METH_VARARGS,	NULL },
+	{ "like_buf",	(PyCFunction) ngram3binpy_like_buf,	METH_VARARGS,	NULL },
+	{ "follows_buf", (PyCFunction) ngram3binpy_follows_buf,	METH_VARARGS,	NULL },
+	{ "wordlens",	(PyCFunction) ngram3binpy_wordlens,	METH_VARARGS,	NULL },
+	{ "deletes",	(PyCFunction) ngram3binpy_deletes,	METH_VARARGS,	NULL },
+	{ "within",	(PyCFunction) ngram3binpy_within,	METH_VARARGS,	NULL },
+	{ "damlev_many", (PyCFunction) ngram3binpy_damlev_many,	METH_VARARGS,	NULL },
+	{ "splits",	(PyCFunction) ngram3binpy_splits,	METH_VARARGS,	NULL },
 	{ NULL,		NULL,					0,		NULL }
 };
 
@@ -111,6 +148,149 @@ PyTypeObject ngram3bin_Type = {
 #endif
 };
 
+/*
+ * a block of uint32_t handed to python without boxing each one, e.g. like()'s results
+ * as rows of (x,y,z,freq). it exposes the buffer protocol, so numpy.frombuffer() or
+ * memoryview() can read it in place as a rows x cols array of uint32
+ */
+typedef struct {
+	PyObject_HEAD
+	uint32_t *data;		/* malloc()ed, ours */
+	Py_ssize_t shape[2],	/* rows, cols */
+		   strides[2];
+} ngram3buf;
+
+static void ngram3buf_dealloc(PyObject *self)
+{
+	free(((ngram3buf *)self)->data);
+	PyObject_Del(self);
+}
+
+static Py_ssize_t ngram3buf_length(PyObject *self)
+{
+	return ((ngram3buf *)self)->shape[0];
+}
+
+static int ngram3buf_getbuffer(PyObject *self, Py_buffer *view, int flags)
+{
+	ngram3buf *b = (ngram3buf *)self;
+	if (flags & PyBUF_WRITABLE)
+	{
+		PyErr_SetString(PyExc_BufferError, "ngram3buf is read-only");
+		view->obj = NULL;
+		return -1;
+	}
+	view->buf = b->data;
+	view->obj = self;
+	Py_INCREF(self);
+	view->len = b->shape[0] * b->shape[1] * sizeof *b->data;
+	view->readonly = 1;
+	view->itemsize = sizeof *b->data;
+	view->format = (flags & PyBUF_FORMAT) ? "I" : NULL;
+	view->ndim = b->shape[1] > 1 ? 2 : 1;
+	view->shape = (flags & PyBUF_ND) == PyBUF_ND ? b->shape : NULL;
+	view->strides = (flags & PyBUF_STRIDES) == PyBUF_STRIDES ? b->strides : NULL;
+	view->suboffsets = NULL;
+	view->internal = NULL;
+	return 0;
+}
+
+#ifndef PY3K
+// python 2's numpy.frombuffer() still uses the old protocol
+static Py_ssize_t ngram3buf_getreadbuffer(PyObject *self, Py_ssize_t seg, void **ptr)
+{
+	ngram3buf *b = (ngram3buf *)self;
+	*ptr = b->data;
+	return b->shape[0] * b->shape[1] * sizeof *b->data;
+}
+
+static Py_ssize_t ngram3buf_getsegcount(PyObject *self, Py_ssize_t *lenp)
+{
+	ngram3buf *b = (ngram3buf *)self;
+	if (lenp)
+		*lenp = b->shape[0] * b->shape[1] * sizeof *b->data;
+	return 1;
+}
+#endif
+
+static PySequenceMethods ngram3buf_as_sequence = {
+	ngram3buf_length,	/* sq_length					*/
+};
+
+static PyBufferProcs ngram3buf_as_buffer = {
+#ifndef PY3K
+	ngram3buf_getreadbuffer,/* bf_getreadbuffer				*/
+	0,			/* bf_getwritebuffer				*/
+	ngram3buf_getsegcount,	/* bf_getsegcount				*/
+	0,			/* bf_getcharbuffer				*/
+#endif
+	ngram3buf_getbuffer,	/* bf_getbuffer					*/
+	0,			/* bf_releasebuffer				*/
+};
+
+PyTypeObject ngram3buf_Type = {
+#ifdef PY3K
+	PyVarObject_HEAD_INIT(NULL, 0)
+#else
+	PyObject_HEAD_INIT(NULL)
+	0,			/* ob_size					*/
+#endif
+	"ngram3buf",		/* char *tp_name;				*/
+	sizeof(ngram3buf),	/* int tp_basicsize;				*/
+	0,			/* int tp_itemsize; not used much		*/
+	ngram3buf_dealloc,	/* destructor tp_dealloc;			*/
+	0,			/* printfunc tp_print;				*/
+	0,			/* getattrfunc tp_getattr;	__getattr__	*/
+	0,			/* setattrfunc tp_setattr;	__setattr__	*/
+	0,			/* cmpfunc tp_compare;		__cmp__		*/
+	0,			/* reprfunc tp_repr;		__repr__	*/
+	0,			/* PyNumberMethods *tp_as_number;		*/
+	&ngram3buf_as_sequence,	/* PySequenceMethods *tp_as_sequence;		*/
+	0,			/* PyMappingMethods *tp_as_mapping;		*/
+	0,			/* hashfunc tp_hash;		__hash__	*/
+	0,			/* ternaryfunc tp_call;		__call__	*/
+	0,			/* reprfunc tp_str;		__str__		*/
+	PyObject_GenericGetAttr,/* tp_getattro					*/
+	0,			/* tp_setattro					*/
+	&ngram3buf_as_buffer,	/* tp_as_buffer					*/
+#ifdef PY3K
+	Py_TPFLAGS_DEFAULT,	/* tp_flags					*/
+#else
+	Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_NEWBUFFER,
+#endif
+};
+
+/*
+ * wrap rows x cols of data, taking ownership of it
+ */
+static PyObject * ngram3buf_new(uint32_t *data, Py_ssize_t rows, Py_ssize_t cols)
+{
+	ngram3buf *b = PyObject_New(ngram3buf, &ngram3buf_Type);
+	if (!b)
+	{
+		free(data);
+		return NULL;
+	}
+	b->data = data;
+	b->shape[0] = rows;
+	b->shape[1] = cols;
+	b->strides[0] = cols * sizeof *data;
+	b->strides[1] = sizeof *data;
+	return (PyObject *)b;
+}
+
+/*
+ * wrap an ngram3 list as returned by ngram3bin_like() et al, up to its sentinel
+ */
+static PyObject * ngram3buf_from_res(ngram3 *f)
+{
+	Py_ssize_t n = 0;
+	if (f)
+		while (f[n].freq)
+			n++;
+	return ngram3buf_new((uint32_t *)f, n, sizeof *f / sizeof(uint32_t));
+}
+
 struct module_state {
 	PyObject *error;
 };
@@ -178,6 +358,8 @@ initngram3bin(void)
 
 	if (module == NULL)
 		INITERROR;
+	if (PyType_Ready(&ngram3buf_Type) < 0)
+		INITERROR;
 	struct module_state *st = GETSTATE(module);
 
 	st->error = PyErr_NewException("ngram3bin.Error", NULL, NULL);
@@ -202,13 +384,28 @@ PyObject *ngram3bin_getattr(PyObject *self, char *attr)
 
 static PyObject * ngram3bin_NEW(void)
 {
+	static const struct ngram3map nomap = { NULL, -1, 0 };
 	ngram3bin *obj = PyObject_NEW(ngram3bin, &ngram3bin_Type);
-	obj->wordmap.m = NULL;
-	obj->ngramap.m = NULL;
-	obj->wordmap.fd = -1;
-	obj->ngramap.fd = -1;
-	obj->wordmap.size = 0;
-	obj->ngramap.size = 0;
+	unsigned n;
+	obj->wordmap = nomap;
+	obj->ngramap = nomap;
+	obj->bigramap = nomap;
+	obj->bloomap = nomap;
+	obj->followmap = nomap;
+	obj->precedemap = nomap;
+	obj->splitmap = nomap;
+	obj->delmap = nomap;
+	obj->triemap = nomap;
+	for (n = 0; n <= NGRAMN_MAX; n++)
+		obj->ngramnmap[n] = nomap;
+	memset(&obj->bloomstats, 0, sizeof obj->bloomstats);
+	obj->ngramap_perm.yzx = nomap;
+	obj->ngramap_perm.xzy = nomap;
+	obj->word.cnt = 0;
+	obj->word.word = NULL;
+	obj->ngramap_index.span = NULL;
+	obj->ngramap_index.totals = nomap;
+	obj->worddict = NULL;
 	return (PyObject *)obj;
 }
 
@@ -226,20 +423,41 @@ static PyObject * worddict_new(struct ngramword w)
 	return d;
 }
 
+/*
+ * ngram3bin(word.bin, ngram3.bin[, ngram4.bin[, ngram5.bin]])
+ */
 static PyObject * ngram3bin_new(PyObject *self, PyObject *args)
 {
 	ngram3bin *obj = (ngram3bin *)ngram3bin_NEW();
 	char *wordpath = NULL;
 	char *ngrampath = NULL;
-	if (PyArg_ParseTuple(args, "ss", &wordpath, &ngrampath))
+	char *ngramnpath[NGRAMN_MAX + 1] = { NULL };
+	if (PyArg_ParseTuple(args, "ss|zz", &wordpath, &ngrampath, ngramnpath+4, ngramnpath+5))
 	{
+		unsigned n;
+		for (n = 4; n <= NGRAMN_MAX; n++)
+			if (ngramnpath[n])
+				obj->ngramnmap[n] = ngram3bin_init(ngramnpath[n], 0);
 		obj->wordmap = ngram3bin_init(wordpath, 0);
 		obj->word    = ngramword_load(obj->wordmap);
+		obj->delmap  = ngramdel_init(wordpath, &obj->wordmap);
+		obj->triemap = ngramtrie_init(wordpath, &obj->wordmap);
 		obj->ngramap = ngram3bin_init(ngrampath, 0);
-		obj->worddict = worddict_new(obj->word);
-		ngramword_totalfreqs(obj->word, &obj->ngramap);
-		ngram3bin_index_init(&obj->ngramap_index, &obj->ngramap, &obj->word);
-		Py_INCREF(obj->worddict);
+		obj->bigramap = ngram3sidecar_init(ngrampath, NGRAM2BIN_SUFFIX,
+					NGRAM2BIN_MAGIC, NGRAM2BIN_VERSION, &obj->ngramap);
+		obj->bloomap = ngram3bloom_init(ngrampath, &obj->ngramap);
+		obj->followmap = ngram3adj_init(ngrampath, NGRAM3FOLLOWS_SUFFIX, &obj->ngramap);
+		obj->precedemap = ngram3adj_init(ngrampath, NGRAM3PRECEDES_SUFFIX, &obj->ngramap);
+		obj->splitmap = ngram3split_init(ngrampath, &obj->ngramap, obj->word.cnt);
+		// only needed if word.bin can't do its own lookups
+		obj->worddict = obj->word.sorted ? NULL : worddict_new(obj->word);
+		if (!ngram3bin_totals_init(&obj->ngramap_index, obj->word, ngrampath, &obj->ngramap))
+		{
+			ngramword_totalfreqs(obj->word, &obj->ngramap);
+			ngram3bin_index_init(&obj->ngramap_index, &obj->ngramap, &obj->word);
+		}
+		ngram3bin_perm_init(&obj->ngramap_perm, ngrampath, &obj->ngramap);
+		Py_XINCREF(obj->worddict);
 	}
 	Py_INCREF(obj);
 	return (PyObject *)obj;
@@ -248,9 +466,22 @@ static PyObject * ngram3bin_new(PyObject *self, PyObject *args)
 static void ngram3bin_dealloc(PyObject *self)
 {
 	ngram3bin *obj = (ngram3bin *)self;
+	unsigned n;
 	ngram3bin_fini(obj->wordmap);
 	ngramword_fini(obj->word);
+	ngram3bin_index_fini(&obj->ngramap_index);
 	ngram3bin_fini(obj->ngramap);
+	ngram3bin_fini(obj->bigramap);
+	ngram3bin_fini(obj->bloomap);
+	ngram3bin_fini(obj->followmap);
+	ngram3bin_fini(obj->precedemap);
+	ngram3bin_fini(obj->splitmap);
+	ngram3bin_fini(obj->delmap);
+	ngram3bin_fini(obj->triemap);
+	for (n = 4; n <= NGRAMN_MAX; n++)
+		ngram3bin_fini(obj->ngramnmap[n]);
+	ngram3bin_perm_fini(&obj->ngramap_perm);
+	Py_XDECREF(obj->worddict);
 	PyMem_FREE(self);
 }
 
@@ -262,24 +493,49 @@ static int ngram3bin_print(PyObject *self, FILE *fp, int flags)
 	return 0;
 }
 
-static PyObject *ngram3binpy_word2id(PyObject *self, PyObject *args)
+/*
+ * resolve a word, utf-8 encoded in key, to its id
+ * via word.bin's lookup section if it has one, otherwise our dict
+ */
+static unsigned long ngram3bin_key2id(ngram3bin *obj, PyObject *key)
 {
-	PyObject *res = NULL;
-	Py_UNICODE *u = NULL;
-	int l = 0;
-	if (PyArg_ParseTuple(args, "u#", &u, &l))
+	if (obj->word.sorted)
 	{
-		PyObject *key = PyUnicode_EncodeUTF8(u, l, NULL);
-		if (key)
-		{
-			ngram3bin *obj = (ngram3bin *)self;
-			res = PyDict_GetItem(obj->worddict, key);
-		}
+		return ngramword_word2id(PyBytes_AS_STRING(key), (unsigned)PyBytes_GET_SIZE(key), obj->word);
 	}
-	if (!res)
-		res = PyLong_FromLong(UNKNOWN_ID);
-	Py_INCREF(res);
-	return res;
+	else
+	{
+		PyObject *id = PyDict_GetItem(obj->worddict, key);
+		return id ? PyLong_AsUnsignedLong(id) : UNKNOWN_ID;
+	}
+}
+
+/*
+ * word o as a new utf-8 bytes object; NULL and a python exception if it's not a string
+ */
+static PyObject *ngram3bin_utf8(PyObject *o)
+{
+	if (PyUnicode_Check(o))
+		return PyUnicode_AsUTF8String(o);
+	if (PyBytes_Check(o))
+	{
+		Py_INCREF(o);
+		return o;
+	}
+	PyErr_SetString(PyExc_TypeError, "expected a string");
+	return NULL;
+}
+
+static PyObject *ngram3binpy_word2id(PyObject *self, PyObject *args)
+{
+	ngram3bin *obj = (ngram3bin *)self;
+	unsigned long id = UNKNOWN_ID;
+	PyObject *o, *key;
+	if (!PyArg_ParseTuple(args, "O", &o) || !(key = ngram3bin_utf8(o)))
+		return NULL;
+	id = ngram3bin_key2id(obj, key);
+	Py_DECREF(key);
+	return PyLong_FromUnsignedLong(id);
 }
 
 static PyObject *ngram3binpy_id2word(PyObject *self, PyObject *args)
@@ -320,51 +576,378 @@ static PyObject *ngram3binpy_id2freq(PyObject *self, PyObject *args)
  */
 static PyObject *ngram3binpy_wordfreq(PyObject *self, PyObject *args)
 {
-	PyObject *res = NULL;
 	ngram3bin *obj = (ngram3bin *)self;
-	unsigned long id = 0;
-	Py_UNICODE *u = NULL;
-	int l = 0;
-	if (PyArg_ParseTuple(args, "u#", &u, &l))
-	{
-		PyObject *key = PyUnicode_EncodeUTF8(u, l, NULL);
-		if (key)
-		{
-			res = PyDict_GetItem(obj->worddict, key);
-			if (res)
-				id = PyLong_AsLong(res);
-		}
-	}
+	unsigned long id;
+	PyObject *o, *key;
+	if (!PyArg_ParseTuple(args, "O", &o) || !(key = ngram3bin_utf8(o)))
+		return NULL;
+	id = ngram3bin_key2id(obj, key);
+	Py_DECREF(key);
 	if (id < obj->word.cnt)
-		res = PyLong_FromUnsignedLong(obj->word.word[id].freq);
-	else
-		res = PyLong_FromLong(0);
-	Py_INCREF(res);
-	return res;
+		return PyLong_FromUnsignedLong(obj->word.word[id].freq);
+	return PyLong_FromLong(0);
+}
+
+/*
+ * the maps are read-only once opened and the ngram3bin_* functions allocate their
+ * results per call, so lookups run without the GIL and threads can share an object.
+ * only the counters need it; lookups tally into their own and add them afterwards
+ */
+static void ngram3bin_bloomstats_add(ngram3bin *obj, const ngram3bloom_stats *stats)
+{
+	obj->bloomstats.rejected += stats->rejected;
+	obj->bloomstats.passed += stats->passed;
+	obj->bloomstats.falsepos += stats->falsepos;
 }
 
 /*
  * find frequency of (x,y,z)
+ * or of (x,y), via the bigram table if we have one
+ * or of 4 or 5 ids, if we have ngram4.bin or ngram5.bin
  */
 static PyObject *ngram3binpy_freq(PyObject *self, PyObject *args)
 {
 	PyObject *res = NULL;
 	ngram3bin *obj = (ngram3bin *)self;
-	ngram3 find;
-	find.id[2] = IMPOSSIBLE_ID;
+	ngramn find;
 	unsigned long freq = 0;
-	if (PyArg_ParseTuple(args, "ii|i", find.id+0, find.id+1, find.id+2))
+	unsigned n;
+	for (n = 0; n < NGRAMN_MAX; n++)
+		find.id[n] = IMPOSSIBLE_ID;
+	if (!PyArg_ParseTuple(args, "ii|iii", find.id+0, find.id+1, find.id+2, find.id+3, find.id+4))
+		return NULL;
+	for (find.n = 2; find.n < NGRAMN_MAX && find.id[find.n] != (uint32_t)IMPOSSIBLE_ID; find.n++)
+		;
+	if (find.n > 3 && !obj->ngramnmap[find.n].m)
+	{
+		PyErr_Format(PyExc_ValueError, "no ngram%u.bin to look up %u ids in", find.n, find.n);
+		return NULL;
+	}
+	if (find.n > 3)
+	{
+		Py_BEGIN_ALLOW_THREADS
+		freq = ngramnbin_freq(&find, &obj->ngramnmap[find.n]);
+		Py_END_ALLOW_THREADS
+	}
+	else
 	{
-		if (find.id[2] == IMPOSSIBLE_ID)
-			freq = ngram3bin_freq2(find, &obj->ngramap);
+		ngram3 find3 = { { find.id[0], find.id[1], find.id[2] }, 0 };
+		ngram3bloom_stats stats = { 0, 0, 0 };
+		Py_BEGIN_ALLOW_THREADS
+		if (find3.id[2] == (uint32_t)IMPOSSIBLE_ID)
+			freq = obj->bigramap.m
+				? ngram2bin_freq(find3, &obj->bigramap)
+				: ngram3bin_freq2(find3, &obj->ngramap);
 		else
-			freq = ngram3bin_freq(find, &obj->ngramap);
+			freq = ngram3bin_freq_bloom(find3, &obj->ngramap, &obj->bloomap, &stats);
+		Py_END_ALLOW_THREADS
+		ngram3bin_bloomstats_add(obj, &stats);
 	}
 	res = PyLong_FromUnsignedLong(freq);
 	Py_INCREF(res);
 	return res;
 }
 
+/*
+ * the most ids freq() can look up at once: 3, or more if we have ngram4.bin etc.
+ */
+static PyObject *ngram3binpy_order(PyObject *self, PyObject *args)
+{
+	ngram3bin *obj = (ngram3bin *)self;
+	unsigned n = 3;
+	while (n < NGRAMN_MAX && obj->ngramnmap[n + 1].m)
+		n++;
+	return PyLong_FromUnsignedLong(n);
+}
+
+/*
+ * batch versions of word2id(), wordfreq() and freq()
+ * each takes a single sequence and returns a list of results in the same order,
+ * paying for argument parsing and the trip into C once instead of per item
+ */
+
+/*
+ * translate a sequence of words into a newly allocated array of their ids
+ */
+static unsigned long * ngram3bin_words2ids(ngram3bin *obj, PyObject *words, Py_ssize_t *cnt)
+{
+	unsigned long *ids = NULL;
+	PyObject *seq = PySequence_Fast(words, "expected a sequence of words");
+	Py_ssize_t i;
+	if (!seq)
+		return NULL;
+	*cnt = PySequence_Fast_GET_SIZE(seq);
+	if (!(ids = malloc((*cnt ? *cnt : 1) * sizeof *ids)))
+	{
+		PyErr_NoMemory();
+	}
+	else
+	{
+		for (i = 0; i < *cnt; i++)
+		{
+			PyObject *w = PySequence_Fast_GET_ITEM(seq, i);
+			PyObject *key = NULL;
+			if (PyUnicode_Check(w))
+			{
+				key = PyUnicode_AsUTF8String(w);
+			}
+			else if (PyBytes_Check(w))
+			{
+				key = w;
+				Py_INCREF(key);
+			}
+			ids[i] = UNKNOWN_ID;
+			if (key)
+			{
+				ids[i] = ngram3bin_key2id(obj, key);
+				Py_DECREF(key);
+			}
+			PyErr_Clear();
+		}
+	}
+	Py_DECREF(seq);
+	return ids;
+}
+
+/*
+ * [word,...] -> [id,...]
+ */
+static PyObject *ngram3binpy_word2id_many(PyObject *self, PyObject *args)
+{
+	PyObject *words, *res = NULL;
+	unsigned long *ids;
+	Py_ssize_t i, cnt = 0;
+	if (!PyArg_ParseTuple(args, "O", &words))
+		return NULL;
+	if (!(ids = ngram3bin_words2ids((ngram3bin *)self, words, &cnt)))
+		return NULL;
+	if ((res = PyList_New(cnt)))
+		for (i = 0; i < cnt; i++)
+			PyList_SET_ITEM(res, i, PyLong_FromUnsignedLong(ids[i]));
+	free(ids);
+	return res;
+}
+
+/*
+ * [word,...] -> [wordfreq(word),...]
+ */
+static PyObject *ngram3binpy_wordfreq_many(PyObject *self, PyObject *args)
+{
+	ngram3bin *obj = (ngram3bin *)self;
+	PyObject *words, *res = NULL;
+	unsigned long *ids;
+	Py_ssize_t i, cnt = 0;
+	if (!PyArg_ParseTuple(args, "O", &words))
+		return NULL;
+	if (!(ids = ngram3bin_words2ids(obj, words, &cnt)))
+		return NULL;
+	if ((res = PyList_New(cnt)))
+		for (i = 0; i < cnt; i++)
+			PyList_SET_ITEM(res, i, PyLong_FromUnsignedLong(
+				ids[i] < obj->word.cnt ? obj->word.word[ids[i]].freq : 0));
+	free(ids);
+	return res;
+}
+
+/*
+ * read id triples out of a buffer of uint32, e.g. an array('I')
+ * return the number of ngram3s read into a newly allocated *find, or -1
+ */
+static Py_ssize_t ngram3bin_buf2find(PyObject *o, ngramn **find)
+{
+	Py_ssize_t i, cnt = -1;
+	const uint32_t *ids;
+	Py_ssize_t len;
+#ifdef PY3K
+	Py_buffer view;
+	if (PyObject_GetBuffer(o, &view, PyBUF_SIMPLE))
+		return -1;
+	ids = view.buf;
+	len = view.len;
+#else
+	if (PyObject_AsReadBuffer(o, (const void **)&ids, &len))
+		return -1;
+#endif
+	if (len % (3 * sizeof *ids))
+	{
+		PyErr_SetString(PyExc_ValueError, "buffer must hold (x,y,z) uint32 id triples");
+	}
+	else if (!(*find = malloc((len ? len / (3 * sizeof *ids) : 1) * sizeof **find)))
+	{
+		PyErr_NoMemory();
+	}
+	else
+	{
+		cnt = len / (3 * sizeof *ids);
+		for (i = 0; i < cnt; i++, ids += 3)
+		{
+			(*find)[i].id[0] = ids[0];
+			(*find)[i].id[1] = ids[1];
+			(*find)[i].id[2] = ids[2];
+			(*find)[i].n = 3;
+		}
+	}
+#ifdef PY3K
+	PyBuffer_Release(&view);
+#endif
+	return cnt;
+}
+
+/*
+ * read (x,y,z) and (x,y) id tuples, or longer ones, out of a sequence
+ * return the number of ngrams read into a newly allocated *find, or -1
+ */
+static Py_ssize_t ngram3bin_seq2find(PyObject *o, ngramn **find)
+{
+	PyObject *seq = PySequence_Fast(o, "expected a sequence of id tuples or a buffer of id triples");
+	Py_ssize_t i, j, cnt;
+	if (!seq)
+		return -1;
+	cnt = PySequence_Fast_GET_SIZE(seq);
+	if (!(*find = malloc((cnt ? cnt : 1) * sizeof **find)))
+	{
+		Py_DECREF(seq);
+		PyErr_NoMemory();
+		return -1;
+	}
+	for (i = 0; i < cnt && cnt != -1; i++)
+	{
+		PyObject *t = PySequence_Fast(PySequence_Fast_GET_ITEM(seq, i), "expected a tuple of ids");
+		Py_ssize_t n = t ? PySequence_Fast_GET_SIZE(t) : 0;
+		ngramn *f = *find + i;
+		f->n = n;
+		if (!t || n < 2 || n > NGRAMN_MAX)
+		{
+			if (t)
+				PyErr_SetString(PyExc_ValueError, "ngrams must have 2 to 5 ids");
+			cnt = -1;
+		}
+		else
+		{
+			for (j = 0; j < n; j++)
+				f->id[j] = PyNumber_AsSsize_t(PySequence_Fast_GET_ITEM(t, j), NULL);
+			if (PyErr_Occurred())
+				cnt = -1;
+		}
+		Py_XDECREF(t);
+	}
+	Py_DECREF(seq);
+	if (cnt == -1)
+	{
+		free(*find);
+		*find = NULL;
+	}
+	return cnt;
+}
+
+/*
+ * [(x,y,z),(x,y),...] or array('I', [x,y,z,x,y,z...]) -> [freq,...]
+ * in a buffer, a z of IMPOSSIBLE_ID (0xffffffff) means (x,y)
+ */
+/*
+ * look up each of find, sending (x,y[,z]) to ngram3bin_freq_many() in one batch
+ * and longer ngrams to their own tables
+ */
+static int ngram3bin_freqn_many(ngram3bin *obj, const ngramn *find, unsigned long *freq, size_t cnt,
+				ngram3bloom_stats *stats)
+{
+	ngram3 *tri = malloc((cnt ? cnt : 1) * sizeof *tri);
+	unsigned long *trifreq = malloc((cnt ? cnt : 1) * sizeof *trifreq);
+	size_t *pos = malloc((cnt ? cnt : 1) * sizeof *pos);
+	size_t i, tricnt = 0;
+	int ok = tri && trifreq && pos;
+	for (i = 0; ok && i < cnt; i++)
+	{
+		if (find[i].n > 3)
+		{
+			freq[i] = ngramnbin_freq(find + i, &obj->ngramnmap[find[i].n]);
+		}
+		else
+		{
+			tri[tricnt].id[0] = find[i].id[0];
+			tri[tricnt].id[1] = find[i].id[1];
+			tri[tricnt].id[2] = find[i].n == 3 ? find[i].id[2] : (uint32_t)IMPOSSIBLE_ID;
+			pos[tricnt++] = i;
+		}
+	}
+	ok = ok && ngram3bin_freq_many(tri, trifreq, tricnt, &obj->ngramap, &obj->bigramap,
+				       &obj->bloomap, stats);
+	for (i = 0; ok && i < tricnt; i++)
+		freq[pos[i]] = trifreq[i];
+	free(tri);
+	free(trifreq);
+	free(pos);
+	return ok;
+}
+
+static PyObject *ngram3binpy_freq_many(PyObject *self, PyObject *args)
+{
+	ngram3bin *obj = (ngram3bin *)self;
+	PyObject *o, *res = NULL;
+	ngramn *find = NULL;
+	unsigned long *freq;
+	Py_ssize_t i, cnt;
+	ngram3bloom_stats stats = { 0, 0, 0 };
+	int ok = 0;
+	if (!PyArg_ParseTuple(args, "O", &o))
+		return NULL;
+#ifdef PY3K
+	if (PyObject_CheckBuffer(o))
+#else
+	if (PyObject_CheckReadBuffer(o))
+#endif
+		cnt = ngram3bin_buf2find(o, &find);
+	else
+		cnt = ngram3bin_seq2find(o, &find);
+	if (cnt < 0)
+		return NULL;
+	for (i = 0; i < cnt; i++)
+	{
+		if (find[i].n > 3 && !obj->ngramnmap[find[i].n].m)
+		{
+			PyErr_Format(PyExc_ValueError, "no ngram%u.bin to look up %u ids in",
+				     find[i].n, find[i].n);
+			free(find);
+			return NULL;
+		}
+	}
+	if ((freq = malloc((cnt ? cnt : 1) * sizeof *freq)))
+	{
+		Py_BEGIN_ALLOW_THREADS
+		ok = ngram3bin_freqn_many(obj, find, freq, cnt, &stats);
+		Py_END_ALLOW_THREADS
+		ngram3bin_bloomstats_add(obj, &stats);
+	}
+	if (!ok)
+	{
+		PyErr_NoMemory();
+	}
+	else if ((res = PyList_New(cnt)))
+	{
+		for (i = 0; i < cnt; i++)
+			PyList_SET_ITEM(res, i, PyLong_FromUnsignedLong(freq[i]));
+	}
+	free(freq);
+	free(find);
+	return res;
+}
+
+/*
+ * counters since open, as a dict
+ *	bloom_rejected	(x,y,z) lookups the bloom filter answered alone
+ *	bloom_passed	(x,y,z) lookups it let through to a search...
+ *	bloom_falsepos	...which then found nothing
+ * all are 0 if there is no filter
+ */
+static PyObject *ngram3binpy_stats(PyObject *self, PyObject *args)
+{
+	ngram3bin *obj = (ngram3bin *)self;
+	return Py_BuildValue("{s:k,s:k,s:k}",
+		"bloom_rejected", obj->bloomstats.rejected,
+		"bloom_passed", obj->bloomstats.passed,
+		"bloom_falsepos", obj->bloomstats.falsepos);
+}
+
 /*
  * given the results of an ngram3_find() call,
  * import them into a python list of 4-tuples [(x,y,z,freq),...]
@@ -406,7 +989,11 @@ static PyObject *ngram3binpy_like(PyObject *self, PyObject *args)
 	{
 		if (obj->ngramap.m)
 		{
-			ngram3 *f = ngram3bin_like_better(find, &obj->ngramap, &obj->ngramap_index);
+			ngram3 *f;
+			Py_BEGIN_ALLOW_THREADS
+			f = ngram3bin_like_better(find, &obj->ngramap, &obj->ngramap_index,
+						  &obj->ngramap_perm);
+			Py_END_ALLOW_THREADS
 			res = ngram3_find_res2py(f);
 			free(f);
 		}
@@ -447,7 +1034,20 @@ static PyObject * ngram3_follows_res2py(const ngram3 *f)
 	return res;
 }
 
-static PyObject *ngram3binpy_follows(PyObject *self, PyObject *args)
+/*
+ * the words next to find in direction dir, from the .follows or .precedes
+ * sidecar if there is one, otherwise the hard way
+ */
+static ngram3 * ngram3bin_adjacent(ngram3bin *obj, const ngram3 *find, int dir)
+{
+	const struct ngram3map *adj = dir > 0 ? &obj->followmap : &obj->precedemap;
+	if (adj->m)
+		return ngram3adj_get(find, adj);
+	return dir > 0 ? ngram3bin_follows(find, &obj->ngramap)
+		       : ngram3bin_precedes(find, &obj->ngramap);
+}
+
+static PyObject *ngram3binpy_adjacent(PyObject *self, PyObject *args, int dir)
 {
 	PyObject *res = NULL;
 	ngram3bin *obj = (ngram3bin *)self;
@@ -456,7 +1056,10 @@ static PyObject *ngram3binpy_follows(PyObject *self, PyObject *args)
 	{
 		if (obj->ngramap.m)
 		{
-			ngram3 *f = ngram3bin_follows(&find, &obj->ngramap);
+			ngram3 *f;
+			Py_BEGIN_ALLOW_THREADS
+			f = ngram3bin_adjacent(obj, &find, dir);
+			Py_END_ALLOW_THREADS
 			res = ngram3_follows_res2py(f);
 			free(f);
 		}
@@ -468,3 +1071,355 @@ static PyObject *ngram3binpy_follows(PyObject *self, PyObject *args)
 	return res;
 }
 
+static PyObject *ngram3binpy_follows(PyObject *self, PyObject *args)
+{
+	return ngram3binpy_adjacent(self, args, 1);
+}
+
+/*
+ * follows(), but the words that come before
+ */
+static PyObject *ngram3binpy_precedes(PyObject *self, PyObject *args)
+{
+	return ngram3binpy_adjacent(self, args, -1);
+}
+
+/*
+ * like(), as an ngram3buf of rows (x,y,z,freq)
+ */
+static PyObject *ngram3binpy_like_buf(PyObject *self, PyObject *args)
+{
+	ngram3bin *obj = (ngram3bin *)self;
+	ngram3 find;
+	ngram3 *f = NULL;
+	if (!PyArg_ParseTuple(args, "III", find.id+0, find.id+1, find.id+2))
+		return NULL;
+	if (obj->ngramap.m)
+	{
+		Py_BEGIN_ALLOW_THREADS
+		f = ngram3bin_like_better(find, &obj->ngramap, &obj->ngramap_index,
+					  &obj->ngramap_perm);
+		Py_END_ALLOW_THREADS
+	}
+	return ngram3buf_from_res(f);
+}
+
+/*
+ * follows(), as an ngram3buf of rows (word_id,0,0,freq)
+ */
+static PyObject *ngram3binpy_follows_buf(PyObject *self, PyObject *args)
+{
+	ngram3bin *obj = (ngram3bin *)self;
+	ngram3 find;
+	ngram3 *f = NULL;
+	if (!PyArg_ParseTuple(args, "I", find.id+0))
+		return NULL;
+	if (obj->ngramap.m)
+	{
+		Py_BEGIN_ALLOW_THREADS
+		f = ngram3bin_adjacent(obj, &find, 1);
+		Py_END_ALLOW_THREADS
+	}
+	return ngram3buf_from_res(f);
+}
+
+/*
+ * the length in characters of every word, by id, as an ngram3buf
+ * so word lengths can be compared without creating the words
+ */
+static PyObject *ngram3binpy_wordlens(PyObject *self, PyObject *args)
+{
+	ngram3bin *obj = (ngram3bin *)self;
+	uint32_t *len = malloc((obj->word.cnt ? obj->word.cnt : 1) * sizeof *len);
+	unsigned long id;
+	if (!len)
+		return PyErr_NoMemory();
+	for (id = 0; id < obj->word.cnt; id++)
+	{
+		const unsigned char *c = (const unsigned char *)obj->word.word[id].str;
+		const unsigned char *end = c + obj->word.word[id].len;
+		// count utf-8 lead bytes
+		for (len[id] = 0; c < end; c++)
+			len[id] += (*c & 0xc0) != 0x80;
+	}
+	return ngram3buf_new(len, obj->word.cnt, 1);
+}
+
+/*
+ * deletes(word[, maxdist=2]): the words that may be within maxdist edits of word,
+ * from word.bin.deletes; a superset, so check them. None if there is no index,
+ * or it wasn't built for maxdist
+ */
+static PyObject *ngram3binpy_deletes(PyObject *self, PyObject *args)
+{
+	ngram3bin *obj = (ngram3bin *)self;
+	const ngramdel *hdr = obj->delmap.m ? ngram3sidecar_start(&obj->delmap) : NULL;
+	unsigned maxdist = NGRAMDEL_MAXDIST;
+	PyObject *o, *key, *res;
+	uint32_t *ids;
+	size_t cnt = 0, i;
+	if (!PyArg_ParseTuple(args, "O|I", &o, &maxdist))
+		return NULL;
+	if (!(key = ngram3bin_utf8(o)))
+		return NULL;
+	if (!hdr || maxdist > hdr->maxdist)
+	{
+		Py_DECREF(key);
+		Py_RETURN_NONE;
+	}
+	Py_BEGIN_ALLOW_THREADS
+	ids = ngramdel_lookup(PyBytes_AS_STRING(key), (unsigned)PyBytes_GET_SIZE(key), maxdist,
+			      &obj->delmap, &obj->word, &cnt);
+	Py_END_ALLOW_THREADS
+	Py_DECREF(key);
+	if (!(res = PyList_New(cnt)))
+	{
+		free(ids);
+		return NULL;
+	}
+	for (i = 0; i < cnt; i++)
+	{
+		const struct wordlen *w = obj->word.word + ids[i];
+		PyObject *word = PyUnicode_DecodeUTF8(w->str, w->len, NULL);
+		if (!word)
+		{
+			Py_DECREF(res);
+			free(ids);
+			return NULL;
+		}
+		PyList_SET_ITEM(res, i, word);
+	}
+	free(ids);
+	return res;
+}
+
+/*
+ * within(word[, maxdist=2]): [(word, distance), ...] for every word within maxdist
+ * edits of word, most frequent first, from word.bin.trie. None if there is no trie
+ */
+static PyObject *ngram3binpy_within(PyObject *self, PyObject *args)
+{
+	ngram3bin *obj = (ngram3bin *)self;
+	unsigned maxdist = 2;
+	PyObject *o, *key, *res;
+	ngramtriehit *hit;
+	size_t cnt = 0, i;
+	if (!PyArg_ParseTuple(args, "O|I", &o, &maxdist))
+		return NULL;
+	if (!(key = ngram3bin_utf8(o)))
+		return NULL;
+	if (!obj->triemap.m)
+	{
+		Py_DECREF(key);
+		Py_RETURN_NONE;
+	}
+	if (maxdist > NGRAMTRIE_MAXDIST)
+	{
+		Py_DECREF(key);
+		PyErr_Format(PyExc_ValueError, "maxdist must be at most %u", NGRAMTRIE_MAXDIST);
+		return NULL;
+	}
+	Py_BEGIN_ALLOW_THREADS
+	hit = ngramtrie_within(PyBytes_AS_STRING(key), (unsigned)PyBytes_GET_SIZE(key), maxdist,
+			       &obj->triemap, &obj->word, &cnt);
+	Py_END_ALLOW_THREADS
+	Py_DECREF(key);
+	if (!(res = PyList_New(cnt)))
+	{
+		free(hit);
+		return NULL;
+	}
+	for (i = 0; i < cnt; i++)
+	{
+		const struct wordlen *w = obj->word.word + hit[i].id;
+		PyObject *word = PyUnicode_DecodeUTF8(w->str, w->len, NULL),
+			 *t = word ? Py_BuildValue("(NI)", word, hit[i].dist) : NULL;
+		if (!t)
+		{
+			Py_DECREF(res);
+			free(hit);
+			return NULL;
+		}
+		PyList_SET_ITEM(res, i, t);
+	}
+	free(hit);
+	return res;
+}
+
+/*
+ * splits(word) -> [((word, word[, word]), freq), ...], the ways word splits into two or
+ * three frequent words, most frequent first; None if there's no ngram3.bin.splits
+ */
+static PyObject *ngram3binpy_splits(PyObject *self, PyObject *args)
+{
+	ngram3bin *obj = (ngram3bin *)self;
+	PyObject *o, *key, *res;
+	const ngram3splitent *ent = NULL;
+	unsigned long id;
+	size_t cnt = 0, i, j;
+	if (!PyArg_ParseTuple(args, "O", &o))
+		return NULL;
+	if (!(key = ngram3bin_utf8(o)))
+		return NULL;
+	if (!obj->splitmap.m)
+	{
+		Py_DECREF(key);
+		Py_RETURN_NONE;
+	}
+	id = ngram3bin_key2id(obj, key);
+	Py_DECREF(key);
+	if (id != UNKNOWN_ID && id < obj->word.cnt)
+		ent = ngram3split_get(id, &obj->splitmap, &cnt);
+	if (!(res = PyList_New(cnt)))
+		return NULL;
+	for (i = 0; i < cnt; i++)
+	{
+		const size_t n = ent[i].id[2] == UNKNOWN_ID ? 2 : 3;
+		PyObject *words = PyTuple_New(n),
+			 *t = NULL;
+		for (j = 0; words && j < n; j++)
+		{
+			const struct wordlen *w = obj->word.word + ent[i].id[j];
+			PyObject *word = PyUnicode_DecodeUTF8(w->str, w->len, NULL);
+			if (!word)
+			{
+				Py_CLEAR(words);
+				break;
+			}
+			PyTuple_SET_ITEM(words, j, word);
+		}
+		if (words)
+			t = Py_BuildValue("(NI)", words, ent[i].freq);
+		if (!t)
+		{
+			Py_DECREF(res);
+			return NULL;
+		}
+		PyList_SET_ITEM(res, i, t);
+	}
+	return res;
+}
+
+/*
+ * append the characters of string o to *ch, growing it as needed; 0 and a python
+ * exception if o isn't a string or we ran out of memory
+ */
+static int ngram3bin_chars(PyObject *o, uint32_t **ch, size_t *cnt, size_t *max)
+{
+	PyObject *key;
+	const unsigned char *s;
+	Py_ssize_t len, i;
+	if (PyUnicode_Check(o))
+	{
+		if (!(key = PyUnicode_AsUTF8String(o)))
+			return 0;
+	}
+	else if (PyBytes_Check(o))
+	{
+		key = o;
+		Py_INCREF(key);
+	}
+	else
+	{
+		PyErr_SetString(PyExc_TypeError, "expected strings");
+		return 0;
+	}
+	s = (const unsigned char *)PyBytes_AS_STRING(key);
+	len = PyBytes_GET_SIZE(key);
+	if (*cnt + len > *max)
+	{
+		size_t newmax = (*cnt + len) * 2 + 16;
+		uint32_t *tmp = realloc(*ch, newmax * sizeof *tmp);
+		if (!tmp)
+		{
+			Py_DECREF(key);
+			PyErr_NoMemory();
+			return 0;
+		}
+		*ch = tmp;
+		*max = newmax;
+	}
+	for (i = 0; i < len && s[i] < 0x80; i++)
+		;
+	if (i == len)
+	{
+		// ascii needs no decoding
+		for (i = 0; i < len; i++)
+			(*ch)[*cnt + i] = s[i];
+		*cnt += len;
+	}
+	else
+	{
+		*cnt += ngramtrie_decode((const char *)s, (unsigned)len, *ch + *cnt, (unsigned)len);
+	}
+	Py_DECREF(key);
+	return 1;
+}
+
+/*
+ * damlev_many(word, [other, ...][, maxdist]) -> [distance, ...]: the optimal string
+ * alignment distance from word to each other; any more than maxdist is maxdist + 1
+ */
+static PyObject *ngram3binpy_damlev_many(PyObject *self, PyObject *args)
+{
+	PyObject *word, *words, *seq, *res = NULL;
+	unsigned maxdist = UINT_MAX - 1, *dist = NULL, *row = NULL;
+	uint32_t *ch = NULL;
+	size_t *off = NULL, chcnt = 0, chmax = 0, longest = 0;
+	Py_ssize_t cnt, i;
+	int ok = 1;
+	if (!PyArg_ParseTuple(args, "OO|I", &word, &words, &maxdist))
+		return NULL;
+	if (maxdist >= UINT_MAX)
+		maxdist = UINT_MAX - 1;
+	if (!(seq = PySequence_Fast(words, "expected a sequence of words")))
+		return NULL;
+	cnt = PySequence_Fast_GET_SIZE(seq);
+	// word's characters, then each other's
+	off = malloc((cnt + 2) * sizeof *off);
+	dist = malloc((cnt + 1) * sizeof *dist);
+	if (!off || !dist)
+	{
+		PyErr_NoMemory();
+		ok = 0;
+	}
+	else
+	{
+		off[0] = 0;
+		ok = ngram3bin_chars(word, &ch, &chcnt, &chmax);
+		off[1] = chcnt;
+		for (i = 0; ok && i < cnt; i++)
+		{
+			ok = ngram3bin_chars(PySequence_Fast_GET_ITEM(seq, i), &ch, &chcnt, &chmax);
+			off[i + 2] = chcnt;
+			if (off[i + 2] - off[i + 1] > longest)
+				longest = off[i + 2] - off[i + 1];
+		}
+		if (ok && !(row = malloc(3 * (longest + 1) * sizeof *row)))
+		{
+			PyErr_NoMemory();
+			ok = 0;
+		}
+	}
+	if (ok)
+	{
+		Py_BEGIN_ALLOW_THREADS
+		for (i = 0; i < cnt; i++)
+			dist[i] = ngram_damlev(ch, off[1], ch + off[i + 1], off[i + 2] - off[i + 1], maxdist, row);
+		Py_END_ALLOW_THREADS
+		if ((res = PyList_New(cnt)))
+			for (i = 0; i < cnt; i++)
+#ifdef PY3K
+				PyList_SET_ITEM(res, i, PyLong_FromLong((long)dist[i]));
+#else
+				/* an int, not a long: py2 won't have longs back from cmp functions */
+				PyList_SET_ITEM(res, i, PyInt_FromLong((long)dist[i]));
+#endif
+	}
+	free(row);
+	free(dist);
+	free(off);
+	free(ch);
+	Py_DECREF(seq);
+	return res;
+}
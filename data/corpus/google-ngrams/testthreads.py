@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+hammer a single ngram3bin object from many threads at once and check every
+answer against the same lookups made from one thread
+
+builds its own small word.bin and ngram3.bin, so all it needs is the module:
+
+$ python setup.py build_ext --inplace
+$ python testthreads.py
+"""
+
+import os, random, shutil, struct, tempfile, threading, unittest
+from ngram3bin import ngram3bin
+
+Words = 300
+NGrams = 20000
+Threads = 8
+Rounds = 10
+
+def mkfixture(path, seed=1):
+	"""
+	write word.bin and ngram3.bin in path, return the sorted (x,y,z)s
+	"""
+	rnd = random.Random(seed)
+	with open(os.path.join(path, 'word.bin'), 'wb') as f:
+		for i in range(Words):
+			w = ('w%d' % i).encode('utf-8')
+			f.write(struct.pack('<i', len(w)) + w + b'\0' * (1 + ((len(w)+1) % 4)))
+	ngrams = {}
+	while len(ngrams) < NGrams:
+		# skewed towards low ids, like real text, so like() has plenty to find
+		ng = tuple(min(int(rnd.expovariate(1 / 40.)), Words - 1) for _ in range(3))
+		ngrams[ng] = rnd.randint(1, 1000)
+	with open(os.path.join(path, 'ngram3.bin'), 'wb') as f:
+		for ng in sorted(ngrams):
+			f.write(struct.pack('<4I', *(ng + (ngrams[ng],))))
+	return sorted(ngrams)
+
+class ThreadTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		ngrams = mkfixture(self.dir)
+		self.ng = ngram3bin(os.path.join(self.dir, 'word.bin'),
+				    os.path.join(self.dir, 'ngram3.bin'))
+		hits = random.Random(2).sample(ngrams, 200)
+		self.probes = hits + [(x, y, (z + 1) % Words) for x,y,z in hits]
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def lookups(self):
+		ng = self.ng
+		return ([ng.freq(*p) for p in self.probes],
+			[ng.freq(*p[:2]) for p in self.probes[:20]],
+			[sorted(ng.like(*p)) for p in self.probes[:20]],
+			ng.freq_many(self.probes))
+
+	def test_threads(self):
+		expect = self.lookups()
+		self.assertTrue(any(expect[0]))
+		self.assertTrue(any(expect[2]))
+		errors = []
+		def run():
+			try:
+				for _ in range(Rounds):
+					if self.lookups() != expect:
+						errors.append('results differ')
+						return
+			except Exception as e:
+				errors.append(e)
+		threads = [threading.Thread(target=run) for _ in range(Threads)]
+		for t in threads:
+			t.start()
+		for t in threads:
+			t.join()
+		self.assertEqual([], errors)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ex: set ts=8 noet:
+
+"""
+what Chick.candidates() costs per ngram of a document: how many candidates, how many
+objects and bytes each scored candidate holds on to beyond the document's own tokens,
+and, where tracemalloc is available (python 3), the peak memory of working them out
+
+Usage: benchsuggest.py [ngram dir [files...]]
+the files default to ../test/*.txt
+"""
+
+import sys, glob, time, inspect
+from numbers import Number
+try:
+	import tracemalloc
+except ImportError:
+	tracemalloc = None
+from chick import Chick
+from doc import Doc
+from ngramdiff import NGramDiffScore
+
+def footprint(objs, shared):
+	"""
+	(objects, bytes) reachable from objs but not through shared. numbers and None
+	are left out, small ones are shared by everyone anyway
+	"""
+	seen = set(id(o) for o in shared)
+	todo = list(objs)
+	n = size = 0
+	while todo:
+		o = todo.pop()
+		if o is None or isinstance(o, Number) or id(o) in seen:
+			continue
+		seen.add(id(o))
+		n += 1
+		size += sys.getsizeof(o)
+		if isinstance(o, (tuple, list)):
+			todo.extend(o)
+		elif isinstance(o, dict):
+			todo.extend(o.values())
+		else:
+			if hasattr(o, '__dict__'):
+				todo.append(o.__dict__)
+			for cls in inspect.getmro(o.__class__):
+				todo.extend(getattr(o, k) for k in getattr(cls, '__slots__', ()) if hasattr(o, k))
+	return n, size
+
+def bench(c, lines):
+	ngrams = cands = objs = size = 0
+	peaks = []
+	start = time.time()
+	for line in lines:
+		d = Doc([line], c.w)
+		shared = [t for toks in d.tok for t in toks]
+		shared += [t[0] for t in shared]
+		for ng in d.ngrams(3):
+			freq = c.g.freq([t[0] for t in ng])
+			if tracemalloc:
+				tracemalloc.start()
+			scored = [NGramDiffScore(ngd, c.p) for ngd in c.candidates(ng, freq, d)]
+			if tracemalloc:
+				peaks.append(tracemalloc.get_traced_memory()[1])
+				tracemalloc.stop()
+			n, s = footprint(scored, shared)
+			ngrams += 1
+			cands += len(scored)
+			objs += n
+			size += s
+	elapsed = time.time() - start
+	per = float(max(cands, 1))
+	print('%6u ngrams %8u candidates %6.1f/ngram %6.1f objects %7.1f bytes/candidate %6.2fs' % \
+		(ngrams, cands, cands / float(max(ngrams, 1)), objs / per, size / per, elapsed))
+	if peaks:
+		print('peak %8.0f bytes/ngram mean %8u max' % (sum(peaks) / float(len(peaks)), max(peaks)))
+
+if __name__ == '__main__':
+	ngdir = sys.argv[1] if len(sys.argv) > 1 else '../data/corpus/google-ngrams'
+	paths = sys.argv[2:] or glob.glob('../test/*.txt')
+	lines = []
+	for path in paths:
+		with open(path, 'rb') as f:
+			lines.extend(l for l in f.read().decode('utf8').splitlines() if l.strip())
+	c = Chick(ngdir)
+	bench(c, lines)
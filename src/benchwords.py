@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# ex: set ts=8 noet:
+
+"""
+words per second through Words.similar() and Words.correct(), with neither,
+word.bin.deletes and word.bin.trie, and whether they agree
+
+Usage: benchwords.py [ngram dir [words...]]
+the words default to every one in ../test/*.txt, each with a couple of typos
+"""
+
+import sys, re, glob, random, time
+from ngram3bin import ngram3bin
+from word import Words, NGram3BinWordCounter, edits1
+
+class NoIndex(NGram3BinWordCounter):
+	def candidates(self, word, d):
+		return None
+
+class DeletesOnly(NGram3BinWordCounter):
+	def candidates(self, word, d):
+		return self.ng.deletes(word, d)
+
+def test_words():
+	words = set()
+	for path in glob.glob('../test/*.txt'):
+		with open(path, 'rb') as f:
+			words.update(re.findall(u'[a-z]+', f.read().decode('utf8').lower()))
+	rnd = random.Random(1)
+	typos = []
+	for w in sorted(words):
+		for _ in range(rnd.randint(0, 2)):
+			w = rnd.choice(sorted(edits1(w)))
+		typos.append(w)
+	return typos
+
+def bench(name, f, words):
+	start = time.time()
+	res = [f(w) for w in words]
+	elapsed = time.time() - start
+	print('%-24s %6u words %10.1f words/sec' % (name, len(words), len(words) / elapsed))
+	return res
+
+if __name__ == '__main__':
+	ngdir = sys.argv[1] if len(sys.argv) > 1 else '../data/corpus/google-ngrams'
+	ng = ngram3bin(ngdir + '/word.bin', ngdir + '/ngram3.bin')
+	words = [w.decode('utf8') if isinstance(w, bytes) else w for w in sys.argv[2:]] or test_words()
+	plain = Words(NoIndex(ng))
+	indexed = []
+	if ng.deletes(u'') is None:
+		print('no %s/word.bin.deletes' % ngdir)
+	else:
+		indexed.append(('deletes', Words(DeletesOnly(ng))))
+	if ng.within(u'') is None:
+		print('no %s/word.bin.trie' % ngdir)
+	else:
+		indexed.append(('trie', Words(NGram3BinWordCounter(ng))))
+	for fn in ('similar', 'correct'):
+		exp = bench(fn, getattr(plain, fn), words)
+		for name, w in indexed:
+			got = bench(fn + '+' + name, getattr(w, fn), words)
+			bad = [w for w, x, y in zip(words, exp, got) if x != y]
+			print('%-24s %6u differ %s' % ('', len(bad), ' '.join(bad[:10])))
@@ -24,7 +24,6 @@ Mutations
 
 TODO:
 	* figure out how to handle apostrophes
-	* pre-calculate token joining and merging
 
 """
 
@@ -43,14 +42,17 @@ def handleError(self, record):
 logging.Handler.handleError = handleError
 
 from math import log
-from itertools import takewhile, dropwhile, product, cycle, chain
+from itertools import dropwhile, cycle, chain, islice
 from collections import defaultdict
+from functools import reduce, cmp_to_key
+from contextlib import contextmanager
 import bz2, sys, re, os
-import copy
+import copy, heapq
+import unittest
 from word import Words,NGram3BinWordCounter
 from phon import Phon
 from gram import Grams
-from grambin import GramsBin
+from grambin import GramsBin,GramsCache
 from doc import Doc
 
 logger.debug('sys.version=' + sys.version)
@@ -96,30 +98,6 @@ def lineno():
     """Returns the current line number in our program."""
     return inspect.currentframe().f_back.f_lineno
 
-# TODO: modify levenshtein to weight score based on what has changed;
-# - transpositions should count less than insertions/deletions
-# - changes near the front of the word should count more than the end
-# - for latin alphabets changes to vowels should count less than consonants
-def levenshtein(a,b):
-	"Calculates the Levenshtein distance between a and b."
-	n, m = len(a), len(b)
-	if n > m:
-		# Make sure n <= m, to use O(min(n,m)) space
-		a,b = b,a
-		n,m = m,n
-
-	current = range(n+1)
-	for i in range(1,m+1):
-		previous, current = current, [i]+[0]*n
-		for j in range(1,n+1):
-			add, delete = previous[j]+1, current[j-1]+1
-			change = previous[j-1]
-			if a[j-1] != b[i-1]:
-				change = change + 1
-			current[j] = min(add, delete, change)
-
-	return current[n]
-
 def list2ngrams(l, size):
 	"""
 	split l into overlapping ngrams of size
@@ -130,18 +108,53 @@ def list2ngrams(l, size):
 	return [tuple(l[i:i+size]) for i in range(len(l)-size+1)]
 
 class Chick:
-	def __init__(self):
+	# ways of splitting a phrase's sounds into words phonGuess() considers, best first
+	PhonSplits = 64
+	# most frequent words phonGuess() tries for each part of a split
+	PhonCands = 16
+	# partial sentences phonBeam() keeps after each part
+	PhonBeam = 32
+	# edit distance charged for inserting or deleting a whole word, whatever its length
+	InsDelPenalty = 3
+	# an insertion or deletion must make the ngram this many times more frequent,
+	# and at least InsDelMinFreq frequent, to be suggested at all: there's always some
+	# filler word or other that makes a rare ngram a little more common
+	InsDelGain = 10
+	InsDelMinFreq = 100
+	# do_suggest() results kept between requests: for at most this many ngrams,
+	# roughly this many bytes between them, and this many seconds (None: forever)
+	SuggestCacheSize = 100000
+	SuggestCacheBytes = 64 << 20
+	SuggestCacheTTL = None
+	# a sqlite database to keep them in as well, for other processes and for after
+	# we've gone; None for none. somewhere only we can write to, not /var/tmp
+	SuggestStorePath = None
+	# bump whenever do_suggest() would say something new of the same ngram database,
+	# or suggdump() something different
+	SuggestVersion = 3
+
+	# FIXME: using absolute paths is the easiest way to make us work from cmdline and invoked
+	# in a web app. perhaps we could set up softlinks in /var/ to make this slightly more respectable.
+	def __init__(self, ngdir='/home/pizza/proj/spill-chick/data/corpus/google-ngrams/'):
 		# initialize all "global" data
 		logger.debug('loading...')
 		logger.debug('  corpus...')
-		# FIXME: using absolute paths is the easiest way to make us work from cmdline and invoked
-		# in a web app. perhaps we could set up softlinks in /var/ to make this slightly more respectable.
-		self.g = GramsBin(
-			'/home/pizza/proj/spill-chick/data/corpus/google-ngrams/word.bin',
-			'/home/pizza/proj/spill-chick/data/corpus/google-ngrams/ngram3.bin')
+		ngdir = os.path.join(ngdir, '')
+		self.g = GramsBin(ngdir + 'word.bin', ngdir + 'ngram3.bin',
+			*[p if os.path.exists(p) else None for p in (ngdir + 'ngram4.bin', ngdir + 'ngram5.bin')])
 		self.w = Words(NGram3BinWordCounter(self.g.ng))
 		logger.debug('  phon')
 		self.p = Phon(self.w, self.g)
+		# phonGuess() counters: sentences tried, dropped at minfreq, dropped off the beam,
+		# and words left out of parts beyond PhonCands
+		self.phonstats = defaultdict(int)
+		# calc_suggest() counters: candidates scored, those that couldn't have made its
+		# best and weren't, and times it stopped early with the best there could be
+		self.candstats = defaultdict(int)
+		# do_suggest() says the same of an ngram for as long as the database stays the same,
+		# however many documents and requests it turns up in. stats() says how often it did
+		self.suggcache = LRU(self.SuggestCacheSize, self.SuggestCacheBytes, self.SuggestCacheTTL)
+		self.suggstore = self.open_suggstore()
 		logger.debug('done.')
 		# sanity-check junk
 		"""
@@ -163,7 +176,6 @@ class Chick:
 		logger.debug('g.freq((they,\',re))=%s' % self.g.freq((u'they',u"'",u're')))
 		"""
 
-	# FIXME: soundsToWords is expensive and should only be run as a last resort
 	def phonGuess(self, toks, minfreq):
 		"""
 		given a list of tokens search for a list of words with similar pronunciation
@@ -172,42 +184,68 @@ class Chick:
 		# create a phonetic signature of the ngram
 		phonsig = self.p.phraseSound(toks)
 		logger.debug('phonsig=%s' % phonsig)
-		phonwords = list(self.p.soundsToWords(phonsig))
+		phonwords = list(islice(self.p.soundsToWords(phonsig), self.PhonSplits))
 		logger.debug('phonwords=%s' % (phonwords,))
-		if phonwords == [[]]:
-			phonpop = []
-		else:
-			# remove any words that do not meet the minimum frequency;
-			# they cannot possibly be part of the answer
-			phonwords2 = [[[w for w in p if self.g.freq(tuple(w)) > minfreq]
-						for p in pw]
-							for pw in phonwords]
-			logger.debug('phonwords2 lengths=%s product=%u' % \
-				(' '.join([str(len(p)) for p in phonwords2[0]]),
-				 reduce(lambda x,y:x*y, [len(p) for p in phonwords2[0]])))
-			if not all(phonwords2):
-				return []
-			#logger.debug('phonwords2=(%u)%s...' % (len(phonwords2), phonwords2[:10],))
-			# remove any signatures that contain completely empty items after previous
-			phonwords3 = phonwords2
-			#logger.debug('phonwords3=(%u)%s...' % (len(phonwords3), phonwords3))
-			# FIXME: product() function is handy in this case but is potentially hazardous.
-			# we should force a limit to the length of any list passed to it to ensure
-			# the avoidance of any pathological, memory-filling, swap-inducing behavior
-			phonwords4 = list(flatten([list(product(*pw)) for pw in phonwords3]))
-			logger.debug('phonwords4=(%u)%s...' % (len(phonwords4), phonwords4[:20]))
-			# look up ngram popularity, toss anything not more popular than original and sort
-			phonwordsx = [tuple(flatten(p)) for p in phonwords4]
-
-			phonpop = rsort1([(pw, self.g.freq(pw, min)) for pw in phonwordsx])
-			#logger.debug('phonpop=(%u)%s...' % (len(phonpop), phonpop[:10]))
-			phonpop = list(takewhile(lambda x:x[1] > minfreq, phonpop))
-			#logger.debug('phonpop=%s...' % (phonpop[:10],))
-		if phonpop == []:
+		if phonwords == [[]] or phonwords == []:
+			return []
+		# remove any words that do not meet the minimum frequency;
+		# they cannot possibly be part of the answer
+		cand = list(set(tuple(w) for pw in phonwords for p in pw for w in p))
+		candfreq = dict(zip(cand, self.g.freq_batch(cand)))
+		phonpop = []
+		for pw in phonwords:
+			parts = []
+			for p in pw:
+				p = [tuple(w) for w in p if candfreq[tuple(w)] > minfreq]
+				self.phonstats['capped'] += max(0, len(p) - self.PhonCands)
+				parts.append(heapq.nlargest(self.PhonCands, p, key=candfreq.get))
+			if all(parts):
+				phonpop.extend(self.phonBeam(parts, minfreq))
+		top = heapq.nlargest(10, phonpop, key=itemgetter(1))
+		logger.debug('phonpop=(%u)%s... phonstats=%s' % (len(phonpop), top, dict(self.phonstats)))
+		if top == []:
 			return []
-		best = phonpop[0][0]
+		best = top[0][0]
 		return [[x] for x in best]
 
+	def phonBeam(self, parts, minfreq):
+		"""
+		pick a word for each of parts in turn, keeping only the PhonBeam best sentences
+		so far: [(sentence, freq), ...] for those left at the end, freq as
+		g.freq_batch(..., min) has it, i.e. the sentence's own frequency while it's no
+		longer than g.order, and its least frequent window of g.order words after that.
+		adding words only ever lowers it, so a sentence at minfreq is dropped at once
+		"""
+		n = self.g.order
+		# (sentence, freq, least frequent whole window so far)
+		beam = [((), 0, None)]
+		for p in parts:
+			ext = []
+			for sent, _, lowest in beam:
+				for w in p:
+					s = sent + w
+					if len(s) <= n:
+						probes = [s]
+					else:
+						probes = [s[e-n:e] for e in range(max(n, len(sent)+1), len(s)+1)]
+					ext.append((s, lowest, probes))
+			self.phonstats['hypotheses'] += len(ext)
+			probes = list(set(pr for _, _, prs in ext for pr in prs))
+			freq = dict(zip(probes, self.g.freq_batch(probes)))
+			beam = []
+			for s, lowest, prs in ext:
+				if len(s) >= n:
+					lowest = min([freq[pr] for pr in prs] + ([lowest] if lowest is not None else []))
+					f = lowest
+				else:
+					f = freq[s]
+				if f > minfreq:
+					beam.append((s, f, lowest))
+			self.phonstats['rare'] += len(ext) - len(beam)
+			self.phonstats['pruned'] += max(0, len(beam) - self.PhonBeam)
+			beam = heapq.nlargest(self.PhonBeam, beam, key=itemgetter(1))
+		return [(sent, f) for sent, f, _ in beam]
+
 	"""
 	return a list of ngrampos permutations where each token has been replaced by a word with
 	similar pronunciation, and g.freqs(word) > minfreq
@@ -215,30 +253,15 @@ class Chick:
 	def permphon(self, ngrampos, minfreq):
 		perms = []
 		for i in range(len(ngrampos)):
-			prefix = ngrampos[:i]
-			suffix = ngrampos[i+1:]
 			tokpos = ngrampos[i]
-			tok = tokpos[0]
-			sounds = self.p.word[tok]
-			if not sounds:
-				continue
-			#logger.debug('tok=%s sounds=%s' % (tok, sounds))
-			for sound in sounds:
-				soundslikes = self.p.phon[sound]
-				#logger.debug('tok=%s soundslikes=%s' % (tok, soundslikes))
-				for soundslike in soundslikes:
-					if len(soundslike) > 1:
-						continue
-					soundslike = soundslike[0]
-					if soundslike == tok:
-						continue
-					#logger.debug('soundslike %s -> %s' % (tok, soundslike))
-					if self.g.freqs(soundslike) <= minfreq:
-						continue
-					newtok = (soundslike,) + tokpos[1:]
-					damlev = damerau_levenshtein(tok, soundslike)
-					td = TokenDiff([tokpos], [newtok], damlev)
-					perms.append(NGramDiff(prefix, td, suffix, self.g, soundalike=True))
+			# most frequent first
+			for soundslike, freq, damlev in self.p.homophones(tokpos[0]):
+				if freq <= minfreq:
+					break
+				#logger.debug('soundslike %s -> %s' % (tokpos[0], soundslike))
+				newtok = (soundslike,) + tokpos[1:]
+				td = TokenDiff([tokpos], [newtok], damlev)
+				perms.append(NGramDiff(ngrampos[:i], td, ngrampos[i+1:], self.g, soundalike=True))
 		return perms
 
 	@staticmethod
@@ -247,17 +270,33 @@ class Chick:
 
 	def permjoin(self, l, minfreq):
 		"""
-		given a list of strings, produce permutations by joining two tokens together
-		example [a,b,c,d] -> [[ab,c,d],[a,bc,d],[a,b,cd]
+		given a list of strings, produce permutations by joining two or three tokens together
+		example [a,b,c,d] -> [[ab,c,d],[a,bc,d],[a,b,cd],[abc,d],[a,bcd]]
 		"""
+		cands = [(i, n) for n in (2, 3) for i in range(len(l)-n+1)]
+		joined = [reduce(Chick.ngrampos_merge, l[i:i+n]) for i,n in cands]
 		perms = []
-		if len(l) > 1:
-			for i in range(len(l)-1):
-				joined = Chick.ngrampos_merge(l[i],l[i+1])
-				if self.g.freqs(joined[0]) > minfreq:
-					td = TokenDiff(l[i:i+2], [joined], 1)
-					ngd = NGramDiff(l[:i], td, l[i+2:], self.g)
-					perms.append(ngd)
+		for (i, n), j, freq in zip(cands, joined, self.g.freqs_batch([j[0] for j in joined])):
+			if freq > minfreq:
+				td = TokenDiff(l[i:i+n], [j], n-1)
+				ngd = NGramDiff(l[:i], td, l[i+n:], self.g)
+				perms.append(ngd)
+		return perms
+
+	def permsplit(self, l, target_freq, topk=10):
+		"""
+		words may have been run together: produce permutations with a token split into
+		two or three words that commonly appear together
+		example [went,alot,further] -> [[went,a,lot,further],...]
+		"""
+		cands = [(i, parts) for i in range(len(l)) for parts,_ in self.g.splits(l[i][0])[:topk]]
+		newtoks = [[t[0] for t in l[:i]] + list(parts) + [t[0] for t in l[i+1:]] for i,parts in cands]
+		perms = []
+		for (i, parts), newfreq in zip(cands, self.g.freq_batch(newtoks, min)):
+			if newfreq <= target_freq:
+				continue
+			td = TokenDiff(l[i:i+1], [(p,) + l[i][1:] for p in parts], len(parts)-1)
+			perms.append(NGramDiff(l[:i], td, l[i+1:], self.g, target_freq, newfreq))
 		return perms
 
 	@staticmethod
@@ -290,40 +329,199 @@ class Chick:
 		#print 'intertoken_letterswap=',perms
 		return perms
 
-	def do_suggest(self, target_ngram, target_freq, ctx, d, max_suggest=5):
+	def insdel_improves(self, oldfreq, newfreq):
+		return newfreq >= max(oldfreq * self.InsDelGain, self.InsDelMinFreq)
+
+	def perminsert(self, l, target_freq, topk=10):
 		"""
-		given an infrequent ngram from a document, attempt to calculate a more frequent one
-		that is similar textually and/or phonetically but is more frequent
+		a word may have been omitted: produce permutations with a word inserted
+		between two adjacent tokens, one that commonly follows the first and
+		precedes the second
+		example [went,the,store] -> [[went,to,the,store],...]
 		"""
+		cands = []
+		for i in range(len(l)-1):
+			fol = dict(self.g.follows(l[i][0]))
+			pre = dict(self.g.precedes(l[i+1][0]))
+			# only words; punctuation goes between most anything
+			words = set(w for w in fol if w.isalpha()) & set(pre)
+			both = heapq.nsmallest(topk, words, key=lambda w:(-fol[w] * pre[w], w))
+			cands.extend((i, w) for w in both)
+		newtoks = [[t[0] for t in l[:i+1]] + [w] + [t[0] for t in l[i+1:]] for i,w in cands]
+		perms = []
+		# the new ngram is a word longer, so it's as frequent as its least frequent window
+		for (i, w), newfreq in zip(cands, self.g.freq_batch(newtoks, min)):
+			if not self.insdel_improves(target_freq, newfreq):
+				continue
+			# inserted in front of the token that follows it
+			newtok = (w,) + l[i+1][1:]
+			td = TokenDiff([], [newtok], self.InsDelPenalty)
+			perms.append(NGramDiff(l[:i+1], td, l[i+1:], self.g, target_freq, newfreq))
+		return perms
 
-		target_ngram = list(target_ngram)
-		part = []
+	def permdelete(self, l, target_freq, d):
+		"""
+		a word may have been inserted by mistake: produce permutations with one token
+		removed, where the tokens either side of it commonly follow one another.
+		the ngram is made up to size from the document so frequencies stay comparable
+		example [to,the,the] store -> [to,the,store]
+		"""
+		nxt = d.ngram_next(l[-1])
+		if len(l) < 2 or not nxt:
+			return []
+		cands = []
+		for i in range(len(l)):
+			rest = tuple(l[:i] + l[i+1:]) + (nxt,)
+			if i > 0:
+				fol = set(w for w,_ in self.g.follows(rest[i-1][0]))
+				if rest[i][0] not in fol:
+					continue
+			cands.append((i, rest))
+		perms = []
+		newfreqs = self.g.freq_batch([[t[0] for t in rest] for _,rest in cands])
+		for (i, rest), newfreq in zip(cands, newfreqs):
+			if not self.insdel_improves(target_freq, newfreq):
+				continue
+			td = TokenDiff(l[i:i+1], [], self.InsDelPenalty)
+			perms.append(NGramDiff(l[:i], td, rest[i:], self.g, target_freq, newfreq))
+		return perms
 
-		# permutations via token joining
-		# expense: cheap, though rarely useful
-		# TODO: smarter token joining; pre-calculate based on tokens
-		part += self.permjoin(target_ngram, target_freq)
-		#logger.debug('permjoin(%s)=%s' % (target_ngram, part,))
+	def open_suggstore(self):
+		"""
+		a SQLiteCache at SuggestStorePath for what do_suggest() works out from this
+		database, if we're to have one and can
+		"""
+		if not self.SuggestStorePath:
+			return None
+		if sqlite3 is None:
+			logger.debug('no sqlite3, not using %s' % self.SuggestStorePath)
+			return None
+		fingerprint = '%s %s' % (self.SuggestVersion, self.g.fingerprint())
+		try:
+			return SQLiteCache(self.SuggestStorePath, fingerprint, self.SuggestCacheSize, self.SuggestCacheTTL)
+		except sqlite3.Error as e:
+			logger.debug('not using %s: %s' % (self.SuggestStorePath, e))
+			return None
 
-		part += self.intertoken_letterswap(target_ngram, target_freq)
+	@staticmethod
+	def retoken(s, f):
+		"""
+		a copy of NGramDiffScore s with each of its tokens passed through f
+		"""
+		ngd = copy.copy(s.ngd)
+		ngd.prefix, ngd.suffix = f(ngd.prefix), f(ngd.suffix)
+		ngd.diff = copy.copy(ngd.diff)
+		ngd.diff.old, ngd.diff.new = f(ngd.diff.old), f(ngd.diff.new)
+		s = copy.copy(s)
+		s.ngd = ngd
+		return s
 
-		part += self.permphon(target_ngram, target_freq)
+	def do_suggest(self, target_ngram, target_freq, ctx, d, max_suggest=5):
+		"""
+		calc_suggest(), remembered in suggcache (and suggstore) by the words of target_ngram
+		and the one after it, which is all it looks at. every token it suggests takes its position
+		from one of those, so they're kept as (word, which of them) and given the
+		positions of wherever the ngram turns up next
+		"""
+		# a tuple, so every candidate's prefix and suffix are slices of it and no more
+		target_ngram = tuple(target_ngram)
+		frame = target_ngram + (d.ngram_next(target_ngram[-1]),)
+		key = (tuple(t[0] if t else None for t in frame), target_freq, max_suggest)
+		best = self.suggcache.get(key)
+		if best is None and self.suggstore is not None:
+			best = self.suggstore.get(key)
+			if best is not None:
+				best = Chick.suggload(best)
+				self.suggcache.put(key, best, Chick.suggsize(best))
+		if best is not None:
+			return [self.retoken(s, lambda l: tuple((w,) + frame[i][1:] for w,i in l)) for s in best]
+		best = self.calc_suggest(target_ngram, target_freq, ctx, d, max_suggest)
+		where = dict((t[1:], i) for i,t in enumerate(frame) if t)
+		try:
+			unbound = [self.retoken(s, lambda l: tuple((t[0], where[t[1:]]) for t in l)) for s in best]
+		except KeyError:
+			return best
+		self.suggcache.put(key, unbound, Chick.suggsize(unbound))
+		if self.suggstore is not None:
+			self.suggstore.put(key, Chick.suggdump(unbound))
+		return best
 
-		part += self.g.ngram_like(target_ngram, target_freq)
+	@staticmethod
+	def suggdump(best):
+		"""
+		do_suggest()'s unbound best as lists, for suggstore to keep as json
+		"""
+		return [[s.score, s.ediff, s.sl, s.ngd.prefix, s.ngd.diff.old, s.ngd.diff.new,
+			 s.ngd.diff.damlev, s.ngd.suffix, s.ngd.oldfreq, s.ngd.newfreq, s.ngd.soundalike]
+			for s in best]
 
-		logger.debug('part after ngram_like=(%u)%s...' % (len(part), part[:5],))
+	@staticmethod
+	def suggload(rows):
+		"""
+		suggdump()'s lists back as NGramDiffScores
+		"""
+		toks = lambda l: tuple(tuple(t) for t in l)
+		best = []
+		for score, ediff, sl, prefix, old, new, damlev, suffix, oldfreq, newfreq, soundalike in rows:
+			ngd = NGramDiff(toks(prefix), TokenDiff(toks(old), toks(new), damlev), toks(suffix),
+					None, oldfreq, newfreq, soundalike)
+			s = NGramDiffScore.__new__(NGramDiffScore)
+			s.__setstate__((ngd, sl, score, ediff))
+			best.append(s)
+		return best
 
-		# calculate the closest, best ngram in part
-		sim = sorted([NGramDiffScore(ngd, self.p) for ngd in part])
-		for s in sim[:25]:
-			logger.debug('sim %4.1f %2u %u %6u %6u %s' % \
-				(s.score, s.ediff, s.sl, s.ngd.oldfreq, s.ngd.newfreq, ' '.join(s.ngd.newtoks())))
+	@staticmethod
+	def suggsize(best):
+		"""
+		roughly how many bytes do_suggest()'s cached best takes up
+		"""
+		return sum(256 + sum(64 + len(t[0]) for t in s.ngd.new() + s.ngd.diff.old) for s in best)
 
-		best = list(takewhile(lambda s:s.score > 0, sim))[:max_suggest]
+	def calc_suggest(self, target_ngram, target_freq, ctx, d, max_suggest=5):
+		"""
+		given an infrequent ngram from a document, attempt to calculate a more frequent one
+		that is similar textually and/or phonetically but is more frequent
+		"""
+		top = TopK(max_suggest)
+		for ngd in self.candidates(target_ngram, target_freq, d):
+			# only a score above 0 is any use, and then only one that makes the top
+			bound = NGramDiffScore.bound(ngd)
+			if bound <= 0 or not top.admits(bound):
+				self.candstats['skipped'] += 1
+				continue
+			s = NGramDiffScore(ngd, self.p)
+			self.candstats['scored'] += 1
+			if s.score > 0:
+				top.put(s, s.score)
+			if not top.admits(NGramDiffScore.BEST_SCORE):
+				# nothing to come can do better than what we have
+				self.candstats['stopped'] += 1
+				break
+		best = top.items()
 		for b in best:
 			logger.debug('best %s' % (b,))
 		return best
 
+	def candidates(self, target_ngram, target_freq, d):
+		"""
+		every NGramDiff calc_suggest() considers in place of target_ngram, worked out
+		only as it gets to them, so it needn't work out the rest once it has its best
+		"""
+		perms = (
+			# permutations via token joining and splitting
+			# expense: cheap, a lookup per token, though rarely useful
+			lambda: self.permjoin(target_ngram, target_freq),
+			lambda: self.permsplit(target_ngram, target_freq),
+			lambda: self.intertoken_letterswap(target_ngram, target_freq),
+			lambda: self.permphon(target_ngram, target_freq),
+			# omitted and doubled-up words, via each word's most common neighbours
+			lambda: self.perminsert(target_ngram, target_freq),
+			lambda: self.permdelete(target_ngram, target_freq, d),
+			lambda: self.g.ngram_like(target_ngram, target_freq))
+		for f in perms:
+			for ngd in f():
+				yield ngd
+
 	def ngram_suggest(self, target_ngram, target_freq, d, max_suggest=1):
 		"""
 		we calculate ngram context and collect solutions for each context
@@ -381,20 +579,57 @@ class Chick:
 		# if we account for frequency too much the common language idioms always crush
 		# valid but less common phrases; if we don't account for frequency at all we often
 		# recommend very similar but uncommon and weird phrases. this attempts to strike a balance.
-		rdbest.sort(lambda x,y:
+		rdbest.sort(key=cmp_to_key(lambda x,y:
 			y.score - x.score if abs(x.score - y.score) > 1	\
 			else	(y.score + int(log(y.ngd.newfreq))) -	\
-				(x.score + int(log(x.ngd.newfreq))))
+				(x.score + int(log(x.ngd.newfreq)))))
 
 		for ngds in rdbest:
 			logger.debug('best %s' % (ngds,))
 
 		return rdbest
 
+	def stats(self):
+		"""
+		counters from phonGuess(), calc_suggest(), suggcache (hit rate, evictions...), suggstore
+		and the database
+		"""
+		st = dict(phon=dict(self.phonstats), cand=dict(self.candstats),
+			suggest=self.suggcache.stats(), grams=self.g.stats())
+		if self.suggstore is not None:
+			st['suggstore'] = self.suggstore.stats()
+		return st
+
+	@contextmanager
+	def gramscache(self):
+		"""
+		for the length of a request, send every lookup, be it ours, Phon's or Words',
+		for the doc, a candidate or an NGramDiff, through one GramsCache, so each goes
+		to ngram3bin once however often repeated. one request at a time, like the
+		rest of our state
+		"""
+		g, w = self.g, self.w
+		self.g = self.p.g = GramsCache(g)
+		self.w = Words(NGram3BinWordCounter(g.ng, self.g))
+		try:
+			yield self.g
+		finally:
+			self.g = self.p.g = g
+			self.w = w
+
 	def suggest(self, txt, max_suggest=1, skip=[]):
 		"""
 		given a string, run suggest() and apply the first suggestion
 		"""
+		if not isinstance(self.g, GramsCache):
+			with self.gramscache() as g:
+				suggs = list(self.suggest(txt, max_suggest, skip))
+			logger.debug('GramsCache hits=%u misses=%u suggcache=%s' % \
+				(g.hits, g.misses, self.suggcache.stats()))
+			for bs in suggs:
+				yield bs
+			return
+
 		logger.debug('Chick.suggest(txt=%s max_suggest=%s, skip=%s)' % (txt, max_suggest, skip))
 
 		d = Doc(txt, self.w)
@@ -450,8 +685,9 @@ sugg                             undoubtedly be changed 0
 			utChanges = [(u, (self.w.correct(u[0]), u[1], u[2], u[3])) for u in ut]
 			logger.debug('utChanges=%s' % utChanges)
 			utChanges2 = list(filter(lambda x: x not in skip, utChanges))
-			for old,new in utChanges2:
-				td = TokenDiff([old], [new], damerau_levenshtein(old[0], new[0]))
+			damlevs = damerau_levenshtein_pairs((old[0], new[0]) for old,new in utChanges2)
+			for (old,new),damlev in zip(utChanges2, damlevs):
+				td = TokenDiff([old], [new], damlev)
 				ngd = NGramDiff([], td, [], self.g)
 				ngds = NGramDiffScore(ngd, None, 1)
 				suggestions.append([ngds])
@@ -460,13 +696,10 @@ sugg                             undoubtedly be changed 0
 		logger.debug('suggestions=%s' % (suggestions,))
 		suggs = filter(lambda x:x and x[0].ngd.newfreq != x[0].ngd.oldfreq, suggestions)
 		logger.debug('suggs=%s' % (suggs,))
-		# sort suggestions by their score, highest first
-		bestsuggs = rsort(suggs, key=lambda x: x[0].score)
-		# by total new frequency...
-		bestsuggs = rsort(bestsuggs, key=lambda x: x[0].ngd.newfreq)
-		# then by improvement pct. for infinite improvements this results in
-		# the most frequent recommendation coming to the top
-		bestsuggs = rsort(bestsuggs, key=lambda x: x[0].improve_pct())
+		# sort suggestions by improvement pct, highest first. for infinite improvements
+		# this results in the most frequent recommendation coming to the top,
+		# then by total new frequency, then by their score, all in one pass
+		bestsuggs = rsort(suggs, key=lambda x: (x[0].improve_pct(), x[0].ngd.newfreq, x[0].score))
 
 		# finally, allow frequency to overcome small differences in score, but only
 		# for scores that are within 1 to begin with.
@@ -516,3 +749,99 @@ sugg                             undoubtedly be changed 0
 		logger.debug('correct res=%s %s' % (type(res),res))
 		return res
 
+class ChickTest(unittest.TestCase):
+	class G:
+		"""
+		punctuation and 'of' follow and precede everything; windows containing
+		them are common, 'who' only slightly helps
+		"""
+		Freq = {u',': 90000, u'.': 90000, u'of': 5000, u'who': 50}
+		ng = None
+		order = 3
+		def follows(self, w): return list(self.Freq.items())
+		def precedes(self, w): return list(self.Freq.items())
+		def freq(self, ng): return 0
+		def freq_batch(self, ngs, f=None):
+			return [max([self.Freq.get(w, 0) for w in ng]) for ng in ngs]
+	class C(Chick):
+		def __init__(self, g):
+			self.g = g
+	def chick(self):
+		return ChickTest.C(ChickTest.G())
+	def toks(self, txt):
+		return Doc([txt], None).tok[0]
+	def test_perminsert(self):
+		c = self.chick()
+		perms = c.perminsert(self.toks(u'win or loose'), 10)
+		ins = sorted(set(p.diff.new[0][0] for p in perms))
+		# never punctuation, and 'who' isn't enough of an improvement
+		self.assertEqual([u'of'], ins)
+		for p in perms:
+			self.assertEqual(Chick.InsDelPenalty, p.diff.damlev)
+		# nothing beats an ngram that's already common
+		self.assertEqual([], c.perminsert(self.toks(u'win or loose'), 1000))
+	def test_permdelete(self):
+		c = self.chick()
+		d = Doc([u'it was of the best'], None)
+		perms = c.permdelete(d.tok[0][:3], 0, d)
+		self.assertTrue(perms)
+		for p in perms:
+			self.assertEqual(Chick.InsDelPenalty, p.diff.damlev)
+			self.assertEqual([], list(p.diff.new))
+		self.assertEqual([], c.permdelete(d.tok[0][:3], 1000, d))
+	def test_gramscache(self):
+		class P:
+			pass
+		c = self.chick()
+		c.p, c.w = P(), None
+		c.p.g = g = c.g
+		with c.gramscache() as cache:
+			self.assertTrue(c.g is cache and c.p.g is cache)
+			self.assertEqual([5000, 5000], [c.w.freq(u'of'), c.w.freq(u'of')])
+			self.assertEqual((1, 1), (cache.misses, cache.hits))
+		self.assertTrue(c.g is g and c.p.g is g and c.w is None)
+	def test_suggdump(self):
+		d = Doc([u'i am hear'], None)
+		ngd = NGramDiff(d.tok[0][:2], TokenDiff(d.tok[0][2:], [(u'here',) + d.tok[0][2][1:]], 2),
+				(), ChickTest.G(), 0, 5000)
+		best = [NGramDiffScore(ngd, None, 6.0)]
+		unbound = [Chick.retoken(s, lambda l: tuple((t[0], i) for i,t in enumerate(l))) for s in best]
+		rows = json.loads(json.dumps(Chick.suggdump(unbound)))
+		self.assertEqual([(s.score, s.ediff, s.sl, s.ngd) for s in unbound],
+				 [(s.score, s.ediff, s.sl, s.ngd) for s in Chick.suggload(rows)])
+	def test_ngram_suggest(self):
+		"""
+		scores worked out from batched edit distances sort, whatever type those come in
+		"""
+		class P:
+			def phraseSound(self, toks): return []
+		class C(ChickTest.C):
+			def do_suggest(self, target_ngram, target_freq, ctx, d):
+				news = [u'near', u'here', u'hears']
+				damlevs = damerau_levenshtein_pairs((target_ngram[2][0], w) for w in news)
+				return [NGramDiffScore(NGramDiff(target_ngram[:2],
+						TokenDiff(target_ngram[2:], [(w,) + target_ngram[2][1:]], dl),
+						(), self.g, 0, f), P())
+					for w, dl, f in zip(news, damlevs, [100, 10000, 10])]
+		d = Doc([u'i am hear'], None)
+		best = C(ChickTest.G()).ngram_suggest(tuple(d.tok[0]), 0, d)
+		self.assertEqual([u'here', u'near', u'hears'], [b.ngd.diff.new[0][0] for b in best])
+	NGramDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../data/corpus/google-ngrams/')
+	@unittest.skipIf(not os.path.exists(NGramDir + 'word.bin'), 'no ngram database')
+	def test_correct_no_filler(self):
+		"""
+		sentences that used to get a comma or a filler word stuck in them
+		"""
+		c = Chick(ChickTest.NGramDir)
+		for txt, bad in [
+			(u'Summer is almost hear.', u'Summer , is almost hear.'),
+			(u'i am hear', u'i am . hear'),
+			(u'win or loose', u'win or of loose'),
+			(u'The dog was dense', u'The dog who was dense'),
+			(u"Even so, I'm open minded.", u"Even , so, I'm open minded.")]:
+			res = c.correct([txt])
+			self.assertNotEqual(bad, res)
+			self.assertEqual(len(self.toks(txt)), len(self.toks(res)), res)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+edit distance from one string to many at once: in C, by ngram3bin, when it's built,
+otherwise in python. both stop working on a pair as soon as it must be further apart
+than max_distance, and call it max_distance + 1
+"""
+
+import unittest
+try:
+	from ngram3bin import damlev_many
+except ImportError:
+	damlev_many = None
+
+# TODO: weight the distance by what has changed;
+# - transpositions should count less than insertions/deletions
+# - changes near the front of the word should count more than the end
+# - for latin alphabets changes to vowels should count less than consonants
+
+def _damerau_levenshtein(a, b, max_distance=None):
+	"""
+	optimal string alignment distance: insertions, deletions, substitutions and
+	transpositions of adjacent characters, none of them edited again. any sequences
+	of comparable items will do
+	"""
+	# what they share at either end costs nothing
+	n = min(len(a), len(b))
+	i = 0
+	while i < n and a[i] == b[i]:
+		i += 1
+	a, b = a[i:], b[i:]
+	n -= i
+	i = 0
+	while i < n and a[-1-i] == b[-1-i]:
+		i += 1
+	if i:
+		a, b = a[:-i], b[:-i]
+	if max_distance is None:
+		max_distance = len(a) + len(b)
+	if abs(len(a) - len(b)) > max_distance:
+		return max_distance + 1
+	if not a or not b:
+		return len(a) + len(b)
+	twoago, oneago = None, list(range(len(b) + 1))
+	prevmin = 0
+	for i in range(1, len(a) + 1):
+		x = a[i-1]
+		row = [i] + [0] * len(b)
+		for j in range(1, len(b) + 1):
+			y = b[j-1]
+			if x == y:
+				d = oneago[j-1]
+			else:
+				d = min(oneago[j], row[j-1], oneago[j-1]) + 1
+				if i > 1 and j > 1 and x == b[j-2] and a[i-2] == y and twoago[j-2] + 1 < d:
+					d = twoago[j-2] + 1
+			row[j] = d
+		# no later row can do better than this one, or the one before it plus a transposition
+		rowmin = min(row)
+		if rowmin > max_distance and prevmin + 1 > max_distance:
+			return max_distance + 1
+		prevmin = rowmin
+		twoago, oneago = oneago, row
+	return min(oneago[-1], max_distance + 1)
+
+def damerau_levenshtein_many(word, words, max_distance=None):
+	"""
+	[damerau_levenshtein(word, w, max_distance) for w in words], in one trip into C
+	"""
+	if damlev_many is not None:
+		try:
+			if max_distance is None:
+				return damlev_many(word, words)
+			return damlev_many(word, words, max_distance)
+		except TypeError:
+			# not strings; python copes with any sequences
+			pass
+	return [_damerau_levenshtein(word, w, max_distance) for w in words]
+
+def damerau_levenshtein_pairs(pairs, max_distance=None):
+	"""
+	[damerau_levenshtein(a, b, max_distance) for a, b in pairs], one batch for each a
+	"""
+	pairs = list(pairs)
+	batch = {}
+	for i, (a, b) in enumerate(pairs):
+		batch.setdefault(a, []).append(i)
+	dist = [0] * len(pairs)
+	for a, idx in batch.items():
+		for i, d in zip(idx, damerau_levenshtein_many(a, [pairs[i][1] for i in idx], max_distance)):
+			dist[i] = d
+	return dist
+
+def damerau_levenshtein(a, b, max_distance=None):
+	"""
+	>>> damerau_levenshtein('ba', 'abc')
+	2
+	>>> damerau_levenshtein('fee', 'deed')
+	2
+	"""
+	return damerau_levenshtein_many(a, [b], max_distance)[0]
+
+class DistanceTest(unittest.TestCase):
+	Pairs = (('', '', 0), ('a', '', 1), ('', 'abc', 3), ('abc', 'abc', 0),
+		 ('ba', 'abc', 2), ('fee', 'deed', 2), ('teh', 'the', 1), ('ca', 'abc', 3),
+		 ('abcd', 'acbd', 1), ('abcdef', 'badcfe', 3), ('kitten', 'sitting', 3),
+		 ('their', 'there', 2), (u'café', u'cafe', 1), (u'naïve', u'naive', 1),
+		 (u'ñandú', u'ñnadú', 1))
+
+	def test_python(self):
+		for a, b, d in self.Pairs:
+			self.assertEqual(_damerau_levenshtein(a, b), d, (a, b))
+			self.assertEqual(_damerau_levenshtein(b, a), d, (b, a))
+
+	def test_many(self):
+		for a, b, d in self.Pairs:
+			self.assertEqual(damerau_levenshtein_many(a, [b, a]), [d, 0], (a, b))
+
+	def test_max_distance(self):
+		for a, b, d in self.Pairs:
+			for m in range(4):
+				self.assertEqual(damerau_levenshtein(a, b, m), min(d, m + 1), (a, b, m))
+				self.assertEqual(_damerau_levenshtein(a, b, m), min(d, m + 1), (a, b, m))
+
+	def test_pairs(self):
+		pairs = [(a, b) for a, b, _ in self.Pairs] + [(b, a) for a, b, _ in self.Pairs]
+		self.assertEqual(damerau_levenshtein_pairs(pairs), [d for _, _, d in self.Pairs] * 2)
+
+	def test_sequences(self):
+		self.assertEqual(damerau_levenshtein(['b', 'a', 'c', 'd', 'e'], 'abcd'), 2)
+
+if __name__ == '__main__':
+	unittest.main()
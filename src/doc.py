@@ -10,11 +10,18 @@ import unittest
 import math
 import gram
 from ngramdiff import TokenDiff,NGramDiff,NGramDiffScore
-import copy
 
 import logging
 logger = logging.getLogger('spill-chick')
 
+"""
+a token and where it is: line number, index within the line and offset within the
+line. a tuple, so code that makes a new token as (word,) + tok[1:] still works.
+it carries no word id: one made that way would keep the old word's, and
+freq_batch() turns a whole batch of words into ids in one go anyway
+"""
+Token = collections.namedtuple('Token', 'word line index pos')
+
 """
 Tokenized contents of a single file
 Tokens associated with positional data to faciliate changes
@@ -58,7 +65,7 @@ class Doc:
 			ll = []
 			for t in toks:
 				tpos = line.index(t, tpos)
-				ll.append((t, lcnt, len(ll), tpos))
+				ll.append(Token(t, lcnt, len(ll), tpos))
 				tpos += len(t)
 			self.tok.append(ll)
 
@@ -100,9 +107,10 @@ class Doc:
 				continue
 			ngs = [tuple(t[0] for t in toks[i:i+size])
 				for i in range(max(1, len(toks)-size+1))]
+			ngfreq = g.freq_batch(ngs)
 			for i in range(len(ngs)):
-				ctx = ngs[max(0,i-size-1):i+size]
-				freq = sum(map(g.freq,ctx)) / len(ctx)
+				ctx = ngfreq[max(0,i-size-1):i+size]
+				freq = sum(ctx) / len(ctx)
 				yield (toks[i:i+size], freq)
 				
 	def ngram_prev(self, ngpos):
@@ -182,17 +190,19 @@ class Doc:
 		"""
 		given an ngram containing position data, replace corresponding data
 		in lines with 'mod'
+		old and new tokens are replaced pairwise; any new tokens left over are
+		inserted after the last replaced one, or for a pure insertion in front of
+		the position they carry, and any old tokens left over are removed; when
+		they were merged into the last replaced one, whatever joined them goes too
 		"""
 		d = ngd.diff # ngd.diff=TokenDiff(([(u'cheese', 0, 2, 9), (u'burger', 0, 3, 16)],[(u'cheeseburger', 0, 2, 9)]))
-		# FIXME: deal with insertion
-		# FIXME: treat new/old as separate sequences, instead of 1-to-1-ish
-		old = copy.deepcopy(d.old)
-		for mod in d.newtoks():
+		n = min(len(d.old), len(d.new))
+		last = None # (line, pos) just past the last token we wrote
+		for (o,l,idx,pos),mod in zip(d.old, d.newtoks()):
 			#print 'ngd.diff=%s' % (ngd.diff,)
-			o,l,idx,pos = old.pop(0)
 			pos += off[l]
 			end = pos + len(o)
-			#print 'o=%s l=%s idx=%s pos=%s end=%s old=%s' % (o,l,idx,pos,end,old)
+			#print 'o=%s l=%s idx=%s pos=%s end=%s' % (o,l,idx,pos,end)
 			ow = lines[l][pos:end]
 			if not mod and pos > 0 and lines[l][pos-1] in (' ','\t','\r','\n'):
 				# if we've removed a token and it was preceded by whitespace,
@@ -201,12 +211,35 @@ class Doc:
 			cap =  Doc.matchCap(ow, mod)
 			#print 'cap=%s' % (cap,)
 			lines[l] = lines[l][:pos] + cap + lines[l][end:]
-			off[l] += len(cap) - len(o)
+			off[l] += len(cap) - (end - pos)
+			last = (l, pos + len(cap))
 			# FIXME: over-simplified; consider multi-token change
 			#self.docwords[ow] -= 1
 			if mod:
 				pass
 				#self.docwords[mod] += 1
+		for mod,l,idx,pos in d.new[n:]:
+			# insertion
+			if last:
+				l, pos = last
+				ins = ' ' + mod
+			else:
+				pos += off[l]
+				ins = mod + ' '
+			lines[l] = lines[l][:pos] + ins + lines[l][pos:]
+			off[l] += len(ins)
+			last = (l, pos + len(mod) + (ins[0] == ' '))
+		for o,l,idx,pos in d.old[n:]:
+			pos += off[l]
+			end = pos + len(o)
+			if last and last[0] == l and last[1] <= pos:
+				# merged into what we just wrote: 'hell-o' -> 'hello', not 'hello-'
+				pos = last[1]
+			elif pos > 0 and lines[l][pos-1] in (' ','\t','\r','\n'):
+				# deletion, along with the whitespace before it
+				pos -= 1
+			lines[l] = lines[l][:pos] + lines[l][end:]
+			off[l] -= end - pos
 		return (lines, off)
 
 	def demoChanges(self, changes):
@@ -225,8 +258,27 @@ class Doc:
 		self.tokenize(self.demoChanges(changes))
 
 class DocTest(unittest.TestCase):
+	class G:
+		def freq(self, ng): return 0
+	def change(self, txt, i, j, new, pos=None):
+		d = Doc([txt], None)
+		toks = d.tok[0]
+		if pos is None:
+			pos = toks[i] if i < len(toks) else toks[i-1]
+		new = [(w,) + pos[1:] for w in new]
+		ngd = NGramDiff(toks[:i], TokenDiff(toks[i:j], new, 0), toks[j:], DocTest.G())
+		return d.demoChanges([ngd])[0]
 	def test_change(self):
-		pass
+		self.assertEqual('It was thier fault', self.change('It is thier fault', 1, 2, ['was']))
+		self.assertEqual('A cheeseburger now', self.change('A cheese burger now', 1, 3, ['cheeseburger']))
+		self.assertEqual('its a dog', self.change('itsa dog', 0, 1, ['its', 'a']))
+		self.assertEqual('hello there', self.change('hell-o there', 0, 2, ['hello']))
+	def test_insert(self):
+		self.assertEqual('went to the store', self.change('went the store', 1, 1, ['to']))
+		self.assertEqual('The big dog', self.change('The dog', 1, 1, ['big']))
+	def test_delete(self):
+		self.assertEqual('to the store', self.change('to the the store', 1, 2, []))
+		self.assertEqual('The store', self.change('The the store', 1, 2, []))
 
 if __name__ == '__main__':
 	unittest.main()
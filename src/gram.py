@@ -60,8 +60,23 @@ class Grams:
 		if ng == (): # FIXME: shouldn't need this
 			return 0
 		return self.ngrams[len(ng)][ng]
+	def freq_batch(self, ngs, sum_=sum):
+		return [self.freq(tuple(ng)) for ng in ngs]
 	def freqs(self, s):
 		return self.words.freq(s)
+	def freqs_batch(self, words):
+		return [self.words.freq(w) for w in words]
+	def follows(self, w, topk=None):
+		return self.adjacent(w, 0, topk)
+	def precedes(self, w, topk=None):
+		return self.adjacent(w, 1, topk)
+	def adjacent(self, w, i, topk):
+		# bigram neighbours of w, most frequent first
+		adj = Counter()
+		for ng,cnt in self.ngrams[2].items():
+			if ng[i] == w:
+				adj[ng[1-i]] += cnt
+		return sorted(adj.items(), key=lambda x:(-x[1], x[0]))[:topk]
 	# given an iterable 'f', tokenize and produce a {word:id} mapping and ngram frequency count
 	def add(self, f):
 		if type(f) == list:
@@ -2,8 +2,13 @@
 # -*- coding: utf-8 -*-
 
 from operator import itemgetter
-import sys
+from array import array
+import sys, os, glob, hashlib, heapq
 from ngram3bin import ngram3bin
+try:
+	import numpy
+except ImportError:
+	numpy = None
 from ngramdiff import TokenDiff,NGramDiff,NGramDiffScore
 from util import *
 
@@ -11,58 +16,276 @@ from util import *
 Grams-interface to our binary ngram database
 """
 class GramsBin:
+	# least frequent word splits() will split a word into without ngram3.bin.splits,
+	# as ngram3bin-compact's default
+	SplitMinFreq = 500
 
-	def __init__(self, wordpath, ngrampath):
-		self.ng = ngram3bin(wordpath, ngrampath)
+	def __init__(self, wordpath, ngrampath, *longer):
+		"""
+		longer: paths of ngram4.bin and ngram5.bin, if we have them
+		"""
+		self.ng = ngram3bin(wordpath, ngrampath, *longer)
+		# Phon finds word.bin.phon next to it
+		self.wordpath = wordpath
+		self.paths = [wordpath, ngrampath] + [p for p in longer if p]
+		# the longest ngram we can look up in one go; longer ones are pieced together
+		self.order = self.ng.order()
+		# word lengths by id, to filter like() results before creating any words
+		if numpy is not None:
+			self.wordlens = numpy.frombuffer(self.ng.wordlens(), dtype=numpy.uint32)
+		else:
+			self.wordlens = array('I', memoryview(self.ng.wordlens()).tobytes())
 
 	def freq(self, ng, sum_=sum):
 		#print 'freq()=',ng
 		l = len(ng)
 		if l > 1:
-			ids = map(self.ng.word2id, ng)
-			if l > 3:
-				# chop up id list into ngram3-sized chunks
-				smaller = [tuple(ids[i:i+3]) for i in range(len(ids)-3+1)]
-				fr = sum_(self.ng.freq(*s) for s in smaller)
+			ids = self.ng.word2id_many(ng)
+			n = self.order
+			if l > n:
+				# chop up id list into the longest chunks we have a table for
+				smaller = [ids[i:i+n] for i in range(len(ids)-n+1)]
+				fr = sum_(self.ng.freq_many(smaller))
 			else:
 				fr = self.ng.freq(*ids)
 			return fr
 		else:
 			return self.ng.wordfreq(ng[0])
 
+	def freq_batch(self, ngs, sum_=sum):
+		"""
+		[freq(ng) for ng in ngs], but with one trip into ngram3bin per kind of lookup
+		"""
+		ngs = [tuple(ng) for ng in ngs]
+		words = list(set(w for ng in ngs if len(ng) > 1 for w in ng))
+		ids = dict(zip(words, self.ng.word2id_many(words)))
+		singles = [ng[0] for ng in ngs if len(ng) == 1]
+		wordfreq = dict(zip(singles, self.ng.wordfreq_many(singles)))
+		# every ngram's id chunks, and where they sit in the results
+		n = self.order
+		probes, spans = [], []
+		for ng in ngs:
+			start = len(probes)
+			if len(ng) > n:
+				probes.extend(tuple(ids[w] for w in ng[i:i+n]) for i in range(len(ng)-n+1))
+			elif len(ng) > 1:
+				probes.append(tuple(ids[w] for w in ng))
+			spans.append((start, len(probes)))
+		fr = self.ng.freq_many(probes)
+		res = []
+		for ng, (start, end) in zip(ngs, spans):
+			if len(ng) == 1:
+				res.append(wordfreq[ng[0]])
+			elif len(ng) > n:
+				res.append(sum_(fr[start:end]))
+			else:
+				res.append(fr[start] if start < end else 0)
+		return res
+
 	def freqs(self, s):
 		#print('freq(s)=',s)
 		return self.ng.wordfreq(s)
 
-	def ngram_like(self, ng, ngfreq):
+	def freqs_batch(self, words):
+		return self.ng.wordfreq_many(words)
+
+	def fingerprint(self):
+		"""
+		a string that changes whenever word.bin or any ngram*.bin we loaded is rebuilt:
+		their sizes, modification times and a hash of their first 64KiB. likewise the
+		sizes and modification times of whichever of their sidecars are there
+		(.splits, .follows, .phon, .trie...), which can change what we say without them
+		"""
+		h = hashlib.sha1()
+		for p in self.paths:
+			st = os.stat(p)
+			h.update(('%s %u %u\n' % (os.path.basename(p), st.st_size, int(st.st_mtime))).encode('utf8'))
+			with open(p, 'rb') as f:
+				h.update(f.read(1 << 16))
+			for side in sorted(glob.glob(p + '.*')):
+				st = os.stat(side)
+				h.update(('%s %u %u\n' % (os.path.basename(side), st.st_size, int(st.st_mtime))).encode('utf8'))
+		return h.hexdigest()
+
+	def stats(self):
+		"""
+		lookup counters from ngram3bin, e.g. how often its bloom filter spared us a search
+		"""
+		return self.ng.stats()
+
+	def follows(self, w, topk=None):
+		"""
+		the words that most often follow w, and how often, most frequent first
+		"""
+		return self.adjacent(self.ng.follows, w, topk)
+
+	def precedes(self, w, topk=None):
+		"""
+		the words that most often precede w, and how often, most frequent first
+		"""
+		return self.adjacent(self.ng.precedes, w, topk)
+
+	def adjacent(self, f, w, topk):
+		wid = self.ng.word2id_many([w])[0]
+		if not wid:
+			return []
+		res = f(wid)[:topk]
+		return [(self.ng.id2word(i), cnt) for i,cnt in res]
+
+	def splits(self, w):
+		"""
+		the ways w splits into two or three words, each at least SplitMinFreq frequent,
+		that appear together, as [((x,y[,z]), freq), ...] most frequent first.
+		looked up in ngram3.bin.splits for any word it covers, worked out here otherwise
+		"""
+		res = self.ng.splits(w) if self.ng.word2id_many([w])[0] else None
+		if res is not None:
+			return res
+		parts = list(set(w[i:j] for i in range(len(w)) for j in range(i+1, len(w)+1)))
+		ids = dict(zip(parts, self.ng.word2id_many(parts)))
+		freq = dict(zip(parts, self.ng.wordfreq_many(parts)))
+		ok = lambda p: ids[p] and freq[p] >= self.SplitMinFreq
+		cands = []
+		for i in range(1, len(w)):
+			if not ok(w[:i]):
+				continue
+			cands.extend((w[:i], w[i:j], w[j:]) for j in range(i+1, len(w))
+					if ok(w[i:j]) and ok(w[j:]))
+			if ok(w[i:]):
+				cands.append((w[:i], w[i:]))
+		res = [(c, f) for c, f in zip(cands, self.freq_batch(cands)) if f]
+		res.sort(key=lambda r: (-r[1], [ids[p] for p in r[0]] + [0] * (3 - len(r[0]))))
+		return res
+
+	def ngram_like(self, ng, ngfreq, topk=None):
 		"""
 		given an ngram (x,y,z), return a list of ngrams sharing all but one element, i.e.
 		(_,y,z)
 		(x,_,z)
 		(x,y,_)
+		most frequent first, and only the topk of them if given
 		"""
 		if len(ng) != 3:
 			return []
 		#print 'like()=',ng
-		ids = tuple(map(self.ng.word2id, [n[0] for n in ng]))
+		ids = tuple(self.ng.word2id_many([n[0] for n in ng]))
 		#print('like(ids)=',ids)
-		like = self.ng.like(*ids)
-		#print 'like(',ng,')=',like
+		if numpy is not None:
+			like = self.like_numpy(ng, ids, topk)
+		else:
+			like = self.like_list(ng, ids, topk)
+		words = [self.ng.id2word(wid) for _,wid,_ in like]
+		damlevs = damerau_levenshtein_pairs((ng[di][0], w) for (di,_,_),w in zip(like, words))
 		like2 = []
-		for l in set(like):
-			t,tfreq = tuple(map(self.ng.id2word, l[:3])), l[3]
-			# calculate the single differing token and build an NGramDiff
-			di = 0 if l[0] != ids[0] else 1 if l[1] != ids[1] else 2
-			# do not bother with words that are of grossly different
-			# length than our target
-			if abs(len(t[di]) - len(ng[di][0])) > 3:
-				continue
-			newtok = (t[di],) + ng[di][1:]
-			damlev = damerau_levenshtein(ng[di][0], t[di])
+		for (di,wid,tfreq),w,damlev in zip(like, words, damlevs):
+			newtok = (w,) + ng[di][1:]
 			ngd = NGramDiff(ng[:di],
 					TokenDiff(ng[di:di+1], [newtok], damlev),
 					ng[di+1:], self, ngfreq, tfreq)
 			like2.append(ngd)
-		like3 = sorted(like2, reverse=True)
 		return like2
 
+	def like_list(self, ng, ids, topk):
+		"""
+		like(ids) as (index of the differing id, its replacement, frequency) ordered by
+		frequency, dropping any replacement grossly different in length from the original
+		word: those are not worth building a word, let alone an NGramDiff, for
+		"""
+		res = []
+		for l in set(self.ng.like(*ids)):
+			# calculate the single differing token
+			di = 0 if l[0] != ids[0] else 1 if l[1] != ids[1] else 2
+			if abs(self.wordlens[l[di]] - len(ng[di][0])) > 3:
+				continue
+			res.append((di, l[di], l[3]))
+		key = lambda r:(-r[2], r[0], r[1])
+		if topk is None:
+			return sorted(res, key=key)
+		return heapq.nsmallest(topk, res, key=key)
+
+	def like_numpy(self, ng, ids, topk):
+		"""
+		like_list(), with the filtering and ordering done in numpy
+		"""
+		buf = self.ng.like_buf(*ids)
+		if not len(buf):
+			return []
+		rows = numpy.frombuffer(buf, dtype=numpy.uint32).reshape(-1, 4)
+		rows = numpy.unique(rows, axis=0)
+		di = numpy.where(rows[:,0] != ids[0], 0, numpy.where(rows[:,1] != ids[1], 1, 2))
+		wid = rows[numpy.arange(len(rows)), di]
+		freq = rows[:,3].astype(numpy.int64)
+		oldlen = numpy.array([len(n[0]) for n in ng])
+		keep = numpy.abs(self.wordlens[wid].astype(numpy.int64) - oldlen[di]) <= 3
+		di, wid, freq = di[keep], wid[keep], freq[keep]
+		order = numpy.lexsort((wid, di, -freq))[:topk]
+		return list(zip(di[order].tolist(), wid[order].tolist(), freq[order].tolist()))
+
+class GramsCache:
+	"""
+	a GramsBin that remembers every frequency it looks up, to be thrown away with the
+	request it was made for: checking a document looks up the same ngrams again and
+	again, in its context, in each candidate's unchanged prefix and suffix, etc.
+	and each of them only needs to be looked up once. hits and misses count the
+	lookups it spared and made. anything else goes straight to g
+	"""
+	def __init__(self, g):
+		self.g = g
+		self.memo = {}
+		self.adj = {}
+		self.hits = 0
+		self.misses = 0
+
+	def __getattr__(self, name):
+		return getattr(self.g, name)
+
+	def key(self, ng, sum_):
+		# only ngrams pieced together from shorter ones depend on how they're summed
+		ng = tuple(ng)
+		return ng if len(ng) <= self.g.order else (ng, sum_)
+
+	def freq(self, ng, sum_=sum):
+		return self.freq_batch([ng], sum_)[0]
+
+	def freq_batch(self, ngs, sum_=sum):
+		keys = [(self.key(ng, sum_), ng) for ng in ngs]
+		miss = dict((k, ng) for k, ng in keys if k not in self.memo)
+		if miss:
+			miss = list(miss.items())
+			for (k, _), fr in zip(miss, self.g.freq_batch([ng for _, ng in miss], sum_)):
+				self.memo[k] = fr
+		self.misses += len(miss)
+		self.hits += len(keys) - len(miss)
+		return [self.memo[k] for k, _ in keys]
+
+	def freqs(self, s):
+		return self.freq((s,))
+
+	def freqs_batch(self, words):
+		return self.freq_batch([(w,) for w in words])
+
+	def remember(self, f, *args):
+		key = (f.__name__,) + args
+		if key in self.adj:
+			self.hits += 1
+		else:
+			self.misses += 1
+			self.adj[key] = f(*args)
+		return self.adj[key]
+
+	def follows(self, w, topk=None):
+		return self.remember(self.g.follows, w)[:topk]
+
+	def precedes(self, w, topk=None):
+		return self.remember(self.g.precedes, w)[:topk]
+
+	def splits(self, w):
+		return self.remember(self.g.splits, w)
+
+	def stats(self):
+		"""
+		GramsBin.stats(), and our own hits and misses
+		"""
+		st = dict(self.g.stats())
+		st.update(memo_hits=self.hits, memo_misses=self.misses)
+		return st
@@ -8,7 +8,19 @@ token and ngram comparison
 from math import sqrt,log
 from util import damerau_levenshtein
 
-class TokenDiff:
+class Slotted(object):
+	"""
+	pickling for the __slots__ classes below, which protocols before 2 can't manage
+	by themselves, e.g. for web.py's sessions
+	"""
+	__slots__ = ()
+	def __getstate__(self):
+		return tuple(getattr(self, k) for k in self.__slots__)
+	def __setstate__(self, state):
+		for k, v in zip(self.__slots__, state):
+			setattr(self, k, v)
+
+class TokenDiff(Slotted):
 	"""
 	represent the modification of zero or more 'old' (original) tokens and their
 	'new' (proposed) replacement. solves the problem of tracking inter-token changes.
@@ -17,10 +29,12 @@ class TokenDiff:
 	delete: TokenDiff([tok], [])
 	split:  TokenDiff([tok], [tok',tok'])
 	merge:  TokenDiff([tok,tok], [tok'])
+	old and new are kept as tuples, so one passed as a tuple is shared, not copied
 	"""
+	__slots__ = ('old', 'new', 'damlev')
 	def __init__(self, old, new, damlev):
-		self.old = list(old)
-		self.new = list(new)
+		self.old = tuple(old)
+		self.new = tuple(new)
 		self.damlev = damlev # Damerau-Levenshtein distance
 	def oldtoks(self): return [t[0] for t in self.old]
 	def newtoks(self): return [t[0] for t in self.new]
@@ -32,7 +46,7 @@ class TokenDiff:
 		return self.old == other.old and \
 		       self.new == other.new
 
-class NGramDiff:
+class NGramDiff(Slotted):
 	"""
 	represent a list of tokens that contain a single change, represented by a TokenDiff.
 	alternative, think of it as an acyclic directed graph with a single branch and merge
@@ -41,11 +55,13 @@ class NGramDiff:
 		O---O---O---O---O---O---O
 	                 \     /
 		          `-O-'
+	prefix and suffix are tuples, likewise shared with whoever passed them as such
 	"""
+	__slots__ = ('prefix', 'diff', 'suffix', 'oldfreq', 'newfreq', 'soundalike')
 	def __init__(self, prefix, diff, suffix, g, oldfreq=None, newfreq=None, soundalike=False):
-		self.prefix = list(prefix)
+		self.prefix = tuple(prefix)
 		self.diff = diff
-		self.suffix = list(suffix)
+		self.suffix = tuple(suffix)
 		self.oldfreq = g.freq(self.oldtoks()) if oldfreq is None else oldfreq
 		self.newfreq = g.freq(self.newtoks()) if newfreq is None else newfreq
 		self.soundalike = soundalike
@@ -64,16 +80,19 @@ class NGramDiff:
 	def __lt__(self, other):
 		return other.newfreq < self.newfreq
 
-class NGramDiffScore:
+class NGramDiffScore(Slotted):
 	# based on our logarithmic scoring below
 	DECENT_SCORE = 3.0
 	GOOD_SCORE = 5.0
 	"""
 	decorate an NGramDiff obj with scoring
 	"""
+	__slots__ = ('ngd', 'sl', 'score', 'ediff')
+	# the most calc_score() gives: no difference, same first letter
+	BEST_SCORE = 8.0
 	def __init__(self, ngd, p, score=None):
 		self.ngd = ngd
-		self.sl = ngd.diff.new and ngd.diff.old and ngd.diff.new[0][0][0] == ngd.diff.old[0][0][0]
+		self.sl = NGramDiffScore.same_letter(ngd)
 		if score:
 			self.score = score
 			self.ediff = score
@@ -88,6 +107,25 @@ class NGramDiffScore:
 			# weigh edit distance much more heavily than frequency
 			score = 10 - (2 + ediff + (not self.sl))
 		return score
+	@staticmethod
+	def same_letter(ngd):
+		# an int either way, nothing to compare on an insertion or deletion
+		if not (ngd.diff.new and ngd.diff.old):
+			return 0
+		return int(ngd.diff.new[0][0][0] == ngd.diff.old[0][0][0])
+	@staticmethod
+	def bound(ngd):
+		"""
+		the most calc_score() could make of ngd, short of comparing how anything sounds:
+		similarity() is never less than damlev, unless a soundalike or no change at all
+		"""
+		if ngd.newfreq == 0:
+			return -float('inf')
+		if ngd.soundalike or ' '.join(ngd.diff.oldtoks()) == ' '.join(ngd.diff.newtoks()):
+			ediff = 0
+		else:
+			ediff = ngd.diff.damlev
+		return 10 - (2 + ediff + (not NGramDiffScore.same_letter(ngd)))
 	def improve_pct(self):
 		"""How much of an improvement is the new from the old?"""
 		if self.ngd.oldfreq == 0:
@@ -132,6 +170,9 @@ class NGramDiffScore:
 		if x == y:
 			return 0
 		damlev = ngd.diff.damlev
+		# an insertion or deletion; nothing on one side to sound out
+		if not x or not y:
+			return damlev
 		sx,sy = p.phraseSound([x]),p.phraseSound([y])
 		if sx == sy and sx:
 			# sound the same, e.g. there/their. consider these equal.
@@ -6,24 +6,230 @@ Handle phonetics; i.e. the way things sound
 """
 
 import collections, re, sys, gzip, pickle, os, mmap
+from struct import unpack_from
+from heapq import heappush, heappop
 from word import Words
 from gram import tokenize
+from distance import damerau_levenshtein_many
+
+class PhonIndex:
+	"""
+	word.bin.phon, the pronouncing dictionary compiled by import2bin-phon.py and
+	searched in place; see there for the layout
+	"""
+	Magic = 0x4e475048
+	Version = 1
+
+	def __init__(self, path, wordbinsize):
+		with open(path, 'rb') as f:
+			self.m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		magic, version, size = unpack_from('<IIQ', self.m, 0)
+		if (magic, version, size) != (self.Magic, self.Version, wordbinsize):
+			raise ValueError('%s: stale' % path)
+		self.wordcnt, self.phoncnt, refcnt, strsize = unpack_from('<IIII', self.m, 16)
+		self.wordtab = 32
+		self.phontab = self.wordtab + self.wordcnt * 20
+		self.wordphon = self.phontab + self.phoncnt * 16
+		self.phonword = self.wordphon + refcnt * 4
+		self.strings = self.phonword + refcnt * 4
+		if self.strings + strsize != len(self.m):
+			raise ValueError('%s: stale' % path)
+
+	def str(self, off, n):
+		return self.m[self.strings + off:self.strings + off + n]
+
+	def find(self, tab, recsize, cnt, key):
+		"""
+		offset of key's record in tab, sorted bytewise by the string each starts with
+		"""
+		if not isinstance(key, bytes):
+			key = key.encode('utf8')
+		lo, hi = 0, cnt
+		while lo < hi:
+			mid = (lo + hi) // 2
+			if self.str(*unpack_from('<II', self.m, tab + mid * recsize)) < key:
+				lo = mid + 1
+			else:
+				hi = mid
+		if lo < cnt and self.str(*unpack_from('<II', self.m, tab + lo * recsize)) == key:
+			return tab + lo * recsize
+		return None
+
+	def phonkey(self, i):
+		"""
+		the i'th sound, as utf-8
+		"""
+		return self.str(*unpack_from('<II', self.m, self.phontab + i * 16))
+
+	def refs(self, tab, start, cnt):
+		return unpack_from('<%uI' % cnt, self.m, tab + start * 4)
+
+	def word(self, word):
+		"""
+		word's sounds, in dictionary order
+		"""
+		off = self.find(self.wordtab, 20, self.wordcnt, word)
+		if off is None:
+			return []
+		_, _, _, start, cnt = unpack_from('<5I', self.m, off)
+		return [self.phonkey(p).decode('utf8') for p in self.refs(self.wordphon, start, cnt)]
+
+	def phon(self, phon):
+		"""
+		the words that sound like phon, in dictionary order
+		"""
+		off = self.find(self.phontab, 16, self.phoncnt, phon)
+		if off is None:
+			return []
+		_, _, start, cnt = unpack_from('<4I', self.m, off)
+		return [self.str(*unpack_from('<II', self.m, self.wordtab + w * 20)).decode('utf8')
+				for w in self.refs(self.phonword, start, cnt)]
+
+class HomophoneIndex:
+	"""
+	word.bin.homophones, each word id's sound-alikes as import2bin-phon.py lists
+	them; see there for the layout
+	"""
+	Magic = 0x4e47484f
+	Version = 1
+
+	def __init__(self, path, wordbinsize):
+		with open(path, 'rb') as f:
+			self.m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		magic, version, size = unpack_from('<IIQ', self.m, 0)
+		if (magic, version, size) != (self.Magic, self.Version, wordbinsize):
+			raise ValueError('%s: stale' % path)
+		self.wordcnt, entcnt = unpack_from('<II', self.m, 16)
+		self.off = 24
+		self.ent = self.off + (self.wordcnt + 1) * 4
+		if self.ent + entcnt * 12 != len(self.m):
+			raise ValueError('%s: stale' % path)
+
+	def homophones(self, wid):
+		"""
+		[(id, freq, dist), ...] for word id wid, most frequent first
+		"""
+		if wid >= self.wordcnt:
+			return []
+		start, end = unpack_from('<II', self.m, self.off + wid * 4)
+		ent = unpack_from('<%uI' % ((end - start) * 3), self.m, self.ent + start * 12)
+		return list(zip(ent[0::3], ent[1::3], ent[2::3]))
+
+class PhonTrie:
+	"""
+	the sounds Phon knows, as a trie of their phonemes: key(i) is the i'th of cnt
+	of them, utf-8 encoded and sorted bytewise, and each node is the range of them
+	starting with its phonemes, narrowed one phoneme at a time. a sound is its
+	phonemes joined by ' '
+	"""
+	def __init__(self, key, cnt):
+		self.key = key
+		self.cnt = cnt
+
+	def lower(self, k, lo, hi):
+		while lo < hi:
+			mid = (lo + hi) // 2
+			if self.key(mid) < k:
+				lo = mid + 1
+			else:
+				hi = mid
+		return lo
+
+	def prefixes(self, snd, i):
+		"""
+		(j, sound) for each sound that is snd[i:j], shortest first, giving up as soon
+		as no sound starts with snd[i:j]
+		"""
+		lo, hi = 0, self.cnt
+		k = None
+		for j in range(i, len(snd)):
+			ph = snd[j].encode('utf8')
+			k = ph if k is None else k + b' ' + ph
+			# those starting with k sort from k up to k + '!', as ' ' < '!'
+			lo = self.lower(k, lo, hi)
+			hi = self.lower(k + b'!', lo, hi)
+			if lo == hi:
+				break
+			if self.key(lo) == k:
+				yield j + 1, k.decode('utf8')
+
+class PhonMap(dict):
+	"""
+	the defaultdict(list) Phon.load() fills from the text dictionary, filled from
+	PhonIndex instead one key at a time, as they're asked for
+	"""
+	def __init__(self, lookup):
+		dict.__init__(self)
+		self.lookup = lookup
+	def __missing__(self, key):
+		if not key or not isinstance(key, type(u'')):
+			# '' (nothing was there to sound out), or bytes on py2; neither is in the index
+			return []
+		v = self[key] = self.lookup(key)
+		return v
+	def get(self, key, default=None):
+		return self[key] or default
+	def __contains__(self, key):
+		return bool(self[key])
 
 class Phon:
+	# ngram frequency below which words without an apostrophe are ignored
+	MinFreq = 500
+
 	def __init__(self, w, g):
 		self.words = w
+		self.g = g
 		self.word = collections.defaultdict(list)
 		self.phon = collections.defaultdict(list)
 		self.load(g)
+		self.homo = self.loadhomophones(g)
+
+	def wanted(self, g, word):
+		if not word or not isinstance(word, type(u'')):
+			return False
+		return word.count("'") != 0 or g.freqs(word) >= self.MinFreq
+
+	def loadindex(self, g):
+		"""
+		use word.bin.phon if g is a GramsBin that has a current one. it needn't
+		be read at all to start with, and words are looked up in it as needed
+		"""
+		wordpath = getattr(g, 'wordpath', None)
+		if not wordpath or not os.path.exists(wordpath + '.phon'):
+			return False
+		try:
+			index = PhonIndex(wordpath + '.phon', os.path.getsize(wordpath))
+		except ValueError:
+			return False
+		self.word = PhonMap(lambda word: index.word(word) if self.wanted(self.g, word) else [])
+		self.phon = PhonMap(lambda phon: [tokenize(w) for w in index.phon(phon) if self.wanted(self.g, w)])
+		self.trie = PhonTrie(index.phonkey, index.phoncnt)
+		return True
+
+	def loadhomophones(self, g):
+		"""
+		word.bin.homophones if g is a GramsBin that has a current one, else None
+		"""
+		wordpath = getattr(g, 'wordpath', None)
+		if not wordpath or not os.path.exists(wordpath + '.homophones'):
+			return None
+		try:
+			return HomophoneIndex(wordpath + '.homophones', os.path.getsize(wordpath))
+		except ValueError:
+			return None
+
 	def load(self, g):
+		if self.loadindex(g):
+			return
 		dictpath ='/home/pizza/proj/spill-chick/data/cmudict/cmudict.0.7a'
 		# extract file if necessary
 		if not os.path.exists(dictpath):
 			with open(dictpath, 'wb') as dst:
 				with gzip.open(dictpath + '.gz', 'rb') as src:
 					dst.write(src.read())
-		# TODO: loading this ~130,000 line dictionary in python represents the majority
-		# of the program's initialization time. move it over to C.
+		# loading this ~130,000 line dictionary in python represents the majority
+		# of the program's initialization time; import2bin-phon.py compiles it
+		# into word.bin.phon, which loadindex() uses instead
 		with open(dictpath, 'r') as f:
 			for line in f:
 				if line.startswith(';;;'):
@@ -46,7 +252,7 @@ class Phon:
 				# phonetic phrases I currently try are filled with short obscure words
 				# and are a complete waste
 				# FIXME: instead of hard-coding frequency, calculate statistically
-				if word.count("'") == 0 and g.freqs(word) < 500:
+				if not self.wanted(g, word):
 					continue
 				"""
 				implement a very rough phonic fuzzy-matching
@@ -70,6 +276,8 @@ class Phon:
 				self.word[word].append(phon)
 				toks = tokenize(word)
 				self.phon[phon].append(toks)
+		sounds = sorted(p.encode('utf8') for p in self.phon)
+		self.trie = PhonTrie(sounds.__getitem__, len(sounds))
 
 	"""
 	return a list of words that sound like 'word', as long as they appear in ng
@@ -105,15 +313,85 @@ class Phon:
 		#print('phraseSound2=',v)
 		return v
 
+	def homophones(self, word):
+		"""
+		[(soundslike, freq, damlev), ...] for each single word other than word that
+		sounds like it, most frequent first; looked up in word.bin.homophones if we
+		have it, otherwise worked out from the dictionary
+		"""
+		if self.homo is not None:
+			wid = self.g.ng.word2id_many([word])[0]
+			if not wid:
+				return []
+			return [(self.g.ng.id2word(h), freq, dist) for h, freq, dist in self.homo.homophones(wid)]
+		like = []
+		for sound in self.word[word]:
+			for soundslike in self.phon[sound]:
+				if len(soundslike) == 1 and soundslike[0] != word and soundslike[0] not in like:
+					like.append(soundslike[0])
+		res = zip(like, self.g.freqs_batch(like), damerau_levenshtein_many(word, like))
+		return sorted(res, key=lambda h: -h[1])
+
+	def lattice(self, snd):
+		"""
+		every part of snd that sounds like words, as [(j, words, weight), ...] for the
+		parts snd[i:j] for each i the parts before it reach. a part's weight is its
+		most frequent word's frequency
+		"""
+		parts = [[] for _ in snd]
+		reached = [True] + [False] * len(snd)
+		for i in range(len(snd)):
+			if not reached[i]:
+				continue
+			for j, k in self.trie.prefixes(snd, i):
+				words = self.phon.get(k)
+				if words:
+					parts[i].append((j, words))
+					reached[j] = True
+		toks = list(set(tuple(w) for p in parts for _, words in p for w in words))
+		freq = dict(zip(toks, self.g.freq_batch(toks)))
+		return [[(j, words, max(freq[tuple(w)] for w in words)) for j, words in p]
+				for p in parts]
+
 	def soundsToWords(self, snd):
-		if snd == []:
+		"""
+		every way of splitting snd into parts that each sound like words, as a list of
+		the words sounding like each part; best first, by the weight of the lightest
+		part. best[i] is the weight of the best way to split snd[i:], so each is
+		worked out once however many ways lead to it, and a partial split is only
+		extended when it's the most promising one left
+		"""
+		n = len(snd)
+		if not n:
 			yield []
-		for j in range(1, len(snd)+1):
-			t = ' '.join(snd[:j])
-			words = self.phon.get(t)
-			if words:
-				for s in self.soundsToWords(snd[j:]):
-					yield [words] + s
+			return
+		lattice = self.lattice(snd)
+		inf = float('inf')
+		best = [None] * n + [inf]
+		for i in reversed(range(n)):
+			for j, _, weight in lattice[i]:
+				if best[j] is not None and (best[i] is None or min(weight, best[j]) > best[i]):
+					best[i] = min(weight, best[j])
+		if best[0] is None:
+			return
+		# (-(weight of the best split it can become), order, i, weight so far, parts so far)
+		heap = [(-best[0], 0, 0, inf, None)]
+		order = 1
+		while heap:
+			_, _, i, lightest, path = heappop(heap)
+			if i == n:
+				split = []
+				while path:
+					path, words = path
+					split.append(words)
+				split.reverse()
+				yield split
+				continue
+			for j, words, weight in lattice[i]:
+				if best[j] is not None:
+					w = min(lightest, weight)
+					heappush(heap, (-min(w, best[j]), order, j, w, (path, words)))
+					order += 1
 
 if __name__ == '__main__':
 
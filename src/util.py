@@ -4,7 +4,19 @@ classes and utility functions that are used by everyone
 """
 
 from operator import itemgetter
+from itertools import chain
+import heapq
+from collections import OrderedDict
+from threading import Lock, local
+from time import time
+import json, os
+import unittest
+try:
+	import sqlite3
+except ImportError:
+	sqlite3 = None
 from math import sqrt,log
+from distance import damerau_levenshtein, damerau_levenshtein_many, damerau_levenshtein_pairs
 
 # convenience functions
 def rsort(l, **kw): return sorted(l, reverse=True, **kw)
@@ -22,47 +34,264 @@ def zip_longest(x, y, pad=None):
 		y += [pad] * (lx-ly)
 	return zip(x, y)
 
-def damerau_levenshtein(seq1, seq2):
-    """Calculate the Damerau-Levenshtein distance between sequences.
-    
-    This distance is the number of additions, deletions, substitutions,
-    and transpositions needed to transform the first sequence into the
-    second. Although generally used with strings, any sequences of
-    comparable objects will work.
-    
-    Transpositions are exchanges of *consecutive* characters; all other
-    operations are self-explanatory.
-    
-    This implementation is O(N*M) time and O(M) space, for N and M the
-    lengths of the two sequences.
-    
-    >>> dameraulevenshtein('ba', 'abc')
-    2
-    >>> dameraulevenshtein('fee', 'deed')
-    2
-    
-    It works with arbitrary sequences too:
-    >>> dameraulevenshtein('abcd', ['b', 'a', 'c', 'd', 'e'])
-    2
-    """
-    # codesnippet:D0DE4716-B6E6-4161-9219-2903BF8F547F
-    # Conceptually, this is based on a len(seq1) + 1 * len(seq2) + 1 matrix.
-    # However, only the current and two previous rows are needed at once,
-    # so we only store those.
-    oneago = None
-    thisrow = range(1, len(seq2) + 1) + [0]
-    for x in xrange(len(seq1)):
-        # Python lists wrap around for negative indices, so put the
-        # leftmost column at the *end* of the list. This matches with
-        # the zero-indexed strings and saves extra calculation.
-        twoago, oneago, thisrow = oneago, thisrow, [0] * len(seq2) + [x + 1]
-        for y in xrange(len(seq2)):
-            delcost = oneago[y] + 1
-            addcost = thisrow[y - 1] + 1
-            subcost = oneago[y - 1] + (seq1[x] != seq2[y])
-            thisrow[y] = min(delcost, addcost, subcost)
-            # This block deals with transpositions
-            if (x > 0 and y > 0 and seq1[x] == seq2[y - 1] and seq1[x-1] == seq2[y] and seq1[x] != seq2[y]):
-                thisrow[y] = min(thisrow[y], twoago[y - 2] + 1)
-    return thisrow[len(seq2) - 1]
+class TopK:
+	"""
+	the k highest scoring items put() in, highest first, and of those scoring the same
+	the earliest, i.e. rsort(items, key=score)[:k], in O(k) memory and O(log k) per
+	item. admits() says whether an item scoring at most bound could still get in,
+	so the caller can skip scoring it at all, or stop once nothing left can
+	"""
+	def __init__(self, k):
+		self.k = k
+		self.heap = [] # (score, -order put, item), the one to go first on top
+		self.n = 0
 
+	def __len__(self):
+		return len(self.heap)
+
+	def admits(self, bound):
+		if len(self.heap) < self.k:
+			return True
+		return self.k > 0 and bound > self.heap[0][0]
+
+	def put(self, item, score):
+		self.n += 1
+		if self.admits(score):
+			e = (score, -self.n, item)
+			if len(self.heap) < self.k:
+				heapq.heappush(self.heap, e)
+			else:
+				heapq.heapreplace(self.heap, e)
+
+	def items(self):
+		return [item for _, _, item in sorted(self.heap, key=lambda e: e[:2], reverse=True)]
+
+class LRU:
+	"""
+	a dict of at most maxsize entries, and at most maxbytes between them by the sizes
+	given to put(), that forgets the least recently used first, and anything put()
+	more than ttl seconds ago. it may be shared between threads
+	"""
+	def __init__(self, maxsize, maxbytes=None, ttl=None):
+		self.maxsize = maxsize
+		self.maxbytes = maxbytes
+		self.ttl = ttl
+		self.clock = time
+		self.d = OrderedDict() # key -> (value, size, when put), least recently used first
+		self.bytes = 0
+		self.lock = Lock()
+		self.hits = self.misses = self.evictions = self.expired = 0
+
+	def __len__(self):
+		return len(self.d)
+
+	def get(self, key, default=None):
+		with self.lock:
+			e = self.d.pop(key, None)
+			if e is not None and self.ttl is not None and self.clock() - e[2] > self.ttl:
+				self.bytes -= e[1]
+				self.expired += 1
+				e = None
+			if e is None:
+				self.misses += 1
+				return default
+			self.d[key] = e
+			self.hits += 1
+			return e[0]
+
+	def put(self, key, value, size=0):
+		with self.lock:
+			old = self.d.pop(key, None)
+			if old is not None:
+				self.bytes -= old[1]
+			if self.maxbytes is not None and size > self.maxbytes:
+				return
+			self.d[key] = (value, size, self.clock())
+			self.bytes += size
+			while len(self.d) > self.maxsize or \
+			      (self.maxbytes is not None and self.bytes > self.maxbytes):
+				_, e = self.d.popitem(last=False)
+				self.bytes -= e[1]
+				self.evictions += 1
+
+	def stats(self):
+		looked = self.hits + self.misses
+		return dict(entries=len(self.d), bytes=self.bytes,
+			hits=self.hits, misses=self.misses,
+			hitrate=self.hits / float(looked) if looked else 0.0,
+			evictions=self.evictions, expired=self.expired)
+
+class SQLiteCache:
+	"""
+	LRU's get(), put() and stats() kept in a sqlite database at path instead, which
+	survives us and can be shared by any number of processes, each reading while
+	another writes. keys and values are anything json can say, never pickled:
+	whoever can write to path mustn't get to run code in us. they're stored along
+	with fingerprint, what the values were worked out from, and rows with any
+	other fingerprint are deleted. it holds about maxsize rows, dropping those
+	put() longest ago first, and only gives back those put() in the last ttl seconds.
+	it's a cache: if the database is busy or broken we carry on without it
+	"""
+	# put()s between trimming the table back to maxsize
+	TrimEvery = 1000
+
+	def __init__(self, path, fingerprint, maxsize=1000000, ttl=None):
+		self.path = path
+		self.fingerprint = fingerprint
+		self.maxsize = maxsize
+		self.ttl = ttl
+		self.clock = time
+		# a connection each, for every thread of every process we're forked into
+		self.local = local()
+		self.puts = 0
+		self.hits = self.misses = self.errors = 0
+		c = self.conn()
+		c.execute('CREATE TABLE IF NOT EXISTS cache'
+			' (fingerprint TEXT, key TEXT, value TEXT, at REAL,'
+			'  PRIMARY KEY (fingerprint, key))')
+		c.execute('DELETE FROM cache WHERE fingerprint != ?', (fingerprint,))
+
+	def conn(self):
+		c = getattr(self.local, 'conn', None)
+		if c is None or self.local.pid != os.getpid():
+			c = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+			c.execute('PRAGMA journal_mode=WAL')
+			c.execute('PRAGMA synchronous=NORMAL')
+			self.local.conn, self.local.pid = c, os.getpid()
+		return c
+
+	def get(self, key, default=None):
+		since = -1 if self.ttl is None else self.clock() - self.ttl
+		try:
+			row = self.conn().execute('SELECT value FROM cache'
+				' WHERE fingerprint = ? AND key = ? AND at >= ?',
+				(self.fingerprint, json.dumps(key), since)).fetchone()
+		except sqlite3.Error:
+			self.errors += 1
+			row = None
+		if row is not None:
+			try:
+				value = json.loads(row[0])
+			except (TypeError, ValueError):
+				self.errors += 1
+				row = None
+		if row is None:
+			self.misses += 1
+			return default
+		self.hits += 1
+		return value
+
+	def put(self, key, value):
+		value = json.dumps(value)
+		try:
+			c = self.conn()
+			c.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)',
+				(self.fingerprint, json.dumps(key), value, self.clock()))
+			self.puts += 1
+			if self.puts % self.TrimEvery == 0:
+				c.execute('DELETE FROM cache WHERE rowid IN'
+					' (SELECT rowid FROM cache ORDER BY at DESC LIMIT -1 OFFSET ?)',
+					(self.maxsize,))
+		except sqlite3.Error:
+			self.errors += 1
+
+	def stats(self):
+		looked = self.hits + self.misses
+		return dict(hits=self.hits, misses=self.misses,
+			hitrate=self.hits / float(looked) if looked else 0.0,
+			puts=self.puts, errors=self.errors)
+
+class TopKTest(unittest.TestCase):
+	def test_rsort(self):
+		import random
+		rnd = random.Random(25)
+		for k in (0, 1, 3, 10):
+			items = [(i, rnd.randint(0, 5)) for i in range(rnd.randint(0, 30))]
+			t = TopK(k)
+			for item in items:
+				t.put(item, item[1])
+			self.assertEqual(t.items(), rsort1(items)[:k])
+	def test_admits(self):
+		t = TopK(2)
+		self.assertTrue(t.admits(float('-inf')))
+		t.put('a', 5)
+		t.put('b', 3)
+		self.assertFalse(t.admits(3))
+		self.assertTrue(t.admits(4))
+		t.put('c', 3)
+		self.assertEqual(t.items(), ['a', 'b'])
+
+class LRUTest(unittest.TestCase):
+	def test_size(self):
+		c = LRU(2)
+		c.put('a', 1)
+		c.put('b', 2)
+		self.assertEqual(c.get('a'), 1)
+		c.put('c', 3)
+		self.assertEqual(c.get('b'), None)
+		self.assertEqual((c.get('a'), c.get('c')), (1, 3))
+		self.assertEqual(c.stats()['evictions'], 1)
+	def test_bytes(self):
+		c = LRU(10, maxbytes=100)
+		c.put('a', 1, 60)
+		c.put('b', 2, 60)
+		self.assertEqual((c.get('a'), c.get('b')), (None, 2))
+		c.put('c', 3, 101)
+		self.assertEqual((c.get('b'), c.get('c')), (2, None))
+		self.assertEqual(c.bytes, 60)
+	def test_ttl(self):
+		c = LRU(10, ttl=5)
+		now = [0]
+		c.clock = lambda: now[0]
+		c.put('a', 1)
+		now[0] = 5
+		self.assertEqual(c.get('a'), 1)
+		now[0] = 6
+		self.assertEqual(c.get('a'), None)
+		st = c.stats()
+		self.assertEqual((st['hits'], st['misses'], st['expired'], st['entries']), (1, 1, 1, 0))
+
+class SQLiteCacheTest(unittest.TestCase):
+	def setUp(self):
+		import tempfile
+		self.dir = tempfile.mkdtemp()
+		self.path = os.path.join(self.dir, 'cache')
+	def tearDown(self):
+		import shutil
+		shutil.rmtree(self.dir)
+	@unittest.skipIf(sqlite3 is None, 'no sqlite3')
+	def test_shared(self):
+		a = SQLiteCache(self.path, 'db1')
+		b = SQLiteCache(self.path, 'db1')
+		a.put((u'peace', u'of', 1), [[u'piece', 0]])
+		self.assertEqual(b.get((u'peace', u'of', 1)), [[u'piece', 0]])
+		self.assertEqual(b.get((u'peace', u'of', 2)), None)
+		self.assertEqual((b.hits, b.misses), (1, 1))
+	@unittest.skipIf(sqlite3 is None, 'no sqlite3')
+	def test_not_json(self):
+		import pickle
+		c = SQLiteCache(self.path, 'db1')
+		c.conn().execute('INSERT INTO cache VALUES (?, ?, ?, ?)',
+			('db1', json.dumps(['x']), sqlite3.Binary(pickle.dumps(1, 2)), c.clock()))
+		self.assertEqual(c.get(['x']), None)
+		self.assertEqual((c.misses, c.errors), (1, 1))
+	@unittest.skipIf(sqlite3 is None, 'no sqlite3')
+	def test_fingerprint(self):
+		SQLiteCache(self.path, 'db1').put(['x'], 1)
+		self.assertEqual(SQLiteCache(self.path, 'db2').get(['x']), None)
+		self.assertEqual(SQLiteCache(self.path, 'db1').get(['x']), None)
+	@unittest.skipIf(sqlite3 is None, 'no sqlite3')
+	def test_ttl_trim(self):
+		c = SQLiteCache(self.path, 'db1', maxsize=2, ttl=5)
+		c.TrimEvery = 3
+		now = [0]
+		c.clock = lambda: now[0]
+		for i in range(3):
+			now[0] = i
+			c.put([i], i)
+		self.assertEqual([c.get([i]) for i in range(3)], [None, 1, 2])
+		now[0] = 7
+		self.assertEqual([c.get([i]) for i in range(3)], [None, None, 2])
+
+if __name__ == '__main__':
+	unittest.main()
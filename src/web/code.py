@@ -10,6 +10,8 @@ setup:
 	* ensure webserver user has
 		* read access to ngram3.bin and word.bin files
 		* write access to session/ directory
+	* optionally, mkdir cache/, writable by the webserver user alone, for the workers
+	  to share spill-chick.suggest, the suggestions they've worked out so far
 """
 
 def abspath(localpath):
@@ -37,6 +39,8 @@ session = web.session.Session(app, web.session.DiskStore(abspath('session')),
 		initializer={'target':None, 'skip':[], 'replacements':[], 'suggestions':[]})
 render = web.template.render(abspath('templates/'), base='base', globals=globals(), cache=False)
 application = app.wsgifunc()
+if os.path.isdir(abspath('cache')):
+	Chick.SuggestStorePath = abspath('cache/spill-chick.suggest')
 chick = Chick()
 
 class check:
@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import collections
+import unittest
 
 Alphabet = 'abcdefghijklmnopqrstuvwxyz'
 
@@ -13,19 +14,49 @@ def edits1(word):
 	inserts    = [a + c + b     for a, b in splits for c in Alphabet]
 	return set(deletes + transposes + replaces + inserts)
 
+def unedits1(word, chars):
+	"""
+	every string s of chars for which edits1(s) includes word; the inverse of edits1
+	"""
+	splits   = [(word[:i], word[i:]) for i in range(len(word) + 1)]
+	inserted = [a + b[1:] for a, b in splits if b and b[0] in Alphabet]
+	swapped  = [a + b[1] + b[0] + b[2:] for a, b in splits if len(b)>1]
+	replaced = [a + c + b[1:] for a, b in splits for c in chars if b and b[0] in Alphabet]
+	deleted  = [a + c + b     for a, b in splits for c in chars]
+	return set(inserted + swapped + replaced + deleted)
+
+def within_edits2(word, candidates):
+	"""
+	the candidates that are in edits1() of something in edits1(word), without
+	generating all of those. everything in edits1(word) is made of word's letters
+	and Alphabet, so those are all it takes to undo a candidate's last edit
+	"""
+	e1 = edits1(word)
+	chars = set(Alphabet) | set(word)
+	return set(w for w in candidates if not e1.isdisjoint(unedits1(w, chars)))
+
 """
 imitate the interface of a Counter() that Words is expecting
 so we can use ngram3bin without him knowing
 """
 class NGram3BinWordCounter:
-	def __init__(self, ng):
+	def __init__(self, ng, g=None):
 		self.ng = ng
+		# word frequencies through g, a GramsCache say, if given
+		self.wordfreq = g.freqs if g else ng.wordfreq
 	def __contains__(self, word):
 		# foo in me
 		return self.ng.word2id(word) != 0
+	def candidates(self, word, d):
+		# words that may be within d edits of word, from word.bin.trie or else
+		# word.bin.deletes; None without either
+		w = self.ng.within(word, d)
+		if w is None:
+			return self.ng.deletes(word, d)
+		return [x for x, _ in w]
 	def get(self, word, default=0):
 		try:
-			return self.ng.wordfreq(word)
+			return self.wordfreq(word)
 		except (ValueError, TypeError):
 			raise KeyError
 	def __getitem__(self, word):
@@ -33,7 +64,7 @@ class NGram3BinWordCounter:
 		if type(word) == int:
 			raise IndexError
 		try:
-			return self.ng.wordfreq(word)
+			return self.wordfreq(word)
 		except:
 			raise KeyError
 	def __setitem__(self, word, val):
@@ -59,8 +90,26 @@ class Words:
 	def freq(self, word):
 		return self.frq[word]
 
+	def candidates(self, word, d):
+		"""
+		a superset of the words in frq within d edits of word, from frq's trie or
+		deletion index, or None if it hasn't one
+		"""
+		candidates = getattr(self.frq, 'candidates', None)
+		return candidates(word, d) if candidates else None
+
+	def known_edits1(self, word):
+		c = self.candidates(word, 1)
+		if c is None:
+			return self.known(edits1(word))
+		e = edits1(word)
+		return set(w for w in c if w in e)
+
 	def known_edits2(self, word):
-		return set(e2 for e1 in edits1(word) for e2 in edits1(e1) if e2 in self.frq)
+		c = self.candidates(word, 2)
+		if c is None:
+			return set(e2 for e1 in edits1(word) for e2 in edits1(e1) if e2 in self.frq)
+		return within_edits2(word, c)
 
 	def known(self, words): return set(w for w in words if w in self.frq)
 
@@ -72,13 +121,14 @@ class Words:
 	# FIXME: douce -> douse
 	# FIXME: iv -> ivy
 	def correct(self, word):
-		candidates = self.known([word]) | self.known(edits1(word)) or self.known_edits2(word) or [word]
-		return max(candidates, key=self.frq.get)
+		candidates = self.known([word]) | self.known_edits1(word) or self.known_edits2(word) or [word]
+		# sorted, so that ties go the same way however candidates was built
+		return max(sorted(candidates), key=self.frq.get)
 
 	# FIXME: bid -> big
 	# FIXME: hungreh -> hungry
 	def similar(self, word):
-		e = self.known(edits1(word))
+		e = self.known_edits1(word)
 		# FIXME: this is just the trickiest line in the whole thing.
 		# flexibility at an expensive price...
 		if len(word) > 6:
@@ -90,6 +140,41 @@ class Words:
 		"sorted list of ('letter',frequency) for all letters in word"
 		return [(c,len(list(l))) for c,l in groupby(sorted(word))]
 
+class WordsTest(unittest.TestCase):
+	class Index(collections.Counter):
+		"""
+		Counter with a deletion index that finds everything the right length
+		"""
+		def candidates(self, word, d):
+			return [w for w in self if abs(len(w) - len(word)) <= d]
+
+	Vocab = ('a at ate tea eat the then than that this there their these thin tin ten '
+		 'ant nat ton nation notation rotation station stations statin statins '
+		 'pacified passified specified naive native naiver refrigerator refrigerate '
+		 'douse dose douce ivy iv big bid hungry hungrily accommodate acommodate '
+		 "don't dont Don DON don cafe").split()
+
+	Words = ('a', 'at', 'teh', 'hte', 'thier', 'tehre', 'natoin', 'staiton', 'stattions',
+		 'passified', 'naieve', 'refridgerator', 'douce', 'iv', 'bid', 'hungreh', 'xyzzy',
+		 "don'", "dn't", 'DOn', 'Dno', 'caf')
+
+	def setUp(self):
+		freq = dict((w, i + 1) for i, w in enumerate(self.Vocab))
+		self.plain = Words(collections.Counter(freq))
+		self.indexed = Words(WordsTest.Index(freq))
+
+	def test_similar(self):
+		for w in self.Words:
+			self.assertEqual(self.plain.similar(w), self.indexed.similar(w), w)
+
+	def test_correct(self):
+		for w in self.Words:
+			self.assertEqual(self.plain.correct(w), self.indexed.correct(w), w)
+
+	def test_edits2(self):
+		for w in self.Words:
+			self.assertEqual(self.plain.known_edits2(w), self.indexed.known_edits2(w), w)
+
 if __name__ == '__main__':
-	pass
+	unittest.main()
 